@@ -0,0 +1,61 @@
+"""
+Benchmark of parsing API responses to API objects.
+
+Compares APIObject.from_dict() with compiled field extractors to resolving
+every field with dpath on every record, the way it was done before.
+
+Usage:
+
+    python -m benchmarks.api_models [--records 20000]
+"""
+import argparse
+import time
+
+import attr
+
+from benchmarks.data import member_dict
+from insights.meetup.api_models import APIGroupMember
+from insights.meetup.api_utils import dpath_get
+
+
+def from_dict_dpath(cls, obj):
+    """
+    Create an API object resolving every field with dpath
+    """
+    ret = {}
+    for field in attr.fields(cls):
+        if not field.init:
+            continue
+        dict_getter = field.metadata.get('dict_getter')
+        if dict_getter is None:
+            dict_getter = dpath_get(f'/{field.name}')
+        ret[field.name] = dict_getter(obj, field)
+    return cls(**ret)
+
+
+def measure(func, records):
+    start = time.perf_counter()
+    result = [func(APIGroupMember, record) for record in records]
+    elapsed = time.perf_counter() - start
+    return result, len(records) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    records = [member_dict(i) for i in range(args.records)]
+    from_dict = APIGroupMember.from_dict.__func__
+
+    dpath_result, dpath_rate = measure(from_dict_dpath, records)
+    compiled_result, compiled_rate = measure(from_dict, records)
+    assert dpath_result == compiled_result
+
+    print(f'dpath:    {dpath_rate:10.0f} records/sec')
+    print(f'compiled: {compiled_rate:10.0f} records/sec')
+    print(f'speedup:  {compiled_rate / dpath_rate:10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare results of benchmarks.ingest, measured on two commits.
+
+For every benchmark and size, the latest result of each commit is taken.
+Changes of the rate by more than --threshold percent are reported as
+improvements or regressions, and the command exits with the status 1 if
+there are regressions.
+
+Usage:
+
+    python -m benchmarks.compare BASE [HEAD] [--threshold 10]
+        [--results benchmarks/results.jsonl]
+
+BASE and HEAD are commit hashes (or their prefixes). HEAD is the commit of
+the latest result by default.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+Key = Tuple[str, int]
+
+
+def read_results(filename: str) -> List[dict]:
+    with open(filename) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def get_rates(results: List[dict], commit: str) -> Dict[Key, float]:
+    """
+    Return the latest rate of every benchmark and size for the commit
+    """
+    rates = OrderedDict()
+    for result in results:
+        if (result['commit'] or '').startswith(commit):
+            rates[(result['benchmark'], result['size'])] = result['rate']
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('base')
+    parser.add_argument('head', nargs='?')
+    parser.add_argument('--threshold', type=float, default=10)
+    parser.add_argument('--results', default=DEFAULT_RESULTS)
+    args = parser.parse_args()
+
+    results = read_results(args.results)
+    head = args.head or results[-1]['commit']
+    base_rates = get_rates(results, args.base)
+    head_rates = get_rates(results, head)
+    if not base_rates or not head_rates:
+        sys.exit(f'No results for {args.base if not base_rates else head}')
+
+    regressions = 0
+    print(f'{"benchmark":45} {"size":>8} {"base":>10} {"head":>10} change')
+    for key, head_rate in head_rates.items():
+        base_rate = base_rates.get(key)
+        if not base_rate:
+            continue
+        change = (head_rate / base_rate - 1) * 100
+        if change < -args.threshold:
+            verdict = 'regression'
+            regressions += 1
+        elif change > args.threshold:
+            verdict = 'improvement'
+        else:
+            verdict = ''
+        name, size = key
+        print(f'{name:45} {size:>8} {base_rate:10.0f} {head_rate:10.0f} '
+              f'{change:+6.1f}% {verdict}'.rstrip())
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic records, as returned by meetup.com API
+"""
+import random
+from typing import Callable, Iterator, List
+
+# Number of records per page of the API response
+PAGE_SIZE = 2000
+
+
+def member_dict(member_id: int,
+                group_id: int = 1,
+                urlname: str = 'pyporto',
+                rng: random.Random = random) -> dict:
+    """
+    Return a synthetic record, as returned by /:urlname/members endpoint.
+    Random values are taken from rng
+    """
+    ts = 1500000000000 + member_id * 1000
+    return {
+        'id': member_id,
+        'name': f'Member {member_id}',
+        'status': 'active',
+        'joined': ts,
+        'city': 'Porto',
+        'country': 'pt',
+        'lat': 41.15 + rng.random(),
+        'lon': -8.61 + rng.random(),
+        'is_pro_admin': False,
+        'messaging_pref': 'all_members',
+        'privacy': {
+            'bio': 'visible',
+            'groups': 'visible',
+            'topics': 'visible'
+        },
+        'group_profile': {
+            'status': 'active',
+            'visited': ts + 1000,
+            'created': ts,
+            'updated': ts + 2000,
+            'role': rng.choice([None, 'organizer']),
+            'group': {
+                'id': group_id,
+                'urlname': urlname
+            },
+            'link': f'https://www.meetup.com/{urlname}/members/{member_id}/',
+        },
+    }
+
+
+def group_dict(group_id: int, rng: random.Random = random) -> dict:
+    """
+    Return a synthetic record, as returned by /find/groups endpoint.
+    Random values are taken from rng
+    """
+    ts = 1500000000000 + group_id * 1000
+    return {
+        'id': group_id,
+        'name': f'Group {group_id}',
+        'status': 'active',
+        'urlname': f'group-{group_id}',
+        'description': f'<p>Description of the group {group_id}</p>',
+        'created': ts,
+        'city': 'Porto',
+        'untranslated_city': 'Porto',
+        'country': 'PT',
+        'state': '',
+        'join_mode': 'open',
+        'visibility': 'public',
+        'lat': 41.15 + rng.random(),
+        'lon': -8.61 + rng.random(),
+        'members': rng.randint(1, 10000),
+        'who': 'Members',
+        'organizer': {
+            'id': group_id + 1000000,
+            'name': f'Organizer {group_id}',
+        },
+        'timezone': 'Europe/Lisbon',
+        'next_event': {
+            'id': str(group_id),
+            'name': f'Meetup {group_id}',
+            'yes_rsvp_count': rng.randint(0, 100),
+            'time': ts + 3600000,
+        },
+        'category': {
+            'id': 34,
+            'shortname': 'tech',
+        },
+        'meta_category': {
+            'id': 292,
+            'shortname': 'tech',
+        },
+    }
+
+
+def pages(factory: Callable[[int, random.Random], dict],
+          count: int,
+          page_size: int = PAGE_SIZE,
+          start: int = 1) -> Iterator[List[dict]]:
+    """
+    Return an iterator over pages of count synthetic records, created with
+    factory(id, rng). Records are generated page by page, and are the same
+    for the same arguments: rng is seeded with start, and is not shared
+    with the global random module
+    """
+    rng = random.Random(start)
+    for page_start in range(start, start + count, page_size):
+        page_end = min(page_start + page_size, start + count)
+        yield [factory(i, rng) for i in range(page_start, page_end)]
@@ -0,0 +1,199 @@
+"""
+End-to-end load test of the sync against the local stand-in of the API.
+
+Starts benchmarks.fake_api in a background thread (or uses the running
+one with --url), points the API client to it, and runs sync_categories,
+sync_groups and sync_group_members with Celery tasks executed eagerly in
+this process. Reports records per second and API calls per group.
+
+The sync writes to the database of DATABASE_URL (use a scratch database),
+and to local Parquet files in a temporary directory. Synthetic records have
+ids from benchmarks.fake_api.FIRST_ID on, and are deleted in the end,
+unless --keep is set. API credentials are restored as well.
+
+Redis (CELERY_BROKER_URL) has to be running: it keeps the access token,
+rate limits and the load buffer.
+
+Usage:
+
+    python -m benchmarks.end_to_end [--groups 100] [--latency 0.05]
+        [--error-rate 0.01] [--rate-limit 30] [--requests-per-second 0]
+"""
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+import django
+import requests
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insights.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from benchmarks.fake_api import (FIRST_ID, add_config_arguments,  # noqa: E402
+                                 get_config, start_server)
+from insights.analytics import get_sink  # noqa: E402
+from insights.celery import app  # noqa: E402
+from insights.meetup import api_client, tasks  # noqa: E402
+from insights.meetup.models import (API_CREDENTIALS_DATABASE_ID,  # noqa: E402
+                                    APICredentials, MeetupCategory,
+                                    MeetupGroup, MeetupGroupFilter,
+                                    MeetupGroupMember, MeetupLocation,
+                                    MeetupUser, token_cache)
+
+LOCATION = ('zz', 'Fakeville')
+
+
+def configure(api_url: str, analytics_path: str,
+              requests_per_second: Optional[float]):
+    """
+    Point the client to the fake API, and run tasks in this process
+    """
+    settings.MEETUP_API_URL = api_url
+    settings.MEETUP_OAUTH_URL = api_url
+    settings.ANALYTICS_SINK = 'insights.analytics.LocalParquetSink'
+    settings.ANALYTICS_LOCAL_PATH = analytics_path
+    get_sink.cache_clear()
+    app.conf.task_always_eager = True
+    if requests_per_second is not None:
+        api_client.rate_limiter.rate = requests_per_second
+
+
+def create_credentials():
+    """
+    Create expired credentials, so that the token is refreshed by the fake
+    API, and return the original credentials to restore them later
+    """
+    original = APICredentials.objects.filter(
+        id=API_CREDENTIALS_DATABASE_ID).first()
+    APICredentials.objects.update_or_create(
+        id=API_CREDENTIALS_DATABASE_ID,
+        defaults=dict(
+            access_token='expired',
+            refresh_token='refresh',
+            expires_at=timezone.now() - datetime.timedelta(hours=1)))
+    token_cache.clear()
+    return original
+
+
+def create_filters():
+    """
+    Create a group filter for every synthetic category
+    """
+    location = MeetupLocation.objects.get_or_create(
+        country=LOCATION[0], location=LOCATION[1])[0]
+    for category in MeetupCategory.objects.filter(id__gte=FIRST_ID):
+        MeetupGroupFilter.objects.get_or_create(
+            category=category, location=location)
+
+
+def cleanup(original_credentials: Optional[APICredentials]):
+    MeetupGroupMember.objects.filter(group_id__gte=FIRST_ID).delete()
+    MeetupGroup.objects.filter(id__gte=FIRST_ID).delete()
+    MeetupUser.objects.filter(id__gte=FIRST_ID).delete()
+    MeetupGroupFilter.objects.filter(category_id__gte=FIRST_ID).delete()
+    MeetupCategory.objects.filter(id__gte=FIRST_ID).delete()
+    MeetupLocation.objects.filter(
+        country=LOCATION[0], location=LOCATION[1]).delete()
+    APICredentials.objects.filter(id=API_CREDENTIALS_DATABASE_ID).delete()
+    if original_credentials is not None:
+        original_credentials.save()
+    token_cache.clear()
+
+
+def get_stats(api_url: str) -> dict:
+    return requests.get(f'{api_url}/_stats').json()
+
+
+def count_requests(before: dict, after: dict, endpoint: str,
+                   status: Optional[int] = None) -> int:
+    """
+    Return the number of requests to the endpoint (with the status) made
+    between two snapshots of the API stats
+    """
+    total = 0
+    for key, value in after.items():
+        key_endpoint, key_status = key.rsplit(' ', 1)
+        if key_endpoint != endpoint:
+            continue
+        if status is not None and int(key_status) != status:
+            continue
+        total += value - before.get(key, 0)
+    return total
+
+
+def run_step(name: str, func, api_url: str, endpoint: str, count_records):
+    """
+    Run one step of the sync, and report the time, the number of records,
+    and API requests
+    """
+    before = get_stats(api_url)
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    after = get_stats(api_url)
+
+    records = count_records()
+    calls = count_requests(before, after, endpoint)
+    throttled = count_requests(before, after, endpoint, 429)
+    errors = count_requests(before, after, endpoint, 500)
+    print(f'{name:20} {records:>9} records {elapsed:9.2f} sec '
+          f'{records / elapsed:10.0f} records/sec '
+          f'{calls:>6} API calls ({throttled} throttled, {errors} errors)')
+    return records, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--url', help='URL of the running fake API, started if not set')
+    parser.add_argument(
+        '--requests-per-second',
+        type=float,
+        help='override MEETUP_API_REQUESTS_PER_SECOND (0 disables the limit)')
+    parser.add_argument('--keep', action='store_true')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    api_url = args.url
+    if not api_url:
+        server = start_server(get_config(args))
+        api_url = server.url
+
+    analytics_path = tempfile.mkdtemp(prefix='insights-analytics-')
+    configure(api_url, analytics_path, args.requests_per_second)
+    original_credentials = create_credentials()
+    try:
+        run_step('sync_categories', tasks.sync_categories, api_url,
+                 'categories',
+                 MeetupCategory.objects.filter(id__gte=FIRST_ID).count)
+        create_filters()
+        run_step('sync_groups', tasks.sync_groups, api_url, 'find_groups',
+                 MeetupGroup.objects.filter(id__gte=FIRST_ID).count)
+        groups = MeetupGroup.objects.members_update_required().filter(
+            id__gte=FIRST_ID).count()
+        members, calls = run_step(
+            'sync_group_members', tasks.sync_group_members, api_url,
+            'members',
+            MeetupGroupMember.objects.filter(group_id__gte=FIRST_ID).count)
+        if groups:
+            print(f'{groups} groups synced, '
+                  f'{calls / groups:.2f} API calls per group, '
+                  f'{members / groups:.0f} members per group')
+    finally:
+        if not args.keep:
+            cleanup(original_credentials)
+        shutil.rmtree(analytics_path, ignore_errors=True)
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+Local stand-in for meetup.com API, to run the sync end-to-end without
+touching the real API.
+
+The server mimics the endpoints, used by api_client:
+
+- POST /oauth2/access issues access tokens
+- GET /2/categories returns categories, paginated with meta.next (API v2)
+- GET /find/groups returns groups of requested categories, paginated with
+  the Link header (API v3)
+- GET /:urlname/members returns members of the group, paginated with the
+  Link header (API v3)
+
+Data are synthetic and deterministic: the same page always has the same
+records. Members of different groups overlap, as they are taken from the
+pool of --users users. Responses can be delayed (--latency), fail with 500
+(--error-rate), and are rate limited (--rate-limit requests per
+--rate-limit-window seconds) with X-RateLimit-* headers and 429 responses.
+
+GET /_stats returns the number of requests per endpoint and status.
+
+Usage:
+
+    python -m benchmarks.fake_api [--port 8001] [--groups 100] ...
+
+and then run the project with
+
+    MEETUP_API_URL=http://127.0.0.1:8001
+    MEETUP_OAUTH_URL=http://127.0.0.1:8001
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import attr
+
+from benchmarks.data import group_dict, member_dict
+
+# Synthetic categories, groups and users get ids from this number on
+FIRST_ID = 1000000000
+
+
+@attr.s
+class FakeAPIConfig(object):
+    """
+    Data volume and behavior of the fake API
+    """
+    categories = attr.ib(default=5)
+    groups = attr.ib(default=100)
+    # sizes of groups are distributed log-uniformly between these values
+    min_members = attr.ib(default=10)
+    max_members = attr.ib(default=10000)
+    users = attr.ib(default=1000000)
+    max_page_size = attr.ib(default=2000)
+    # mean delay of every response (in seconds)
+    latency = attr.ib(default=0.0)
+    # fraction of requests which fail with "500 Internal Server Error"
+    error_rate = attr.ib(default=0.0)
+    # number of requests per window, or 0 to disable rate limiting
+    rate_limit = attr.ib(default=0)
+    rate_limit_window = attr.ib(default=10.0)
+    seed = attr.ib(default=0)
+
+
+class FakeAPI(object):
+    """
+    Data and state (rate limits and statistics) of the fake API
+    """
+
+    def __init__(self, config: FakeAPIConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+
+    def category_ids(self) -> List[int]:
+        return [FIRST_ID + i for i in range(self.config.categories)]
+
+    def group_ids(self) -> List[int]:
+        return [FIRST_ID + i for i in range(self.config.groups)]
+
+    def group_members(self, group_id: int) -> int:
+        rng = random.Random(f'{self.config.seed}:{group_id}')
+        low = math.log(max(1, self.config.min_members))
+        high = math.log(max(1, self.config.max_members))
+        return int(math.exp(rng.uniform(low, high)))
+
+    def group_category(self, group_id: int) -> int:
+        category_ids = self.category_ids()
+        return category_ids[group_id % len(category_ids)]
+
+    def category(self, category_id: int) -> dict:
+        return {
+            'id': category_id,
+            'shortname': f'category-{category_id}',
+            'name': f'Category {category_id}',
+        }
+
+    def group(self, group_id: int) -> dict:
+        rng = random.Random(f'{self.config.seed}:group:{group_id}')
+        obj = group_dict(group_id, rng)
+        obj['members'] = self.group_members(group_id)
+        category_id = self.group_category(group_id)
+        obj['category'] = {
+            'id': category_id,
+            'shortname': f'category-{category_id}',
+        }
+        return obj
+
+    def member(self, group_id: int, index: int, rng: random.Random) -> dict:
+        # members of a group are distinct, as long as there are more users
+        # than members, and overlap with members of other groups
+        user_id = FIRST_ID + (group_id * 7919 + index) % self.config.users
+        return member_dict(user_id, group_id, f'group-{group_id}', rng)
+
+    def members_page(self, group_id: int, offset: int,
+                     page_size: int) -> Tuple[List[dict], bool]:
+        """
+        Return members of the page, and True if there are more pages
+        """
+        total = self.group_members(group_id)
+        start = offset * page_size
+        end = min(start + page_size, total)
+        rng = random.Random(f'{self.config.seed}:{group_id}:{offset}')
+        members = [self.member(group_id, i, rng) for i in range(start, end)]
+        return members, end < total
+
+    def take_request(self) -> Tuple[bool, dict]:
+        """
+        Count the request against the rate limit. Return False if the limit
+        is exceeded, and rate limit headers of the response
+        """
+        if not self.config.rate_limit:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.config.rate_limit_window:
+                self.window_start = now
+                self.window_requests = 0
+            self.window_requests += 1
+            remaining = self.config.rate_limit - self.window_requests
+            reset = self.window_start + self.config.rate_limit_window - now
+        headers = {
+            'X-RateLimit-Limit': str(self.config.rate_limit),
+            'X-RateLimit-Remaining': str(max(0, remaining)),
+            'X-RateLimit-Reset': f'{reset:.3f}',
+        }
+        return remaining >= 0, headers
+
+    def count(self, endpoint: str, status: int):
+        with self.lock:
+            self.stats[f'{endpoint} {status}'] += 1
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    # keep connections alive, as the real API does
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def api(self) -> FakeAPI:
+        return self.server.api
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {
+            key: values[-1]
+            for key, values in parse_qs(url.query).items()
+        }
+        path = url.path.rstrip('/')
+        if path == '/_stats':
+            return self.send_json(200, dict(self.api.stats))
+        if path == '/2/categories':
+            return self.serve_api('categories', self.get_categories, params)
+        if path == '/find/groups':
+            return self.serve_api('find_groups', self.get_groups, params)
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[1] == 'members':
+            return self.serve_api('members', self.get_members, params,
+                                  parts[0])
+        self.send_json(404, {'errors': [{'code': 'not_found'}]})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/oauth2/access':
+            return self.send_json(404, {'errors': [{'code': 'not_found'}]})
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.api.count('oauth', 200)
+        self.send_json(
+            200, {
+                'access_token': uuid.uuid4().hex,
+                'refresh_token': uuid.uuid4().hex,
+                'token_type': 'bearer',
+                'expires_in': 3600,
+            })
+
+    def serve_api(self, endpoint, func, params, *args):
+        """
+        Serve the API request with the latency, errors and rate limits
+        """
+        if self.api.config.latency:
+            time.sleep(self.api.config.latency * random.uniform(0.5, 1.5))
+        allowed, headers = self.api.take_request()
+        if not allowed:
+            status, body = 429, {'errors': [{'code': 'throttled'}]}
+            if 'X-RateLimit-Reset' in headers:
+                headers['Retry-After'] = headers['X-RateLimit-Reset']
+        elif random.random() < self.api.config.error_rate:
+            status, body = 500, {'errors': [{'code': 'server_error'}]}
+        else:
+            status, body, link = func(params, *args)
+            if link:
+                headers['Link'] = f'<{link}>; rel="next"'
+        self.api.count(endpoint, status)
+        self.send_json(status, body, headers)
+
+    def get_categories(self, params):
+        page_size, offset = self.get_page(params)
+        category_ids = self.api.category_ids()
+        start = offset * page_size
+        results = [
+            self.api.category(category_id)
+            for category_id in category_ids[start:start + page_size]
+        ]
+        next_url = ''
+        if start + page_size < len(category_ids):
+            next_url = self.get_next_url(params, offset)
+        return 200, {'results': results, 'meta': {'next': next_url}}, None
+
+    def get_groups(self, params):
+        page_size, offset = self.get_page(params)
+        category_ids = None
+        if params.get('category'):
+            category_ids = {int(c) for c in params['category'].split(',')}
+        group_ids = [
+            group_id for group_id in self.api.group_ids()
+            if category_ids is None or
+            self.api.group_category(group_id) in category_ids
+        ]
+        start = offset * page_size
+        groups = [
+            self.api.group(group_id)
+            for group_id in group_ids[start:start + page_size]
+        ]
+        link = None
+        if start + page_size < len(group_ids):
+            link = self.get_next_url(params, offset)
+        return 200, groups, link
+
+    def get_members(self, params, urlname):
+        group_id = self.get_group_id(urlname)
+        if group_id is None:
+            return 404, {'errors': [{'code': 'group_error'}]}, None
+        page_size, offset = self.get_page(params)
+        members, has_next = self.api.members_page(group_id, offset, page_size)
+        link = self.get_next_url(params, offset) if has_next else None
+        return 200, members, link
+
+    def get_group_id(self, urlname) -> Optional[int]:
+        try:
+            group_id = int(urlname.split('-')[-1])
+        except ValueError:
+            return None
+        if not FIRST_ID <= group_id < FIRST_ID + self.api.config.groups:
+            return None
+        return group_id
+
+    def get_page(self, params) -> Tuple[int, int]:
+        page_size = int(params.get('page') or 200)
+        page_size = min(page_size, self.api.config.max_page_size)
+        return page_size, int(params.get('offset') or 0)
+
+    def get_next_url(self, params, offset) -> str:
+        host = self.headers.get('Host') or '{}:{}'.format(
+            *self.server.server_address)
+        path = urlparse(self.path).path
+        query = urlencode(dict(params, offset=offset + 1))
+        return f'http://{host}{path}?{query}'
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeAPIConfig):
+        super().__init__(address, FakeAPIHandler)
+        self.api = FakeAPI(config)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+
+def start_server(config: FakeAPIConfig, host='127.0.0.1',
+                 port=0) -> FakeAPIServer:
+    """
+    Start the server in a background thread, and return it. With port=0,
+    the server listens to a random free port, see server.url
+    """
+    server = FakeAPIServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """
+    Add arguments for every field of FakeAPIConfig to the parser
+    """
+    for field in attr.fields(FakeAPIConfig):
+        parser.add_argument(
+            '--' + field.name.replace('_', '-'),
+            type=type(field.default),
+            default=field.default)
+
+
+def get_config(args: argparse.Namespace) -> FakeAPIConfig:
+    return FakeAPIConfig(**{
+        field.name: getattr(args, field.name)
+        for field in attr.fields(FakeAPIConfig)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeAPIServer((args.host, args.port), get_config(args))
+    print(f'Serving fake meetup.com API on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
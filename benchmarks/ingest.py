@@ -0,0 +1,238 @@
+"""
+Benchmarks of the ingest hot paths: parsing API responses, encoding records
+for the analytics sink, and writing groups and members to the database.
+
+Records are synthetic, and are generated page by page, the way the API
+returns them, so that only one page is kept in memory. Generation of pages
+is not measured.
+
+Database benchmarks run against the database of DATABASE_URL, inside a
+transaction which is rolled back in the end. Only the bulk writes, which
+sync tasks use, are measured.
+
+Every result is appended to the results file (one JSON object per line,
+with the commit it was measured on) to compare commits with
+benchmarks.compare.
+
+Usage:
+
+    python -m benchmarks.ingest [--sizes 1000 100000 1000000]
+        [--only from_dict json_records ...]
+        [--output benchmarks/results.jsonl]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'insights.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from benchmarks.data import group_dict, member_dict, pages  # noqa: E402
+from insights.meetup.api_models import APIGroup, APIGroupMember  # noqa: E402
+from insights.meetup.models import (MeetupGroup,  # noqa: E402
+                                    MeetupGroupMember)
+from insights.utils import JSONRecordsWriter, json_dumps  # noqa: E402
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+# Synthetic groups and members get ids from this number on
+FIRST_ID = 1000000000
+
+# Benchmark yields the name of the measured operation, the number of
+# processed records and the time (in seconds)
+Measurement = Tuple[str, int, float]
+
+
+class Timer(object):
+    """
+    Accumulate the time spent in the with-block over several runs
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.elapsed += time.perf_counter() - self.start
+
+
+def member_pages(size: int, group_id: int = FIRST_ID, start: int = FIRST_ID):
+    return pages(
+        lambda i, rng: member_dict(i, group_id, f'group-{group_id}', rng),
+        size,
+        start=start)
+
+
+def group_pages(size: int, start: int = FIRST_ID):
+    return pages(group_dict, size, start=start)
+
+
+def parse_pages(cls, raw_pages: Iterable[List[dict]]):
+    for page in raw_pages:
+        yield [cls.from_dict(obj) for obj in page]
+
+
+def bench_from_dict(size: int) -> Iterator[Measurement]:
+    for name, cls, raw_pages in [
+        ('APIGroupMember.from_dict', APIGroupMember, member_pages(size)),
+        ('APIGroup.from_dict', APIGroup, group_pages(size)),
+    ]:
+        timer = Timer()
+        for page in raw_pages:
+            with timer:
+                for obj in page:
+                    cls.from_dict(obj)
+        yield name, size, timer.elapsed
+
+
+def bench_json_dumps(size: int) -> Iterator[Measurement]:
+    timer = Timer()
+    for page in parse_pages(APIGroupMember, member_pages(size)):
+        with timer:
+            for obj in page:
+                json_dumps(obj)
+    yield 'json_dumps(APIGroupMember)', size, timer.elapsed
+
+
+def bench_json_records(size: int) -> Iterator[Measurement]:
+    timer = Timer()
+    writer = JSONRecordsWriter()
+    for page in parse_pages(APIGroupMember, member_pages(size)):
+        with timer:
+            writer.write(page)
+    with timer:
+        writer.close().close()
+    yield 'json_records(APIGroupMember)', size, timer.elapsed
+
+
+def bench_groups(size: int) -> Iterator[Measurement]:
+    # the first run inserts new records, the second one updates all of them
+    for name in ['MeetupGroup.bulk_from_api',
+                 'MeetupGroup.bulk_from_api (update)']:
+        timer = Timer()
+        for page in parse_pages(APIGroup, group_pages(size)):
+            with timer:
+                MeetupGroup.bulk_from_api(page)
+        yield name, size, timer.elapsed
+
+
+def bench_members(size: int) -> Iterator[Measurement]:
+    MeetupGroup.bulk_from_api([APIGroup.from_dict(group_dict(FIRST_ID))])
+    group = MeetupGroup.objects.get(id=FIRST_ID)
+
+    # the first run inserts new records, the second one finds all of them
+    # unchanged
+    for name in ['MeetupGroupMember.bulk_from_api',
+                 'MeetupGroupMember.bulk_from_api (unchanged)']:
+        timer = Timer()
+        for page in parse_pages(APIGroupMember,
+                                member_pages(size, group.id)):
+            with timer:
+                MeetupGroupMember.bulk_from_api(group, page)
+        yield name, size, timer.elapsed
+
+
+BENCHMARKS = OrderedDict([
+    ('from_dict', bench_from_dict),
+    ('json_dumps', bench_json_dumps),
+    ('json_records', bench_json_records),
+    ('groups', bench_groups),
+    ('members', bench_members),
+])
+
+# Benchmarks which write to the database
+DB_BENCHMARKS = {'groups', 'members'}
+
+
+def run(benchmark: Callable[[int], Iterator[Measurement]], size: int,
+        db: bool) -> Iterator[Measurement]:
+    """
+    Run the benchmark. Changes of database benchmarks are rolled back
+    """
+    if not db:
+        yield from benchmark(size)
+        return
+    with transaction.atomic():
+        yield from benchmark(size)
+        transaction.set_rollback(True)
+
+
+def get_environment() -> dict:
+    """
+    Return the commit and the environment the benchmarks are run in
+    """
+
+    def git(*args):
+        try:
+            return subprocess.check_output(
+                ['git'] + list(args),
+                cwd=os.path.dirname(__file__),
+                stderr=subprocess.DEVNULL).decode('utf-8').strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW server_version')
+        postgres = cursor.fetchone()[0]
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'date': datetime.datetime.utcnow().strftime('%FT%TZ'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'postgres': postgres,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument(
+        '--only',
+        nargs='+',
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS))
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    environment = get_environment()
+    print(f"commit {environment['commit']}"
+          f"{' (dirty)' if environment['dirty'] else ''}", file=sys.stderr)
+
+    with open(args.output, 'a') as output:
+        for size in args.sizes:
+            for key in args.only:
+                results = run(
+                    BENCHMARKS[key], size, db=key in DB_BENCHMARKS)
+                for name, records, seconds in results:
+                    rate = records / seconds if seconds else 0
+                    print(f'{name:45} {size:>8} {rate:12.0f} records/sec')
+                    result = dict(
+                        environment,
+                        benchmark=name,
+                        size=size,
+                        records=records,
+                        seconds=round(seconds, 6),
+                        rate=round(rate, 1))
+                    output.write(json.dumps(result, sort_keys=True) + '\n')
+                    output.flush()
+
+
+if __name__ == '__main__':
+    main()
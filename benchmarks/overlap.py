@@ -0,0 +1,182 @@
+"""
+Benchmarks of the member overlap engine (insights.meetup.overlap).
+
+Memberships are synthetic: every user is a member of one or more groups
+(1 + geometric distribution), and popular groups get more members (Zipf
+distribution). Counting overlaps of all pairs of groups and of a few
+changed groups is measured on in-memory arrays.
+
+With --db, memberships are also written to the database of DATABASE_URL,
+inside a transaction which is rolled back in the end, and the refresh of
+stored overlaps is measured, including loading memberships and writing
+pairs.
+
+Results are appended to the results file, the same way benchmarks.ingest
+does it, with the number of users as the size.
+
+Usage:
+
+    python -m benchmarks.overlap [--groups 1000] [--users 500000]
+        [--changed 10] [--db] [--output benchmarks/results.jsonl]
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from typing import Iterator, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+
+# benchmarks.ingest sets Django up, so it's imported before models
+from benchmarks.ingest import DEFAULT_OUTPUT, FIRST_ID, get_environment
+from insights.meetup.models import (MeetupGroup, MeetupGroupMember,
+                                    MeetupUser)
+from insights.meetup.overlap import (add_jaccard, count_overlaps,
+                                     refresh_overlaps)
+
+# Benchmark yields the name of the measured operation, the number of
+# processed memberships and the time (in seconds)
+Measurement = Tuple[str, int, float]
+
+
+def memberships(groups: int, users: int,
+                seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return arrays of user and group ids of synthetic memberships
+    """
+    rng = np.random.RandomState(seed)
+    degrees = np.minimum(rng.geometric(0.5, size=users), 50)
+    weights = 1 / np.arange(1, groups + 1)**0.8
+    user_ids = np.repeat(np.arange(users, dtype=np.int64), degrees) + FIRST_ID
+    group_ids = rng.choice(
+        groups, size=len(user_ids), p=weights / weights.sum()) + FIRST_ID
+    return user_ids, group_ids.astype(np.int64)
+
+
+def bench_engine(users: np.ndarray, groups: np.ndarray,
+                 changed: np.ndarray) -> Iterator[Measurement]:
+    start = time.perf_counter()
+    overlaps = count_overlaps(users, groups)
+    ids, index = np.unique(groups, return_inverse=True)
+    add_jaccard(overlaps, ids, np.bincount(index))
+    elapsed = time.perf_counter() - start
+    print(f'{len(overlaps)} pairs of groups', file=sys.stderr)
+    yield 'count_overlaps (all groups)', len(users), elapsed
+
+    # memberships of members of changed groups, as load_memberships()
+    # returns them
+    subset = np.isin(users, users[np.isin(groups, changed)])
+    start = time.perf_counter()
+    count_overlaps(users[subset], groups[subset], only_groups=changed)
+    elapsed = time.perf_counter() - start
+    yield (f'count_overlaps ({len(changed)} groups)', int(subset.sum()),
+           elapsed)
+
+
+def bench_db(users: np.ndarray, groups: np.ndarray,
+             changed: np.ndarray) -> Iterator[Measurement]:
+    write_memberships(users, groups)
+
+    start = time.perf_counter()
+    refresh_overlaps()
+    yield 'refresh_overlaps (all groups)', len(users), (time.perf_counter() -
+                                                       start)
+
+    start = time.perf_counter()
+    refresh_overlaps(changed.tolist())
+    subset = np.isin(users, users[np.isin(groups, changed)]).sum()
+    yield (f'refresh_overlaps ({len(changed)} groups)', int(subset),
+           time.perf_counter() - start)
+
+
+def write_memberships(users: np.ndarray, groups: np.ndarray):
+    """
+    Write synthetic groups, users and memberships with bulk statements
+    """
+    group_table = MeetupGroup._meta.db_table
+    user_table = MeetupUser._meta.db_table
+    member_table = MeetupGroupMember._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {group_table} (
+                id, name, status, urlname, description, created, city,
+                untranslated_city, country, state, join_mode, visibility,
+                lat, lon, members, who, organizer_id, organizer_name,
+                timezone, category_id, category_shortname, meta_category_id,
+                meta_category_shortname, members_next_update, members_synced,
+                members_update_interval, overlaps_stale)
+            SELECT id, 'Group', 'active', 'group-' || id, '', now(), '', '',
+                   'pt', '', 'open', 'public', 0, 0, 0, '', 0, '', 'UTC', 0,
+                   '', 0, '', now(), 0, 1, true
+            FROM unnest(%s::bigint[]) AS id
+            ''', [np.unique(groups).tolist()])
+        cursor.execute(
+            f'''
+            INSERT INTO {user_table} (
+                id, name, status, joined, city, country, lat, lon,
+                is_pro_admin, messaging_pref, privacy_bio, privacy_groups,
+                privacy_topics, content_hash)
+            SELECT id, 'Member', 'active', now(), '', 'pt', 0, 0, false,
+                   '', '', '', '', ''
+            FROM generate_series(%s::bigint, %s::bigint) AS id
+            ''', [int(users.min()), int(users.max())])
+
+        buf = io.StringIO()
+        for user_id, group_id in set(zip(users.tolist(), groups.tolist())):
+            buf.write(f'{user_id}\t{group_id}\tactive\t2020-01-01\t'
+                      f'2020-01-01\t2020-01-01\t\n')
+        buf.seek(0)
+        cursor.copy_expert(
+            f'COPY {member_table} (user_id, group_id, status, visited, '
+            f'created, updated, content_hash) FROM STDIN', buf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--groups', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=500000)
+    parser.add_argument(
+        '--changed',
+        type=int,
+        default=10,
+        help='number of changed groups to refresh incrementally')
+    parser.add_argument('--db', action='store_true')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    environment = get_environment()
+    print(f"commit {environment['commit']}"
+          f"{' (dirty)' if environment['dirty'] else ''}", file=sys.stderr)
+
+    users, groups = memberships(args.groups, args.users)
+    changed = np.random.RandomState(1).choice(
+        np.unique(groups), size=args.changed, replace=False)
+    print(f'{args.groups} groups, {args.users} users, {len(users)} '
+          f'memberships', file=sys.stderr)
+
+    results = list(bench_engine(users, groups, changed))
+    if args.db:
+        with transaction.atomic():
+            results.extend(bench_db(users, groups, changed))
+            transaction.set_rollback(True)
+
+    with open(args.output, 'a') as output:
+        for name, records, seconds in results:
+            rate = records / seconds if seconds else 0
+            print(f'{name:45} {args.users:>8} {seconds:8.2f} sec '
+                  f'{rate:12.0f} memberships/sec')
+            result = dict(
+                environment,
+                benchmark=f'overlap.{name}',
+                size=args.users,
+                records=records,
+                seconds=round(seconds, 6),
+                rate=round(rate, 1))
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
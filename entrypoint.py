@@ -29,6 +29,7 @@ def sleep():
 
 def web():
     run("./manage.py", "migrate", "--noinput")
+    run("./manage.py", "setup_analytics")
     run("./manage.py", "create_admin")
     run("./manage.py", "collectstatic", "--noinput")
     run("./manage.py", "diffsettings")
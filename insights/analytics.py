@@ -0,0 +1,473 @@
+"""
+Analytics sinks, where daily snapshots of groups and members are stored.
+
+Sync tasks write snapshots as gzip-compressed newline-delimited JSON records
+(see JSONRecordsWriter) and load them to the sink, returned by get_sink().
+The sink class is set with the ANALYTICS_SINK setting.
+
+Records, produced by many tasks, can be collected in a LoadBuffer and
+loaded in batches, to make fewer load jobs.
+"""
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import uuid
+from collections import defaultdict
+from functools import lru_cache
+from io import BytesIO, RawIOBase
+from typing import BinaryIO, List, Optional, Tuple
+
+import attr
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from insights.utils import JSONRecordsWriter, ObjectList, json_records
+
+try:
+    import pyarrow.json
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+@attr.s(frozen=True)
+class TableLayout(object):
+    """
+    Partitioning and clustering fields of the table, and the import path of
+    the attrs class of its records, which types of fields make the schema
+    """
+    partition_field = attr.ib()
+    cluster_field = attr.ib()
+    record_class = attr.ib(default=None)
+
+    def get_fields(self) -> List[Tuple[str, Optional[type]]]:
+        """
+        Return names and types of fields of records, or an empty list if
+        the record class is not set. Fields without a type are strings
+        """
+        if self.record_class is None:
+            return []
+        return [(field.name, field.type)
+                for field in attr.fields(import_string(self.record_class))]
+
+
+# Layout of tables, as they are created in BigQuery by 0002_bigquery and
+# BigQuerySink.setup()
+TABLES = {
+    'groups': TableLayout(
+        'date', 'urlname', 'insights.meetup.api_models.APIGroup'),
+    'members': TableLayout(
+        'date', 'group_urlname', 'insights.meetup.api_models.APIGroupMember'),
+}
+
+
+# Types of fields of records in BigQuery and Arrow, other fields are strings
+BIGQUERY_TYPES = {
+    int: 'INT64',
+    float: 'FLOAT64',
+    bool: 'BOOL',
+    datetime.datetime: 'TIMESTAMP',
+    datetime.date: 'DATE',
+}
+ARROW_TYPES = {
+    int: 'int64',
+    float: 'float64',
+    bool: 'bool_',
+}
+
+
+class DuplicateLoad(Exception):
+    """
+    Raised if the load with the same job_id has already been made
+    """
+
+
+class AnalyticsSink(object):
+    """
+    Base class of analytics sinks
+    """
+
+    def load(self,
+             object_list: ObjectList,
+             table_id: str,
+             job_id: Optional[str] = None,
+             async: bool = True):
+        """
+        Load the list of objects to the table.
+
+        job_id can be set explicitly to exclude processing duplicates: if
+        the load with the same job_id has already been made, DuplicateLoad
+        is raised.
+
+        If async is set to True, the sink is allowed to return before the
+        data are stored.
+        """
+        records_fd = json_records(object_list)
+        self.load_file(records_fd, table_id, job_id=job_id, async=async)
+
+    def load_file(self,
+                  records_fd: BinaryIO,
+                  table_id: str,
+                  job_id: Optional[str] = None,
+                  async: bool = True):
+        """
+        Same as load(), but load records from the file object, prepared with
+        json_records() or JSONRecordsWriter
+        """
+        raise NotImplementedError()
+
+    def setup(self):
+        """
+        Create tables of TABLES, which don't exist yet
+        """
+
+
+class BigQuerySink(AnalyticsSink):
+    """
+    Sink which loads records to tables of the BigQuery dataset
+    (settings.BIGQUERY_DATASET_ID by default)
+    """
+
+    def __init__(self, dataset_id: Optional[str] = None):
+        self.dataset_id = dataset_id or settings.BIGQUERY_DATASET_ID
+        self._client = None
+
+    @property
+    def client(self):
+        # the client is created on first use, so that credentials are only
+        # required when BigQuery is actually used
+        if self._client is None:
+            from google.cloud import bigquery
+            self._client = bigquery.Client()
+        return self._client
+
+    def load_file(self,
+                  records_fd: BinaryIO,
+                  table_id: str,
+                  job_id: Optional[str] = None,
+                  async: bool = True):
+        from google.cloud import bigquery
+        from google.cloud.exceptions import Conflict
+
+        # Create job config
+        job_config = bigquery.LoadJobConfig()
+        job_config.source_format = (
+            bigquery.SourceFormat.NEWLINE_DELIMITED_JSON)
+        job_config.autodetect = True
+        job_config.create_disposition = (
+            bigquery.CreateDisposition.CREATE_IF_NEEDED)
+        job_config.schema_update_options = [
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
+            bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION
+        ]
+        job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+
+        # Run the query
+        dataset_ref = self.client.dataset(self.dataset_id)
+        table_ref = dataset_ref.table(table_id)
+        try:
+            job = self.client.load_table_from_file(
+                records_fd, table_ref, job_id=job_id, job_config=job_config)
+        except Conflict as e:
+            raise DuplicateLoad(str(e))
+
+        if not async:
+            job.result()
+
+    def setup(self):
+        """
+        Create tables, partitioned and clustered by their layout, with
+        fields of records which are not strings (strings are added by
+        loads automatically). Existing tables are kept intact
+        """
+        from google.cloud import bigquery
+        from google.cloud.exceptions import Conflict
+
+        dataset_ref = self.client.dataset(self.dataset_id)
+        for table_id, layout in TABLES.items():
+            schema = [
+                bigquery.SchemaField(
+                    layout.partition_field, 'DATE', mode='REQUIRED'),
+                bigquery.SchemaField(
+                    layout.cluster_field, 'STRING', mode='REQUIRED'),
+            ]
+            for name, type_ in layout.get_fields():
+                if type_ in BIGQUERY_TYPES and name not in (
+                        layout.partition_field, layout.cluster_field):
+                    schema.append(
+                        bigquery.SchemaField(name, BIGQUERY_TYPES[type_]))
+            table = bigquery.Table(dataset_ref.table(table_id), schema=schema)
+            table.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY,
+                field=layout.partition_field)
+            table.clustering_fields = [layout.cluster_field]
+            try:
+                self.client.create_table(table)
+            except Conflict:
+                pass
+
+
+class LocalParquetSink(AnalyticsSink):
+    """
+    Sink which writes records to local Parquet files
+    (settings.ANALYTICS_LOCAL_PATH by default).
+
+    Files follow the layout of BigQuery tables: every table is a directory,
+    partitioned by date (one subdirectory per day, named "date=YYYY-MM-DD"),
+    and rows within every file are sorted by the clustering field, e.g.
+
+        members/date=2019-08-01/<job_id>.parquet
+
+    The directory can be read as a dataset with pyarrow, pandas or any
+    other tool which understands Hive-style partitioning.
+
+    Files are written synchronously, regardless of async.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if pyarrow is None:
+            raise ImproperlyConfigured(
+                'pyarrow is required to write analytics to Parquet files')
+        self.path = path or settings.ANALYTICS_LOCAL_PATH
+
+    def load_file(self,
+                  records_fd: BinaryIO,
+                  table_id: str,
+                  job_id: Optional[str] = None,
+                  async: bool = True):
+        layout = TABLES.get(table_id, TableLayout('date', None))
+        job_id = job_id or uuid.uuid4().hex
+
+        # split records by partitions, keeping them encoded
+        partitions = defaultdict(list)
+        with gzip.GzipFile(fileobj=records_fd, mode='rb') as fd:
+            for line in fd:
+                record = json.loads(line)
+                cluster_key = record.get(layout.cluster_field) or ''
+                partition = record[layout.partition_field]
+                partitions[partition].append((cluster_key, line))
+
+        filenames = {
+            partition: self.get_filename(table_id, layout, partition, job_id)
+            for partition in partitions
+        }
+        for filename in filenames.values():
+            if os.path.exists(filename):
+                raise DuplicateLoad(f'{filename} already exists')
+
+        # types of fields are set explicitly, so that they don't depend on
+        # values of the batch (e.g., a field which is null in all records)
+        schema, timestamps = get_arrow_schema(layout)
+        for partition, lines in partitions.items():
+            lines.sort(key=lambda item: item[0])
+            table = pyarrow.json.read_json(
+                BytesIO(b''.join(line for _, line in lines)),
+                parse_options=pyarrow.json.ParseOptions(
+                    explicit_schema=schema))
+            # timestamps are parsed from strings
+            for name in timestamps:
+                index = table.schema.get_field_index(name)
+                table = table.set_column(
+                    index, table.column(index).cast(pyarrow.timestamp('s')))
+            # the partition field is encoded in the directory name
+            table = table.remove_column(
+                table.schema.get_field_index(layout.partition_field))
+            self.write_table(table, filenames[partition])
+
+    def get_filename(self, table_id: str, layout: TableLayout,
+                     partition: str, job_id: str) -> str:
+        return os.path.join(self.path, table_id,
+                            f'{layout.partition_field}={partition}',
+                            f'{job_id}.parquet')
+
+    def write_table(self, table, filename: str):
+        """
+        Write the table to the file atomically, so that readers never see
+        incomplete files
+        """
+        dirname = os.path.dirname(filename)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fileobj:
+                pyarrow.parquet.write_table(table, fileobj)
+            os.rename(tmp_filename, filename)
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+
+
+def get_arrow_schema(layout: TableLayout):
+    """
+    Return the Arrow schema to read JSON records of the table, and names of
+    timestamp fields, which are read as strings, and have to be cast
+    """
+    fields = []
+    timestamps = []
+    for name, type_ in layout.get_fields():
+        if type_ is datetime.datetime:
+            timestamps.append(name)
+        arrow_type = getattr(pyarrow, ARROW_TYPES.get(type_, 'string'))()
+        fields.append(pyarrow.field(name, arrow_type))
+    return pyarrow.schema(fields), timestamps
+
+
+class LoadBuffer(object):
+    """
+    Buffer of records of one table, shared by all worker processes through
+    Redis. Every task adds its records (as a whole file, prepared with
+    JSONRecordsWriter) to the buffer of the run, and when the buffer grows
+    over max_size bytes (compressed), it's turned to a numbered batch to be
+    loaded to the sink with one load job.
+
+    Files are copied to Redis in chunks of chunk_size bytes, each file to
+    its own list, and the buffer only keeps keys of these lists, so neither
+    workers nor Redis have to handle the whole file as one value.
+
+    Batches are numbered within the run, so a batch can be loaded with the
+    job id, derived from the run id and the batch number, and loading the
+    batch again is rejected by the sink as a duplicate.
+
+    Buffered records expire in ttl seconds, if they are never loaded.
+    Batches which can't be loaded are kept with keep_batch().
+    """
+    key_prefix = 'insights:analytics:buffer'
+    chunk_size = 1 << 20
+
+    # Atomically turn pending records to a new batch, if their size is at
+    # least ARGV[1] bytes, and return the number of the batch
+    take_lua = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return nil
+    end
+    if tonumber(redis.call('GET', KEYS[2]) or 0) < tonumber(ARGV[1]) then
+        return nil
+    end
+    local batch = redis.call('INCR', KEYS[3])
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+    redis.call('RENAME', KEYS[1], KEYS[1] .. ':' .. string.format('%d', batch))
+    redis.call('DEL', KEYS[2])
+    return batch
+    """
+
+    def __init__(self,
+                 redis_url: str,
+                 table_id: str,
+                 run_id: str,
+                 max_size: int,
+                 ttl: int = 24 * 3600):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.take_script = self.redis.register_script(self.take_lua)
+        self.table_id = table_id
+        self.run_id = run_id
+        self.max_size = max_size
+        self.ttl = ttl
+        self.key = f'{self.key_prefix}:{table_id}:{run_id}'
+        self.failed_key = f'{self.key_prefix}:{table_id}:failed'
+
+    def add(self, records_fd: BinaryIO) -> Optional[int]:
+        """
+        Add records to the buffer. Return the number of the batch, if the
+        buffer is full, and a new batch is ready to be loaded
+        """
+        file_key = f'{self.key}:file:{uuid.uuid4().hex}'
+        size = 0
+        while True:
+            chunk = records_fd.read(self.chunk_size)
+            if not chunk:
+                break
+            pipe = self.redis.pipeline()
+            pipe.rpush(file_key, chunk)
+            pipe.expire(file_key, self.ttl)
+            pipe.execute()
+            size += len(chunk)
+
+        pipe = self.redis.pipeline()
+        pipe.rpush(self.key, file_key)
+        pipe.expire(self.key, self.ttl)
+        pipe.incrby(f'{self.key}:size', size)
+        pipe.expire(f'{self.key}:size', self.ttl)
+        pipe.execute()
+        return self.take(self.max_size)
+
+    def take(self, min_size: int = 0) -> Optional[int]:
+        """
+        Turn pending records to a new batch, if there are at least min_size
+        bytes of them, and return the number of the batch
+        """
+        return self.take_script(
+            keys=[self.key, f'{self.key}:size', f'{self.key}:batch'],
+            args=[min_size, self.ttl])
+
+    def get_batch(self, batch: int) -> Optional[BinaryIO]:
+        """
+        Return records of the batch as one file object, or None if there's
+        no such batch (e.g., it's already loaded)
+        """
+        file_keys = self.redis.lrange(f'{self.key}:{batch}', 0, -1)
+        if not file_keys:
+            return None
+        writer = JSONRecordsWriter()
+        for file_key in file_keys:
+            writer.write_records(ChunkReader(self.redis, file_key))
+        return writer.close()
+
+    def delete_batch(self, batch: int):
+        batch_key = f'{self.key}:{batch}'
+        file_keys = self.redis.lrange(batch_key, 0, -1)
+        pipe = self.redis.pipeline()
+        pipe.delete(batch_key, *file_keys)
+        pipe.srem(self.failed_key, f'{self.run_id}:{batch}')
+        pipe.execute()
+
+    def keep_batch(self, batch: int):
+        """
+        Keep records of the batch, which can't be loaded, until they're
+        deleted explicitly, and add the batch to the set of failed batches
+        of the table, as "<run_id>:<batch>"
+        """
+        batch_key = f'{self.key}:{batch}'
+        pipe = self.redis.pipeline()
+        for key in [batch_key] + self.redis.lrange(batch_key, 0, -1):
+            pipe.persist(key)
+        pipe.sadd(self.failed_key, f'{self.run_id}:{batch}')
+        pipe.execute()
+
+
+class ChunkReader(RawIOBase):
+    """
+    Read-only file object, which reads chunks of the file from the Redis
+    list one by one
+    """
+
+    def __init__(self, redis_client: redis.Redis, key: str):
+        self.redis = redis_client
+        self.key = key
+        self.index = 0
+        self.chunk = b''
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf) -> int:
+        if self.offset >= len(self.chunk):
+            self.chunk = self.redis.lindex(self.key, self.index) or b''
+            self.index += 1
+            self.offset = 0
+        size = min(len(buf), len(self.chunk) - self.offset)
+        buf[:size] = self.chunk[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+
+@lru_cache()
+def get_sink() -> AnalyticsSink:
+    """
+    Return the analytics sink, configured with settings.ANALYTICS_SINK
+    """
+    return import_string(settings.ANALYTICS_SINK)()
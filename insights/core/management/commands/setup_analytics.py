@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from insights.analytics import get_sink
+
+
+class Command(BaseCommand):
+    """
+    Create tables of the analytics sink, which don't exist yet (e.g., after
+    switching ANALYTICS_SINK to BigQuery)
+    """
+    help = 'Create tables of the analytics sink'
+
+    def handle(self, *args, **options):
+        get_sink().setup()
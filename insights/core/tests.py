@@ -1,3 +1,96 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from insights.metrics import NullMetrics, RedisMetrics, StatsdMetrics
+
+
+class RedisMetricsTestCase(SimpleTestCase):
+    def setUp(self):
+        self.metrics = RedisMetrics(settings.CELERY_BROKER_URL, prefix='t_')
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        self.metrics.redis.delete(self.metrics.key, self.metrics.types_key)
+
+    def test_render(self):
+        self.metrics.incr('api.records', 10, endpoint='/find/groups')
+        self.metrics.incr('api.records', 5, endpoint='/find/groups')
+        self.metrics.gauge('api.ratelimit.remaining', 30)
+        self.metrics.gauge('api.ratelimit.remaining', 20)
+        self.metrics.timing('api.request', 0.5, status=200)
+        self.metrics.timing('api.request', 0.25, status=200)
+        self.assertEqual(
+            self.metrics.render().splitlines(), [
+                '# TYPE t_api_ratelimit_remaining gauge',
+                't_api_ratelimit_remaining 20.0',
+                '# TYPE t_api_records_total counter',
+                't_api_records_total{endpoint="/find/groups"} 15.0',
+                '# TYPE t_api_request_seconds summary',
+                't_api_request_seconds_count{status="200"} 2.0',
+                't_api_request_seconds_sum{status="200"} 0.75',
+            ])
+
+    def test_escape_labels(self):
+        self.metrics.incr('tasks', task='say "hi"\\')
+        self.assertIn('t_tasks_total{task="say \\"hi\\"\\\\"} 1.0',
+                      self.metrics.render().splitlines())
+
+
+class StatsdMetricsTestCase(SimpleTestCase):
+    def test_packets(self):
+        metrics = StatsdMetrics('127.0.0.1', 8125, prefix='insights.')
+        metrics.socket = mock.Mock()
+        metrics.incr('api.records', 10, endpoint='/find/groups')
+        with mock.patch('insights.metrics.time.perf_counter',
+                        side_effect=[1, 1.25]):
+            with metrics.timer('db.upsert'):
+                pass
+        self.assertEqual([
+            call[0] for call in metrics.socket.sendto.call_args_list
+        ], [
+            (b'insights.api.records:10|c|#endpoint:/find/groups',
+             ('127.0.0.1', 8125)),
+            (b'insights.db.upsert:250.0|ms', ('127.0.0.1', 8125)),
+        ])
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsViewTestCase(SimpleTestCase):
+    def setUp(self):
+        self.metrics = RedisMetrics(settings.CELERY_BROKER_URL)
+        patch = mock.patch(
+            'insights.core.views.get_metrics', return_value=self.metrics)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_authorized(self):
+        with mock.patch.object(self.metrics, 'render', return_value='m 1\n'):
+            resp = self.client.get(
+                reverse('core-metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, b'm 1\n')
+
+    def test_unauthorized(self):
+        resp = self.client.get(reverse('core-metrics'))
+        self.assertEqual(resp.status_code, 401)
+        resp = self.client.get(
+            reverse('core-metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(resp.status_code, 401)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token(self):
+        resp = self.client.get(
+            reverse('core-metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_not_collected(self):
+        with mock.patch(
+                'insights.core.views.get_metrics',
+                return_value=NullMetrics()):
+            resp = self.client.get(
+                reverse('core-metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(resp.status_code, 404)
@@ -3,4 +3,5 @@ from insights.core import views
 
 urlpatterns = [
     path('', views.index, name='core-index'),
+    path('metrics', views.metrics, name='core-metrics'),
 ]
@@ -1,5 +1,28 @@
-from django.http import HttpResponse
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from insights.metrics import RedisMetrics, get_metrics
 
 
 def index(request):
     return HttpResponse('Community insights')
+
+
+def metrics(request):
+    """
+    Metrics of sync tasks in Prometheus text format, if they're collected
+    with RedisMetrics. Requests have to be authorized with
+    "Authorization: Bearer <METRICS_TOKEN>", and metrics are not exposed at
+    all, if the token is not set
+    """
+    backend = get_metrics()
+    if not isinstance(backend, RedisMetrics) or not settings.METRICS_TOKEN:
+        raise Http404('Metrics are not collected')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(authorization,
+                               f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse('Unauthorized', status=401)
+    return HttpResponse(
+        backend.render(), content_type='text/plain; version=0.0.4')
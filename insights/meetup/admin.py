@@ -15,10 +15,21 @@ class MeetupGroupAdmin(admin.ModelAdmin):
         'created_date',
         'members',
         'members_next_update',
+        'members_update_interval',
     )
     list_filter = ('city', 'created')
     search_fields = ['name', 'description']
 
+    def get_search_results(self, request, queryset, search_term):
+        # full-text search on the indexed search_vector, rather than
+        # ILIKE scans of search_fields
+        if not search_term.strip():
+            return queryset, False
+        query = models.get_prefix_query(search_term)
+        if query is None:
+            return queryset.none(), False
+        return queryset.filter(search_vector=query), False
+
     def created_date(self, obj):
         return obj.created.strftime('%d %b %Y')
 
@@ -29,13 +40,22 @@ class MeetupGroupAdmin(admin.ModelAdmin):
 class MeetupUserAdmin(admin.ModelAdmin):
     list_display = ('name', 'city', 'country', 'joined')
     list_filter = ('joined', 'country', 'city')
+    # UPPER(name) LIKE searches use the trigram index of names
     search_fields = ['name']
 
+    def get_search_results(self, request, queryset, search_term):
+        # shorter terms would scan the whole table
+        term = search_term.strip()
+        if term and len(term) < models.MeetupUser.objects.MIN_SEARCH_LENGTH:
+            return queryset.none(), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 @admin.register(models.MeetupGroupMember)
 class MeetupGroupMemberAdmin(admin.ModelAdmin):
-    list_display = ('user_name', 'group_name', 'created', 'updated', 'visited')
-    list_filter = ('group__name', 'group__city')
+    list_display = ('user_name', 'group_name', 'created', 'updated', 'visited',
+                    'departed')
+    list_filter = ('group__name', 'group__city', 'departed')
     search_fields = ['user__name']
 
     def user_name(self, obj):
@@ -47,3 +67,29 @@ class MeetupGroupMemberAdmin(admin.ModelAdmin):
         return obj.group.name
 
     group_name.admin_order_field = 'group__name'
+
+
+@admin.register(models.MeetupMembershipEvent)
+class MeetupMembershipEventAdmin(admin.ModelAdmin):
+    list_display = ('time', 'kind', 'user', 'group', 'role')
+    list_filter = ('kind', 'time')
+    list_select_related = ('user', 'group')
+    raw_id_fields = ('user', 'group')
+    date_hierarchy = 'time'
+
+
+@admin.register(models.MeetupGroupDailyStats)
+class MeetupGroupDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'group', 'members', 'active_members',
+                    'reported_members', 'joins', 'leaves', 'role_changes')
+    list_select_related = ('group', )
+    raw_id_fields = ('group', )
+    date_hierarchy = 'date'
+
+
+@admin.register(models.MeetupGroupOverlap)
+class MeetupGroupOverlapAdmin(admin.ModelAdmin):
+    list_display = ('group_a', 'group_b', 'members', 'jaccard')
+    list_select_related = ('group_a', 'group_b')
+    raw_id_fields = ('group_a', 'group_b')
+    ordering = ('-jaccard', )
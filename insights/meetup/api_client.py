@@ -4,24 +4,42 @@ A set of functions to work with Meetup API.
 Credentials don't have to be set explicitly. Functions use APICredentials
 model to manage them
 """
+import os
+import random
+import re
+import time
 from typing import Iterable, Union, List
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 from requests.utils import parse_header_links
+from urllib3.util.retry import Retry
 
 from insights.meetup.api_models import APIGroupMember, APIGroup, APICategory
 from insights.meetup.models import APICredentials
+from insights.meetup.rate_limit import RateLimitThrottle, SharedTokenBucket
+from insights.metrics import get_metrics
 
 DEFAULT_PAGE_SIZE = 2000
 
+# Rate limiter, shared by all threads of all worker processes
+rate_limiter = SharedTokenBucket(settings.CELERY_BROKER_URL,
+                                 settings.MEETUP_API_REQUESTS_PER_SECOND,
+                                 settings.MEETUP_API_BURST)
+
+# Throttle, driven by rate limit headers, and shared by all worker processes
+throttle = RateLimitThrottle(settings.CELERY_BROKER_URL,
+                             settings.MEETUP_API_THROTTLE_LOW_WATER)
+
 
 def categories(page_size=DEFAULT_PAGE_SIZE) -> Iterable[APICategory]:
     """
     Get the list of group categories
     """
     return iter_api_v2(
-        'https://api.meetup.com/2/categories',
+        f'{settings.MEETUP_API_URL}/2/categories',
         page_size=page_size,
         wrap=APICategory.from_dict)
 
@@ -50,7 +68,7 @@ def find_groups(category: Union[int, List[int]] = None,
     if location:
         params['location'] = location
     return iter_api_v3(
-        'https://api.meetup.com/find/groups',
+        f'{settings.MEETUP_API_URL}/find/groups',
         params,
         page_size=page_size,
         wrap=APIGroup.from_dict)
@@ -65,33 +83,56 @@ def group_members(urlname: str,
     Returned objects are JSON-encoded representations of users from meetup.com
     API: https://www.meetup.com/meetup_api/docs/:urlname/members/
     """
-    endpoint = f'https://api.meetup.com/{urlname}/members'
+    for page in group_member_pages(urlname, page_size=page_size):
+        yield from page
+
+
+def group_member_pages(urlname: str,
+                       page_size=DEFAULT_PAGE_SIZE,
+                       wrap=APIGroupMember.from_dict
+                       ) -> Iterable[List[APIGroupMember]]:
+    """
+    Same as group_members(), but return an iterator over pages of API
+    results, every page is a list of up to page_size members.
+
+    With wrap=None, members are returned as dicts, the way the API returns
+    them
+    """
+    endpoint = f'{settings.MEETUP_API_URL}/{urlname}/members'
     fields = [
         'messaging_pref',
         'privacy',
     ]
-    return iter_api_v3(
+    return iter_pages_v3(
         endpoint, {'fields': ','.join(fields)},
         page_size=page_size,
-        wrap=APIGroupMember.from_dict)
+        wrap=wrap)
 
 
 def iter_api_v3(endpoint, params=None, page_size=DEFAULT_PAGE_SIZE, wrap=None):
     """
     Helper function to iterate over API results (v3 version of the API)
     """
+    for page in iter_pages_v3(endpoint, params, page_size, wrap):
+        yield from page
+
+
+def iter_pages_v3(endpoint, params=None, page_size=DEFAULT_PAGE_SIZE,
+                  wrap=None):
+    """
+    Helper function to iterate over pages of API results (v3 version of the
+    API). Every page is a list of results
+    """
     effective_params = urlencode(dict(params or {}, page=page_size))
     url = f'{endpoint}?{effective_params}'
     while True:
-        token = APICredentials.get_access_token()
-        headers = {'Authorization': f'Bearer {token}'}
-        resp = requests.get(url, headers=headers)
-        resp.raise_for_status()
+        resp = get_page(url)
         json_resp = resp.json()
-        for result in json_resp:
-            if wrap:
-                result = wrap(result)
-            yield result
+        if wrap:
+            json_resp = [wrap(result) for result in json_resp]
+        get_metrics().incr(
+            'api.records', len(json_resp), endpoint=get_endpoint(endpoint))
+        yield json_resp
 
         # No "Link" to iterate
         if 'Link' not in resp.headers:
@@ -111,19 +152,121 @@ def iter_api_v2(endpoint, params=None, page_size=DEFAULT_PAGE_SIZE, wrap=None):
     """
     Helper function to iterate over API results (v2 version of the API)
     """
+    for page in iter_pages_v2(endpoint, params, page_size, wrap):
+        yield from page
+
+
+def iter_pages_v2(endpoint, params=None, page_size=DEFAULT_PAGE_SIZE,
+                  wrap=None):
+    """
+    Helper function to iterate over pages of API results (v2 version of the
+    API). Every page is a list of results
+    """
     effective_params = urlencode(dict(params or {}, page=page_size))
     url = f'{endpoint}?{effective_params}'
     while True:
-        token = APICredentials.get_access_token()
-        headers = {'Authorization': f'Bearer {token}'}
-        resp = requests.get(url, headers=headers)
-        resp.raise_for_status()
+        resp = get_page(url)
         json_resp = resp.json()
-        for result in json_resp['results']:
-            if wrap:
-                result = wrap(result)
-            yield result
+        results = json_resp['results']
+        if wrap:
+            results = [wrap(result) for result in results]
+        get_metrics().incr(
+            'api.records', len(results), endpoint=get_endpoint(endpoint))
+        yield results
 
         url = json_resp['meta'].get('next')
         if not url:
             break
+
+
+def get_page(url) -> requests.Response:
+    """
+    Fetch one page of API results, respecting the rate limits. If the
+    server responds with "429 Too Many Requests", wait until the quota is
+    reset and request the same page again.
+
+    The latency and the status of every request, and the number of
+    remaining requests are reported to metrics.
+    """
+    metrics = get_metrics()
+    for _ in range(settings.MEETUP_API_MAX_THROTTLE_RETRIES + 1):
+        token = APICredentials.get_access_token()
+        headers = {'Authorization': f'Bearer {token}'}
+        rate_limiter.acquire()
+        throttle.acquire()
+        start = time.perf_counter()
+        resp = get_session().get(
+            url, headers=headers, timeout=settings.MEETUP_API_TIMEOUT)
+        if metrics.enabled:
+            report_request(metrics, url, resp, time.perf_counter() - start)
+        if resp.status_code != 429:
+            throttle.update(resp.headers)
+            break
+        throttle.backoff(resp.headers)
+    resp.raise_for_status()
+    return resp
+
+
+def report_request(metrics, url, resp: requests.Response, seconds: float):
+    endpoint = get_endpoint(url)
+    metrics.timing(
+        'api.request', seconds, endpoint=endpoint, status=resp.status_code)
+    remaining = resp.headers.get('X-RateLimit-Remaining')
+    if remaining is not None and remaining.isdigit():
+        metrics.gauge('api.ratelimit.remaining', int(remaining))
+
+
+def get_endpoint(url: str) -> str:
+    """
+    Return the endpoint of the URL to be used as a metric tag, with the
+    group urlname replaced by a placeholder (e.g., "/:urlname/members")
+    """
+    path = urlparse(url).path
+    return re.sub(r'^/[^/]+/members$', '/:urlname/members', path)
+
+
+class JitteredRetry(Retry):
+    """
+    Retry policy with "full jitter" exponential backoff: instead of waiting
+    exactly backoff_factor * 2 ** retries, we wait for a random time up to
+    that value, so that concurrent clients don't retry all at once
+    """
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+# HTTP session, reused for all requests of the process. We keep the id of
+# the process which created the session to not share connections between
+# forked worker processes
+_session = None
+_session_pid = None
+
+
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session of the current process with connection pooling
+    (keep-alive), gzip compression and retries of transient server errors
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        _session = create_session()
+        _session_pid = os.getpid()
+    return _session
+
+
+def create_session() -> requests.Session:
+    retry = JitteredRetry(
+        total=settings.MEETUP_API_MAX_RETRIES,
+        backoff_factor=settings.MEETUP_API_RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.MEETUP_API_POOL_SIZE,
+        max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip'
+    return session
@@ -1,24 +1,34 @@
 import datetime
+from functools import lru_cache
 
 import attr
 
-from insights.meetup.api_utils import dpath_get, dpath_get_datetime, dpath_get_int
+from insights.meetup.api_utils import (compile_getter, dpath_get,
+                                       dpath_get_datetime, dpath_get_int)
 
 
 @attr.s
 class APIObject(object):
     @classmethod
     def from_dict(cls, obj):
-        ret = {}
-        for field in attr.fields(cls):
-            if not field.init:
-                continue
-            dict_getter = field.metadata.get('dict_getter')
-            if dict_getter is None:
-                dict_getter = dpath_get(f'/{field.name}')
-            value = dict_getter(obj, field)
-            ret[field.name] = value
-        return cls(**ret)
+        return cls(**{name: func(obj) for name, func in get_parser(cls)})
+
+
+@lru_cache()
+def get_parser(cls):
+    """
+    Return the tuple of (field name, extractor) pairs to create the instance
+    of the API class from a dict. The list is compiled once per class.
+    """
+    parser = []
+    for field in attr.fields(cls):
+        if not field.init:
+            continue
+        dict_getter = field.metadata.get('dict_getter')
+        if dict_getter is None:
+            dict_getter = dpath_get(f'/{field.name}')
+        parser.append((field.name, compile_getter(dict_getter, field)))
+    return tuple(parser)
 
 
 @attr.s
@@ -30,23 +40,26 @@ class APICategory(APIObject):
 
 @attr.s
 class APIGroup(APIObject):
-    id = attr.ib()
+    id = attr.ib(type=int)
     name = attr.ib()
     status = attr.ib()
     urlname = attr.ib()
     description = attr.ib(repr=False)
-    created = attr.ib(metadata={'dict_getter': dpath_get_datetime('/created')})
+    created = attr.ib(
+        type=datetime.datetime,
+        metadata={'dict_getter': dpath_get_datetime('/created')})
     city = attr.ib()
     untranslated_city = attr.ib()
     country = attr.ib()
     state = attr.ib()
     join_mode = attr.ib()
     visibility = attr.ib()
-    lat = attr.ib()
-    lon = attr.ib()
-    members = attr.ib()
+    lat = attr.ib(type=float)
+    lon = attr.ib(type=float)
+    members = attr.ib(type=int)
     who = attr.ib()
     organizer_id = attr.ib(
+        type=int,
         metadata={'dict_getter': dpath_get('/organizer/id')})
     organizer_name = attr.ib(
         metadata={'dict_getter': dpath_get('/organizer/name')})
@@ -56,50 +69,60 @@ class APIGroup(APIObject):
     next_event_name = attr.ib(
         metadata={'dict_getter': dpath_get('/next_event/name')})
     next_event_yes_rsvp_count = attr.ib(
+        type=int,
         metadata={'dict_getter': dpath_get_int('/next_event/yes_rsvp_count')})
     next_event_time = attr.ib(
+        type=datetime.datetime,
         metadata={'dict_getter': dpath_get_datetime('/next_event/time')})
-    category_id = attr.ib(metadata={'dict_getter': dpath_get('/category/id')})
+    category_id = attr.ib(
+        type=int, metadata={'dict_getter': dpath_get('/category/id')})
     category_shortname = attr.ib(
         metadata={'dict_getter': dpath_get('/category/shortname')})
     meta_category_id = attr.ib(
+        type=int,
         metadata={'dict_getter': dpath_get('/meta_category/id')})
     meta_category_shortname = attr.ib(
         metadata={'dict_getter': dpath_get('/meta_category/shortname')})
-    date = attr.ib(factory=datetime.date.today)
+    date = attr.ib(type=datetime.date, factory=datetime.date.today)
 
 
 @attr.s
 class APIGroupMember(APIObject):
-    id = attr.ib()
+    id = attr.ib(type=int)
     name = attr.ib()
     status = attr.ib()
-    joined = attr.ib(metadata={'dict_getter': dpath_get_datetime('/joined')})
+    joined = attr.ib(
+        type=datetime.datetime,
+        metadata={'dict_getter': dpath_get_datetime('/joined')})
     city = attr.ib()
     country = attr.ib()
-    lat = attr.ib()
-    lon = attr.ib()
+    lat = attr.ib(type=float)
+    lon = attr.ib(type=float)
     group_status = attr.ib(
         metadata={'dict_getter': dpath_get('/group_profile/status')})
     group_visited = attr.ib(
+        type=datetime.datetime,
         metadata={'dict_getter': dpath_get_datetime('/group_profile/visited')})
     group_created = attr.ib(
+        type=datetime.datetime,
         metadata={'dict_getter': dpath_get_datetime('/group_profile/created')})
     group_updated = attr.ib(
+        type=datetime.datetime,
         metadata={'dict_getter': dpath_get_datetime('/group_profile/updated')})
     group_role = attr.ib(
         metadata={'dict_getter': dpath_get('/group_profile/role')})
     group_id = attr.ib(
+        type=int,
         metadata={'dict_getter': dpath_get('/group_profile/group/id')})
     group_urlname = attr.ib(
         metadata={'dict_getter': dpath_get('/group_profile/group/urlname')})
     group_link = attr.ib(
         metadata={'dict_getter': dpath_get('/group_profile/link')})
-    is_pro_admin = attr.ib()
+    is_pro_admin = attr.ib(type=bool)
     messaging_pref = attr.ib()
     privacy_bio = attr.ib(metadata={'dict_getter': dpath_get('/privacy/bio')})
     privacy_groups = attr.ib(
         metadata={'dict_getter': dpath_get('/privacy/groups')})
     privacy_topics = attr.ib(
         metadata={'dict_getter': dpath_get('/privacy/topics')})
-    date = attr.ib(factory=datetime.date.today)
+    date = attr.ib(type=datetime.date, factory=datetime.date.today)
@@ -1,52 +1,104 @@
 import datetime
-from typing import Optional
+import re
+from typing import Any, Callable, Optional, Tuple
 
 import attr
 import dpath
 import pytz
 
+# Characters which make the path a glob, which has to be resolved by dpath
+GLOB_CHARS = re.compile(r'[*?\[\]!]')
 
-def dpath_get(glob):
+
+@attr.s(frozen=True)
+class PathGetter(object):
     """
-    Getter which returns one value by dpath glob
+    Getter which returns one value by dpath glob, optionally converting it
+    with `convert`. If the value is not found, or conversion fails with one
+    of `convert_errors`, the default value of the field is returned.
+
+    Getters are called as getter(obj, field), or compiled once per field
+    with getter.compile(field) to a function, which takes only the object
+    and resolves plain paths (like "/group_profile/visited") with direct
+    dict lookups instead of dpath glob matching.
     """
+    glob = attr.ib()
+    convert = attr.ib(default=None)
+    convert_errors = attr.ib(default=())
 
-    def func(obj: dict, field: attr.Attribute):
+    def __call__(self, obj: dict, field: attr.Attribute):
         try:
-            return dpath.get(obj, glob)
+            value = dpath.get(obj, self.glob)
         except KeyError:
             return get_default(field)
+        return self.convert_value(value, field)
 
-    return func
+    def convert_value(self, value, field: attr.Attribute):
+        if self.convert is None:
+            return value
+        try:
+            return self.convert(value)
+        except self.convert_errors:
+            return get_default(field)
 
+    def compile(self, field: attr.Attribute) -> Callable[[dict], Any]:
+        keys = split_path(self.glob)
+        if keys is None:
+            return lambda obj: self(obj, field)
 
-def dpath_get_int(glob):
+        def func(obj: dict):
+            try:
+                for key in keys:
+                    obj = obj[key]
+            except (KeyError, TypeError):
+                return get_default(field)
+            return self.convert_value(obj, field)
+
+        return func
+
+
+def dpath_get(glob):
     """
-    Getter which returns one integer value by dpath glob
+    Getter which returns one value by dpath glob
     """
+    return PathGetter(glob)
 
-    def func(obj: dict, field: attr.Attribute):
-        try:
-            return int(dpath.get(obj, glob))
-        except (KeyError, TypeError, ValueError):
-            return get_default(field)
 
-    return func
+def dpath_get_int(glob):
+    """
+    Getter which returns one integer value by dpath glob
+    """
+    return PathGetter(glob, convert=int, convert_errors=(TypeError, ValueError))
 
 
 def dpath_get_datetime(glob):
     """
     Getter which returns one timestamp value by dpath glob
     """
+    return PathGetter(glob, convert=ts)
 
-    def func(obj: dict, field: attr.Attribute):
-        try:
-            value = dpath.get(obj, glob)
-        except KeyError:
-            return get_default(field)
-        return ts(value)
 
-    return func
+def compile_getter(getter, field: attr.Attribute) -> Callable[[dict], Any]:
+    """
+    Turn the getter, called as getter(obj, field), to the function which
+    takes only the object
+    """
+    if hasattr(getter, 'compile'):
+        return getter.compile(field)
+    return lambda obj: getter(obj, field)
+
+
+def split_path(glob) -> Optional[Tuple[str, ...]]:
+    """
+    Split the plain path to the tuple of dict keys. Return None if the path
+    can't be resolved with dict lookups only (globs and list indices)
+    """
+    if GLOB_CHARS.search(glob):
+        return None
+    keys = tuple(key for key in glob.split('/') if key)
+    if any(key.isdigit() for key in keys):
+        return None
+    return keys
 
 
 def get_default(field):
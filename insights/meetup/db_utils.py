@@ -0,0 +1,184 @@
+"""
+A set of helper functions to write model instances to the database in bulk.
+
+Django ORM only knows how to create objects in bulk, so upserts are
+implemented with raw INSERT ... ON CONFLICT statements (PostgreSQL 9.5+)
+"""
+import hashlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import attr
+from django.db import connection
+from psycopg2.extras import execute_values
+
+from insights.metrics import get_metrics
+
+DEFAULT_PAGE_SIZE = 1000
+
+Row = Dict[str, Any]
+
+
+@attr.s
+class UpsertStats(object):
+    """
+    Number of inserted, updated and unchanged rows
+    """
+    inserted = attr.ib(default=0)
+    updated = attr.ib(default=0)
+    unchanged = attr.ib(default=0)
+
+    @property
+    def total(self):
+        return self.inserted + self.updated + self.unchanged
+
+    def __add__(self, other: 'UpsertStats') -> 'UpsertStats':
+        return UpsertStats(
+            inserted=self.inserted + other.inserted,
+            updated=self.updated + other.updated,
+            unchanged=self.unchanged + other.unchanged)
+
+
+def get_content_hash(values: Row) -> str:
+    """
+    Return the hash of the row values to detect changes
+    """
+    content = repr(sorted(values.items()))
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def bulk_upsert(model,
+                rows: Iterable[Row],
+                conflict_fields: List[str],
+                hash_field: Optional[str] = None,
+                page_size=DEFAULT_PAGE_SIZE) -> UpsertStats:
+    """
+    Insert or update a list of rows, where every row is a dict of values,
+    keyed by field attnames (i.e. "user_id" rather than "user").
+
+    conflict_fields is the list of attnames of the unique constraint which
+    decides whether the row has to be inserted or updated.
+
+    Fields which are missing from the row are not updated for existing
+    records, and get the default value of the model field for new ones,
+    the same way as update_or_create(defaults=...) does.
+
+    If hash_field is set, the hash of row values (except conflict fields) is
+    stored in this field, and existing records are updated only if their
+    hash is different.
+
+    Return the number of inserted, updated and unchanged rows
+    """
+    # rows with the same key can't be updated twice within the same
+    # statement, keep the last one
+    unique_rows = OrderedDict()
+    for row in rows:
+        if hash_field:
+            row = dict(row)
+            row[hash_field] = get_content_hash({
+                name: value
+                for name, value in row.items() if name not in conflict_fields
+            })
+        unique_rows[tuple(row[name] for name in conflict_fields)] = row
+
+    # all rows in one statement must have the same set of columns
+    partitions = defaultdict(list)
+    for row in unique_rows.values():
+        partitions[frozenset(row)].append(row)
+
+    metrics = get_metrics()
+    table = model._meta.db_table
+    stats = UpsertStats()
+    with connection.cursor() as cursor, metrics.timer(
+            'db.upsert', table=table):
+        for names, partition in partitions.items():
+            sql, fields = get_upsert_sql(model, names, conflict_fields,
+                                         hash_field)
+            values = [[
+                field.get_db_prep_save(
+                    row[field.attname]
+                    if field.attname in row else field.get_default(),
+                    connection) for field in fields
+            ] for row in partition]
+            result = execute_values(
+                cursor, sql, values, page_size=page_size, fetch=True)
+            inserted = sum(1 for (is_inserted, ) in result if is_inserted)
+            stats += UpsertStats(
+                inserted=inserted,
+                updated=len(result) - inserted,
+                unchanged=len(partition) - len(result))
+
+    if metrics.enabled:
+        for name, value in attr.asdict(stats).items():
+            metrics.incr('db.upsert.rows', value, table=table, result=name)
+    return stats
+
+
+def bulk_insert(model, rows: Iterable[Row],
+                page_size=DEFAULT_PAGE_SIZE) -> int:
+    """
+    Insert a list of rows, where every row is a dict of values, keyed by
+    field attnames. Missing fields get their default values.
+
+    Unlike bulk_create(), rows are not converted to model instances, and
+    primary keys are not returned. Return the number of inserted rows
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    values = [[
+        field.get_db_prep_save(
+            row[field.attname]
+            if field.attname in row else field.get_default(), connection)
+        for field in fields
+    ] for row in rows]
+    if not values:
+        return 0
+
+    table = qn(model._meta.db_table)
+    columns = ', '.join(qn(field.column) for field in fields)
+    sql = f'INSERT INTO {table} ({columns}) VALUES %s'
+    with connection.cursor() as cursor:
+        execute_values(cursor, sql, values, page_size=page_size)
+    return len(values)
+
+
+def get_upsert_sql(model, names, conflict_fields, hash_field=None):
+    """
+    Return the SQL statement for execute_values() and the list of model
+    fields, which values are expected in every row.
+
+    The statement returns one boolean for every inserted or updated row,
+    which is true for inserted rows. Unchanged rows are not returned.
+    """
+    table = qn(model._meta.db_table)
+    fields = [
+        field for field in model._meta.concrete_fields
+        if field.attname in names or not field.primary_key
+    ]
+    update_fields = [
+        field for field in fields if field.attname in names and
+        field.attname not in conflict_fields and not field.primary_key
+    ]
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict_columns = ', '.join(
+        qn(model._meta.get_field(name).column) for name in conflict_fields)
+    if update_fields:
+        action = 'UPDATE SET ' + ', '.join(
+            f'{qn(field.column)} = EXCLUDED.{qn(field.column)}'
+            for field in update_fields)
+        if hash_field:
+            hash_column = qn(model._meta.get_field(hash_field).column)
+            action += (f' WHERE {table}.{hash_column} IS DISTINCT FROM '
+                       f'EXCLUDED.{hash_column}')
+    else:
+        action = 'NOTHING'
+    sql = (f'INSERT INTO {table} ({columns}) VALUES %s '
+           f'ON CONFLICT ({conflict_columns}) DO {action} '
+           f'RETURNING (xmax = 0)')
+    return sql, fields
+
+
+def qn(name):
+    return connection.ops.quote_name(name)
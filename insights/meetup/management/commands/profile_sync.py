@@ -0,0 +1,283 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Iterable, List
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from insights.meetup import api_client, tasks
+from insights.meetup.api_models import APIGroupMember
+from insights.meetup.models import MeetupGroup
+
+
+class Command(BaseCommand):
+    """
+    Run sync_groups, or the sync of members of one group, under the profiler.
+
+    The sync is a real one: it writes to the database and loads records to
+    the analytics sink, unless the sync of the group is rolled back with
+    --rollback
+    """
+    help = ('Profile sync_groups, or the sync of members of one group '
+            '(optionally replayed from a fixture). The sync writes to the '
+            'database and the analytics sink, use --rollback to discard its '
+            'changes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group',
+            help='urlname of the group to sync members of. Without it, '
+            'sync_groups is profiled')
+        parser.add_argument(
+            '--fixture',
+            help='replay pages of members from the file instead of '
+            'requesting the API (requires --group)')
+        parser.add_argument(
+            '--record',
+            help='record pages of members, returned by the API, to the file '
+            'to be replayed with --fixture (requires --group). Recording '
+            'shows up in the profile')
+        parser.add_argument(
+            '--rollback',
+            action='store_true',
+            help='run the sync of the group in a transaction and roll it '
+            'back, so that neither the database nor the analytics sink are '
+            'changed (requires --group)')
+        parser.add_argument(
+            '--flamegraph',
+            default='profile_sync.folded',
+            help='file to write sampled stacks to, in the "folded" format of '
+            'flamegraph.pl and speedscope')
+        parser.add_argument(
+            '--pstats', help='file to write cProfile stats to (e.g., for '
+            'snakeviz)')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.005,
+            help='interval between stack samples, in seconds')
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=25,
+            help='number of functions and allocation sites to print')
+        parser.add_argument(
+            '--no-memory',
+            action='store_true',
+            help="don't trace memory allocations, which slow the sync down")
+
+    def handle(self, *args, **options):
+        fixture, record = options['fixture'], options['record']
+        if (fixture or record) and not options['group']:
+            raise CommandError('--fixture and --record require --group')
+        if fixture and record:
+            raise CommandError("--fixture and --record can't be used together")
+        if options['rollback'] and not options['group']:
+            # sync_groups loads groups to the sink outside of the transaction
+            raise CommandError('--rollback requires --group')
+        func = self.get_func(options)
+        if options['rollback']:
+            func = rolled_back(func)
+
+        trace_memory = not options['no_memory']
+        if trace_memory:
+            tracemalloc.start(10)
+        sampler = StackSampler(options['interval'], trace_memory)
+        profiler = cProfile.Profile()
+        with CaptureQueriesContext(connection) as queries:
+            sampler.start()
+            start = time.perf_counter()
+            try:
+                profiler.runcall(func)
+            finally:
+                elapsed = time.perf_counter() - start
+                sampler.stop()
+                if trace_memory:
+                    tracemalloc.stop()
+
+        self.print_header(f'Sync finished in {elapsed:.2f} sec')
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(options['top'])
+        self.stdout.write(output.getvalue())
+        if options['pstats']:
+            stats.dump_stats(options['pstats'])
+
+        if trace_memory:
+            self.print_memory(sampler, options['top'])
+        self.print_queries(queries.captured_queries)
+
+        with open(options['flamegraph'], 'w') as fd:
+            sampler.write_folded(fd)
+        self.print_header('Output files')
+        self.stdout.write(f'{options["flamegraph"]}: {sampler.samples} '
+                          f'stack samples')
+        if options['pstats']:
+            self.stdout.write(f'{options["pstats"]}: cProfile stats')
+
+    def get_func(self, options):
+        """
+        Return the function to profile
+        """
+        if not options['group']:
+            return tasks.sync_groups
+
+        group = MeetupGroup.objects.filter(urlname=options['group']).first()
+        if group is None:
+            raise CommandError(f'Group {options["group"]} not found')
+
+        if options['fixture']:
+            if not os.path.exists(options['fixture']):
+                raise CommandError(f'Fixture {options["fixture"]} not found')
+            return lambda: tasks.sync_group(
+                group, pages=replay_pages(options['fixture']))
+        if options['record']:
+            return lambda: tasks.sync_group(
+                group, pages=record_pages(group.urlname, options['record']))
+        return lambda: tasks.sync_group(group)
+
+    def print_memory(self, sampler: 'StackSampler', top: int):
+        self.print_header(
+            f'Peak traced memory {sampler.peak_memory / 2**20:.1f} MiB, '
+            f'top allocation sites at the peak')
+        if sampler.peak_snapshot is None:
+            return
+        snapshot = sampler.peak_snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        for stat in snapshot.statistics('lineno')[:top]:
+            frame = stat.traceback[0]
+            self.stdout.write(f'{stat.size / 2**20:10.2f} MiB '
+                              f'{stat.count:>10} blocks  '
+                              f'{frame.filename}:{frame.lineno}')
+
+    def print_queries(self, captured_queries: List[dict]):
+        total_time = sum(float(query['time']) for query in captured_queries)
+        self.print_header(f'{len(captured_queries)} queries, '
+                          f'{total_time:.2f} sec')
+        statements = Counter(
+            get_statement(query['sql']) for query in captured_queries)
+        for statement, count in statements.most_common(10):
+            self.stdout.write(f'{count:>8}  {statement}')
+
+    def print_header(self, title: str):
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+
+
+class StackSampler(object):
+    """
+    Background thread which samples stacks of all other threads, to be
+    rendered as a flame graph, and takes a tracemalloc snapshot when the
+    traced memory reaches its peak
+    """
+
+    def __init__(self, interval: float, trace_memory: bool = False):
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.stacks = Counter()
+        self.samples = 0
+        self.peak_memory = 0
+        self.peak_snapshot = None
+        self.snapshot_memory = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        if self.trace_memory:
+            self.check_memory()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+            if self.trace_memory:
+                self.check_memory()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:'
+                             f'{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def check_memory(self):
+        # snapshots are expensive, take a new one only if the memory has
+        # grown by 10% since the previous one
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak_memory = max(self.peak_memory, peak)
+        if current > self.snapshot_memory * 1.1:
+            self.peak_snapshot = tracemalloc.take_snapshot()
+            self.snapshot_memory = current
+
+    def write_folded(self, fd):
+        for stack, count in sorted(self.stacks.items()):
+            fd.write(f'{stack} {count}\n')
+
+
+def rolled_back(func):
+    """
+    Wrap the function to run in a transaction, which is rolled back. Loads
+    to the analytics sink, started on commit, are skipped as well
+    """
+
+    def wrapper():
+        with transaction.atomic():
+            func()
+            transaction.set_rollback(True)
+
+    return wrapper
+
+
+def get_statement(sql: str) -> str:
+    """
+    Return the kind of the SQL statement and its table, e.g.
+    'INSERT "meetup_meetupuser"'
+    """
+    verb = sql.split(None, 1)[0].upper() if sql.strip() else ''
+    match = re.search(r'\b(?:FROM|INTO|UPDATE) ("\w+")', sql)
+    return f'{verb} {match.group(1)}' if match else verb
+
+
+def replay_pages(filename: str) -> Iterable[List[APIGroupMember]]:
+    """
+    Return pages of members, recorded with record_pages()
+    """
+    with open(filename) as fd:
+        for line in fd:
+            yield [APIGroupMember.from_dict(obj) for obj in json.loads(line)]
+
+
+def record_pages(urlname: str,
+                 filename: str) -> Iterable[List[APIGroupMember]]:
+    """
+    Return pages of members of the group from the API, and write them to
+    the file, one JSON page per line
+    """
+    with open(filename, 'w') as fd:
+        for page in api_client.group_member_pages(urlname, wrap=None):
+            fd.write(json.dumps(page) + '\n')
+            yield [APIGroupMember.from_dict(obj) for obj in page]
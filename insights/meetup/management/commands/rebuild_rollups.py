@@ -0,0 +1,64 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from insights.meetup.models import MeetupGroup, MeetupGroupDailyStats
+from insights.meetup.response_cache import response_cache
+
+
+class Command(BaseCommand):
+    """
+    Rebuild daily rollups of groups from the membership event log and stored
+    members. Groups are rebuilt in parallel, every one in its own transaction
+    """
+    help = 'Rebuild daily rollups of groups in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group',
+            nargs='+',
+            help='urlnames of groups to rebuild, all groups by default')
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=90,
+            help='number of days to restore numbers of members for')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='number of groups rebuilt in parallel (database '
+            'connections)')
+
+    def handle(self, *args, **options):
+        groups = MeetupGroup.objects.all()
+        if options['group']:
+            groups = groups.filter(urlname__in=options['group'])
+        group_ids = list(groups.order_by('id').values_list('id', flat=True))
+        # rollup dates are UTC
+        since = timezone.now().date() - datetime.timedelta(options['days'])
+
+        start = time.perf_counter()
+        rebuild = partial(rebuild_group, since=since)
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for i, _ in enumerate(executor.map(rebuild, group_ids), 1):
+                if i % 100 == 0:
+                    self.stdout.write(f'{i} of {len(group_ids)} groups')
+        elapsed = time.perf_counter() - start
+        response_cache.invalidate()
+        self.stdout.write(
+            f'Rollups of {len(group_ids)} groups rebuilt in {elapsed:.1f} sec')
+
+
+def rebuild_group(group_id: int, since: datetime.date):
+    # every thread has its own connection, close it so that it's not
+    # left open after the thread is done
+    try:
+        MeetupGroupDailyStats.objects.rebuild(group_id, since)
+    finally:
+        connection.close()
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from insights.meetup.scheduler import get_planned_load
+
+
+class Command(BaseCommand):
+    """
+    Print the planned load of members updates per time window
+    """
+    help = 'Print the planned load of members updates per time window'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=2,
+            help='Number of days to report, starting from today')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        print(f'{"window (UTC)":<24} {"groups":>8} {"requests":>10} '
+              f'{"budget":>8}')
+        for i in range(options['days']):
+            for window in get_planned_load(today + datetime.timedelta(i)):
+                label = f'{window.start:%Y-%m-%d %H:%M}-{window.end:%H:%M}'
+                over = ' !' if window.requests > window.budget else ''
+                print(f'{label:<24} {window.groups:>8} {window.requests:>10} '
+                      f'{window.budget:>8}{over}')
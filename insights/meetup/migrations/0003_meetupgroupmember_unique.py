@@ -0,0 +1,26 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:02
+
+from django.db import migrations
+
+# Membership records were created with update_or_create() without a unique
+# constraint, so keep only the latest copy of possible duplicates
+DELETE_DUPLICATES = '''
+DELETE FROM meetup_meetupgroupmember a
+USING meetup_meetupgroupmember b
+WHERE a.user_id = b.user_id AND a.group_id = b.group_id AND a.id < b.id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0002_bigquery'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATES, migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='meetupgroupmember',
+            unique_together={('user', 'group')},
+        ),
+    ]
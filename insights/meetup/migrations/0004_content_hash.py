@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0003_meetupgroupmember_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meetupgroupmember',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='meetupuser',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=32),
+        ),
+    ]
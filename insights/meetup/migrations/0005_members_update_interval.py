@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0004_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meetupgroup',
+            name='members_synced',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='meetupgroup',
+            name='members_update_interval',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
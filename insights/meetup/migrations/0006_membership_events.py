@@ -0,0 +1,38 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0005_members_update_interval'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meetupgroupmember',
+            name='departed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MeetupMembershipEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('join', 'Join'), ('leave', 'Leave'), ('role', 'Role change')], max_length=5)),
+                ('role', models.CharField(max_length=1000, null=True)),
+                ('time', models.DateTimeField()),
+                ('group', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='meetup.MeetupGroup')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='meetup.MeetupUser')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='meetupmembershipevent',
+            index=models.Index(fields=['group', 'time'], name='meetup_meet_group_i_7b98ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meetupmembershipevent',
+            index=models.Index(fields=['user', 'time'], name='meetup_meet_user_id_2d0e94_idx'),
+        ),
+    ]
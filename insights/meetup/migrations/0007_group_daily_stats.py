@@ -0,0 +1,32 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0006_membership_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeetupGroupDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('members', models.PositiveIntegerField(null=True)),
+                ('active_members', models.PositiveIntegerField(null=True)),
+                ('reported_members', models.PositiveIntegerField(null=True)),
+                ('joins', models.PositiveIntegerField(default=0)),
+                ('leaves', models.PositiveIntegerField(default=0)),
+                ('role_changes', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='meetup.MeetupGroup')),
+            ],
+            options={
+                'verbose_name_plural': 'Meetup group daily stats',
+                'unique_together': {('group', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0007_group_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meetupgroup',
+            name='overlaps_stale',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='MeetupGroupOverlap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('members', models.PositiveIntegerField()),
+                ('jaccard', models.FloatField()),
+                ('group_a', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meetup.MeetupGroup')),
+                ('group_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='meetup.MeetupGroup')),
+            ],
+            options={
+                'unique_together': {('group_a', 'group_b')},
+            },
+        ),
+    ]
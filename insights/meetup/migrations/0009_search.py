@@ -0,0 +1,44 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# the same expression as GROUP_SEARCH_VECTOR_SQL of models
+UPDATE_SEARCH_VECTORS = '''
+UPDATE meetup_meetupgroup
+SET search_vector =
+    setweight(to_tsvector('simple', name), 'A') ||
+    setweight(to_tsvector('simple', description), 'B')
+'''
+
+# Django searches with UPPER(name) LIKE UPPER('%...%'), so the index is
+# on the same expression
+CREATE_USER_NAME_INDEX = '''
+CREATE INDEX meetup_meetupuser_name_trgm
+ON meetup_meetupuser USING gin (UPPER(name::text) gin_trgm_ops)
+'''
+DROP_USER_NAME_INDEX = 'DROP INDEX meetup_meetupuser_name_trgm'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0008_group_overlaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meetupgroup',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(UPDATE_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='meetupgroup',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='meetup_meet_search__349e18_gin'),
+        ),
+        TrigramExtension(),
+        migrations.RunSQL(CREATE_USER_NAME_INDEX, DROP_USER_NAME_INDEX),
+    ]
@@ -1,18 +1,64 @@
 import datetime
+import re
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import pytz
 import requests
 import attr
 from attr import NOTHING
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField,
+                                            TrigramSimilarity)
 from django.utils import timezone
-from django.db import models, transaction
+from django.db import connection, models, transaction
 
 from insights.meetup.api_models import APICategory, APIGroup, APIGroupMember
+from insights.meetup.db_utils import (DEFAULT_PAGE_SIZE, UpsertStats,
+                                      bulk_insert, bulk_upsert,
+                                      get_content_hash)
+from insights.meetup.token_cache import AccessTokenCache
 
 API_CREDENTIALS_DATABASE_ID = 1
 YEAR2000 = pytz.utc.localize(datetime.datetime(2000, 1, 1))
 
+# groups are in many languages, so search words aren't stemmed
+SEARCH_CONFIG = 'simple'
+GROUP_SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', name), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', description), 'B')")
+
+# the refresh lock outlives the OAuth request (its connect and read timeouts)
+token_cache = AccessTokenCache(
+    settings.CELERY_BROKER_URL, lock_timeout=3 * settings.MEETUP_OAUTH_TIMEOUT)
+
+
+@lru_cache()
+def get_api_field_names(model, api_class) -> Tuple[str, ...]:
+    """
+    Return names of model fields which have their counterparts in the API
+    class. The mapping is computed once for every pair of classes
+    """
+    api_names = {field.name for field in attr.fields(api_class)}
+    return tuple(field.attname for field in model._meta.concrete_fields
+                 if field.name in api_names)
+
+
+def get_api_values(model, obj) -> dict:
+    """
+    Return the dict of values of the API object to store in the model,
+    skipping values which are not set (NOTHING)
+    """
+    values = {}
+    for name in get_api_field_names(model, obj.__class__):
+        value = getattr(obj, name)
+        if value is not NOTHING:
+            values[name] = value
+    return values
+
 
 class APICredentials(models.Model):
     """
@@ -27,6 +73,9 @@ class APICredentials(models.Model):
         """
         expires_at = timezone.now() + datetime.timedelta(
             seconds=oauth_response['expires_in'] // 2)
+        # cleared after the commit, so that the old token can't be cached
+        # again from the database meanwhile
+        transaction.on_commit(token_cache.clear)
         return APICredentials.objects.update_or_create(
             id=API_CREDENTIALS_DATABASE_ID,
             defaults=dict(
@@ -37,20 +86,42 @@ class APICredentials(models.Model):
     @classmethod
     def get_access_token(cls):
         """
-        Classmethod to return the access token, and refresh it if needed
+        Classmethod to return the access token, and refresh it if needed.
+
+        The token is cached until it expires, and only one process at a time
+        refreshes the expired token, while others wait for the new one.
         """
-        # we expect to have exactly one object
-        cred = APICredentials.objects.get(id=API_CREDENTIALS_DATABASE_ID)
-        if cred.expires_at < timezone.now():
-            cred.refresh()
-        return cred.access_token
+        access_token = token_cache.get()
+        if access_token:
+            return access_token
+
+        with token_cache.local_lock:
+            access_token = token_cache.get() or token_cache.get_shared()
+            if access_token:
+                return access_token
+
+            with token_cache.refresh_lock():
+                # the token could be refreshed while we waited for the lock
+                access_token = token_cache.get_shared()
+                if access_token:
+                    return access_token
+
+                # we expect to have exactly one object, and its lock
+                # serializes refreshes, if Redis is unavailable
+                with transaction.atomic():
+                    cred = APICredentials.objects.select_for_update().get(
+                        id=API_CREDENTIALS_DATABASE_ID)
+                    if cred.expires_at < timezone.now():
+                        cred.refresh()
+                token_cache.set(cred.access_token, cred.expires_at)
+                return cred.access_token
 
     def refresh(self):
         """
         Connect the server to get the fresh access token from the refresh
         token and save it locally
         """
-        url = 'https://secure.meetup.com/oauth2/access'
+        url = f'{settings.MEETUP_OAUTH_URL}/oauth2/access'
         resp = requests.post(
             url,
             data={
@@ -58,7 +129,8 @@ class APICredentials(models.Model):
                 'client_secret': settings.MEETUP_OAUTH_CLIENT_SECRET,
                 'grant_type': 'refresh_token',
                 'refresh_token': self.refresh_token,
-            })
+            },
+            timeout=settings.MEETUP_OAUTH_TIMEOUT)
         resp.raise_for_status()
         oauth_response = resp.json()
         self.access_token = oauth_response['access_token']
@@ -166,6 +238,63 @@ class MeetupGroupManager(models.Manager):
         return self.get_queryset().filter(
             members_next_update__lte=timezone.now(), visibility='public')
 
+    def planned_load(self, start: datetime.datetime,
+                     window: datetime.timedelta, count: int,
+                     page_size: int) -> List[Tuple[int, int]]:
+        """
+        Return the number of groups and the expected number of API requests
+        (pages of members) for `count` consecutive time windows, starting
+        from `start`, according to members_next_update of public groups
+        """
+        sql = f'''
+        SELECT floor(extract(epoch FROM members_next_update - %s) / %s),
+               count(*),
+               sum(greatest(1, ceil(members / %s::float)))
+        FROM {self.model._meta.db_table}
+        WHERE visibility = 'public'
+          AND members_next_update >= %s AND members_next_update < %s
+        GROUP BY 1
+        '''
+        end = start + window * count
+        load = [(0, 0)] * count
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                start,
+                window.total_seconds(), page_size, start, end
+            ])
+            for index, groups, requests in cursor.fetchall():
+                load[int(index)] = (groups, int(requests))
+        return load
+
+    def search(self, text: str):
+        """
+        Return groups, which name or description contain words, starting
+        with all words of the text, ordered by relevance (matches in names
+        first). Uses the full-text index of search_vector
+        """
+        query = get_prefix_query(text)
+        if query is None:
+            return self.get_queryset().none()
+        return self.get_queryset().filter(search_vector=query).annotate(
+            rank=SearchRank(models.F('search_vector'), query)).order_by(
+                '-rank', 'id')
+
+    def update_search_vectors(self, group_ids: List[int]) -> int:
+        """
+        Update search_vector of groups from their names and descriptions.
+        Only changed vectors are written, to spare updates of the GIN index.
+        Return the number of updated groups
+        """
+        sql = f'''
+        UPDATE {self.model._meta.db_table}
+        SET search_vector = {GROUP_SEARCH_VECTOR_SQL}
+        WHERE id = ANY(%s)
+          AND search_vector IS DISTINCT FROM {GROUP_SEARCH_VECTOR_SQL}
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [list(group_ids)])
+            return cursor.rowcount
+
 
 class MeetupGroup(models.Model):
     """
@@ -208,10 +337,21 @@ class MeetupGroup(models.Model):
     meta_category_shortname = models.CharField(max_length=1000)
 
     members_next_update = models.DateTimeField(default=YEAR2000)
+    # number of members returned by the last members update
+    members_synced = models.PositiveIntegerField(default=0)
+    # number of days between members updates, adapted to the churn
+    members_update_interval = models.PositiveSmallIntegerField(default=1)
+    # set when members have changed, until overlaps with other groups are
+    # recomputed
+    overlaps_stale = models.BooleanField(default=True)
+    # weighted words of the name and the description, for the full-text
+    # search, updated with MeetupGroup.objects.update_search_vectors()
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=['members_next_update', 'visibility']),
+            GinIndex(fields=['search_vector']),
         ]
 
     @classmethod
@@ -220,25 +360,49 @@ class MeetupGroup(models.Model):
         Create a model instance from meetup API object.
         We use api_instance "id" as unique key
         """
-        obj_dict = attr.asdict(obj)
+        defaults = get_api_values(cls, obj)
+        kwargs = {cls._meta.pk.name: defaults.pop(cls._meta.pk.attname)}
+        group = cls.objects.update_or_create(defaults=defaults, **kwargs)[0]
+        cls.objects.update_search_vectors([group.pk])
+        return group
 
-        kwargs = {}
-        defaults = {}
-        for field in cls._meta.fields:
-            if field.primary_key:
-                kwargs[field.name] = obj_dict[field.name]
-            else:
-                if field.name in obj_dict:
-                    default_value = obj_dict[field.name]
-                    if default_value is not NOTHING:
-                        defaults[field.name] = default_value
-
-        return cls.objects.update_or_create(defaults=defaults, **kwargs)[0]
+    @classmethod
+    @transaction.atomic
+    def bulk_from_api(cls, objs: Iterable[APIGroup]):
+        """
+        Bulk version of from_api(). Create or update group instances for
+        a list of API objects with batched INSERT ... ON CONFLICT statements.
+        Return the number of inserted, updated and unchanged groups
+        """
+        rows = [get_api_values(cls, obj) for obj in objs]
+        stats = bulk_upsert(
+            cls, rows, conflict_fields=[cls._meta.pk.attname])
+        cls.objects.update_search_vectors(
+            [row[cls._meta.pk.attname] for row in rows])
+        return stats
 
     def __str__(self):
         return f'{self.name}'
 
 
+class MeetupUserManager(models.Manager):
+    # shorter texts have no trigrams to narrow matches down with the index
+    MIN_SEARCH_LENGTH = 3
+
+    def search(self, text: str):
+        """
+        Return users, which name contains the text, the most similar names
+        first, or no users if the text is shorter than MIN_SEARCH_LENGTH.
+        Uses the trigram index of names
+        """
+        text = text.strip()
+        if len(text) < self.MIN_SEARCH_LENGTH:
+            return self.get_queryset().none()
+        return self.get_queryset().filter(name__icontains=text).annotate(
+            similarity=TrigramSimilarity('name', text)).order_by(
+                '-similarity', 'id')
+
+
 class MeetupUser(models.Model):
     """
     Model which mirrors user object of the meetup.com API
@@ -246,7 +410,13 @@ class MeetupUser(models.Model):
 
     Users are generated automatically with
     `./manage.py sync_group_members`
+
+    Names are indexed with trigrams of pg_trgm (see migration
+    0009_search), so that substring searches (name__icontains) don't scan
+    the table.
     """
+    objects = MeetupUserManager()
+
     name = models.CharField(max_length=1000)
     status = models.CharField(max_length=1000)
     joined = models.DateTimeField()
@@ -260,6 +430,9 @@ class MeetupUser(models.Model):
     privacy_groups = models.CharField(max_length=1000)
     privacy_topics = models.CharField(max_length=1000)
 
+    # hash of values from the API to skip writes of unchanged users
+    content_hash = models.CharField(max_length=32, default='', editable=False)
+
     def __str__(self):
         return f'{self.name}'
 
@@ -284,6 +457,15 @@ class MeetupGroupMember(models.Model):
     created = models.DateTimeField()
     updated = models.DateTimeField()
     role = models.CharField(max_length=1000, null=True)
+    # when the member was found to have left the group, or None for active
+    # members
+    departed = models.DateTimeField(null=True, blank=True)
+
+    # hash of values from the API to skip writes of unchanged members
+    content_hash = models.CharField(max_length=32, default='', editable=False)
+
+    class Meta:
+        unique_together = (('user', 'group'),)
 
     @classmethod
     def from_api(cls, group: MeetupGroup, obj: APIGroupMember):
@@ -292,33 +474,480 @@ class MeetupGroupMember(models.Model):
         API. Return the MeetupGroupMember instance
         """
         # Create a user
-        obj_dict = attr.asdict(obj)
-        user_kwargs = {}
-        user_defaults = {}
-        for field in MeetupUser._meta.fields:
-            if field.primary_key:
-                user_kwargs[field.name] = obj_dict[field.name]
-            else:
-                default_value = obj_dict[field.name]
-                if default_value is not NOTHING:
-                    user_defaults[field.name] = obj_dict[field.name]
+        user_defaults = get_api_values(MeetupUser, obj)
+        user_kwargs = {'id': user_defaults.pop('id')}
+        user_defaults['content_hash'] = get_content_hash(user_defaults)
         user = MeetupUser.objects.update_or_create(
             defaults=user_defaults, **user_kwargs)[0]
 
         # Now create a GroupMember instance
-        role = obj.group_role
-        if role is NOTHING:
-            role = None
+        defaults = get_member_values(obj)
+        defaults['content_hash'] = get_content_hash(defaults)
         return cls.objects.update_or_create(
-            user=user,
-            group=group,
-            defaults={
-                'status': obj.group_status,
-                'visited': obj.group_visited,
-                'created': obj.group_created,
-                'updated': obj.group_updated,
-                'role': role,
-            })[0]
+            user=user, group=group, defaults=defaults)[0]
+
+    @classmethod
+    @transaction.atomic
+    def bulk_from_api(cls,
+                      group: MeetupGroup,
+                      objs: Iterable[APIGroupMember],
+                      event_dates: Optional[Counter] = None
+                      ) -> Dict[str, UpsertStats]:
+        """
+        Bulk version of from_api(). Create or update MeetupUser and
+        MeetupGroupMember instances for a list of API objects (normally, one
+        page of the API response) with a few INSERT ... ON CONFLICT
+        statements.
+
+        Only new and changed records are written. Joins (including members
+        who come back) and role changes are logged to
+        MeetupMembershipEvent, and the number of events per date is added
+        to the event_dates counter, if it's set.
+
+        Return the number of inserted, updated and unchanged records, as a
+        dict with "users" and "members" keys
+        """
+        user_rows = []
+        member_rows = OrderedDict()
+        for obj in objs:
+            user_rows.append(get_api_values(MeetupUser, obj))
+            member_row = get_member_values(obj)
+            member_row.update(user_id=obj.id, group_id=group.id)
+            member_rows[obj.id] = member_row
+
+        dates = MeetupMembershipEvent.log_changes(group, member_rows.values())
+        if event_dates is not None:
+            event_dates.update(dates)
+        return {
+            'users':
+            bulk_upsert(
+                MeetupUser,
+                user_rows,
+                conflict_fields=['id'],
+                hash_field='content_hash'),
+            'members':
+            bulk_upsert(
+                cls,
+                member_rows.values(),
+                conflict_fields=['user_id', 'group_id'],
+                hash_field='content_hash'),
+        }
+
+    @classmethod
+    @transaction.atomic
+    def mark_departed(cls, group: MeetupGroup, user_ids: Set[int]) -> int:
+        """
+        Mark active members of the group, which are not in user_ids (i.e.,
+        were not returned by the API), as departed, and log their leaves.
+        Return the number of departed members
+        """
+        active = set(
+            cls.objects.filter(group=group, departed=None).values_list(
+                'user_id', flat=True))
+        departed = sorted(active - user_ids)
+        if not departed:
+            return 0
+
+        now = timezone.now()
+        for start in range(0, len(departed), DEFAULT_PAGE_SIZE):
+            chunk = departed[start:start + DEFAULT_PAGE_SIZE]
+            cls.objects.filter(
+                group=group, user_id__in=chunk).update(departed=now)
+        bulk_insert(MeetupMembershipEvent, ({
+            'group_id': group.id,
+            'user_id': user_id,
+            'kind': MeetupMembershipEvent.LEAVE,
+            'time': now,
+        } for user_id in departed))
+        return len(departed)
 
     def __str__(self):
         return f'{self.user.name} in {self.group.name}'
+
+
+class MeetupMembershipEvent(models.Model):
+    """
+    Join, leave or role change of the group member, detected by the sync of
+    members of the group. Events are appended, and never updated.
+
+    Joins are timed with the date the member joined the group, according to
+    the API. Leaves and role changes are timed with the sync which detected
+    them.
+    """
+    JOIN = 'join'
+    LEAVE = 'leave'
+    ROLE = 'role'
+    KIND_CHOICES = (
+        (JOIN, 'Join'),
+        (LEAVE, 'Leave'),
+        (ROLE, 'Role change'),
+    )
+
+    group = models.ForeignKey(
+        MeetupGroup, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(
+        MeetupUser, on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    # role of the member after the event
+    role = models.CharField(max_length=1000, null=True)
+    time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'time']),
+            models.Index(fields=['user', 'time']),
+        ]
+
+    @classmethod
+    def log_changes(cls, group: MeetupGroup,
+                    member_rows: Iterable[dict]) -> Counter:
+        """
+        Compare rows of members of the group, as returned by the API, with
+        stored members, log joins and role changes, and mark members who
+        come back as active again. Must be called before rows are written.
+        Return the number of logged events per date (UTC)
+        """
+        member_rows = list(member_rows)
+        stored = {
+            user_id: (role, departed)
+            for user_id, role, departed in MeetupGroupMember.objects.filter(
+                group=group,
+                user_id__in=[row['user_id'] for row in member_rows]
+            ).values_list('user_id', 'role', 'departed')
+        }
+
+        now = timezone.now()
+        events = []
+        rejoined = []
+        for row in member_rows:
+            if row['user_id'] not in stored:
+                kind, when = cls.JOIN, row['created']
+            else:
+                role, departed = stored[row['user_id']]
+                if departed is not None:
+                    kind, when = cls.JOIN, row['created']
+                    rejoined.append(row['user_id'])
+                elif role != row['role']:
+                    kind, when = cls.ROLE, now
+                else:
+                    continue
+            events.append({
+                'group_id': group.id,
+                'user_id': row['user_id'],
+                'kind': kind,
+                'role': row['role'],
+                'time': when,
+            })
+
+        if rejoined:
+            MeetupGroupMember.objects.filter(
+                group=group, user_id__in=rejoined).update(departed=None)
+        bulk_insert(cls, events)
+        return Counter(
+            event['time'].astimezone(pytz.utc).date() for event in events)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} of {self.user} in {self.group}'
+
+
+class MeetupGroupDailyStatsManager(models.Manager):
+    def latest_per_group(self):
+        """
+        Return the latest row with the number of members of every group
+        """
+        return self.get_queryset().filter(members__isnull=False).order_by(
+            'group_id', '-date').distinct('group_id')
+
+    def members_by_city(self, country: Optional[str] = None):
+        """
+        Return the number of groups, their members and active members per
+        city, according to the latest rows of groups
+        """
+        latest = self.latest_per_group()
+        if country:
+            latest = latest.filter(group__country__iexact=country)
+        return self.get_queryset().filter(
+            id__in=models.Subquery(latest.values('id'))).values(
+                'group__country', 'group__city').annotate(
+                    groups=models.Count('id'),
+                    members=models.Sum('members'),
+                    active_members=models.Sum('active_members')).order_by(
+                        '-members', 'group__city')
+
+    def leaderboard(self,
+                    order: str,
+                    since: datetime.date,
+                    limit: int,
+                    country: Optional[str] = None) -> List[dict]:
+        """
+        Return top groups by the order ("growth", i.e. joins minus leaves
+        since the date, "members" or "active_members" of the latest row of
+        the group), with their latest numbers of members, joins and leaves
+        """
+        if order not in self.model.LEADERBOARD_ORDERS:
+            raise ValueError(f'Unknown order {order}')
+        table = self.model._meta.db_table
+        group_table = MeetupGroup._meta.db_table
+        # latest rows and sums of events are looked up by the unique index
+        # of (group_id, date), group by group
+        sql = f'''
+        SELECT urlname, name, city, country, members, active_members, joins,
+               leaves, growth
+        FROM (
+            SELECT g.id, g.urlname, g.name, g.city, g.country,
+                   latest.members, latest.active_members,
+                   coalesce(events.joins, 0) AS joins,
+                   coalesce(events.leaves, 0) AS leaves,
+                   coalesce(events.joins, 0) - coalesce(events.leaves, 0)
+                       AS growth
+            FROM {group_table} g
+            CROSS JOIN LATERAL (
+                SELECT members, active_members
+                FROM {table}
+                WHERE group_id = g.id AND members IS NOT NULL
+                ORDER BY date DESC
+                LIMIT 1
+            ) latest
+            LEFT JOIN LATERAL (
+                SELECT sum(joins) AS joins, sum(leaves) AS leaves
+                FROM {table}
+                WHERE group_id = g.id AND date >= %s
+            ) events ON true
+            WHERE %s = '' OR upper(g.country) = upper(%s)
+        ) groups
+        ORDER BY coalesce({order}, 0) DESC, id
+        LIMIT %s
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [since, country or '', country or '', limit])
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def update_for_sync(self, group: MeetupGroup,
+                        event_dates: Iterable[datetime.date]):
+        """
+        Update rows of the group after the sync of its members: today's
+        number of members and active members, and numbers of events on
+        today and on event_dates (dates of events logged by the sync)
+        """
+        today = timezone.now().date()
+        table = self.model._meta.db_table
+        member_table = MeetupGroupMember._meta.db_table
+        sql = f'''
+        INSERT INTO {table} (group_id, date, members, active_members,
+                             joins, leaves, role_changes)
+        SELECT %s, %s,
+               count(*) FILTER (WHERE departed IS NULL),
+               count(*) FILTER (WHERE departed IS NULL AND visited >= %s),
+               0, 0, 0
+        FROM {member_table}
+        WHERE group_id = %s
+        ON CONFLICT (group_id, date) DO UPDATE SET
+            members = EXCLUDED.members,
+            active_members = EXCLUDED.active_members
+        '''
+        active_since = timezone.now() - datetime.timedelta(
+            days=self.model.ACTIVE_MEMBER_DAYS)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [group.id, today, active_since, group.id])
+        self.update_events(group.id, sorted(set(event_dates) | {today}))
+
+    def update_events(self, group_id: int, dates: List[datetime.date]):
+        """
+        Recount membership events of the group on given dates
+        """
+        table = self.model._meta.db_table
+        event_table = MeetupMembershipEvent._meta.db_table
+        sql = f'''
+        INSERT INTO {table} (group_id, date, joins, leaves, role_changes)
+        SELECT %s, day,
+               count(time) FILTER (WHERE kind = 'join'),
+               count(time) FILTER (WHERE kind = 'leave'),
+               count(time) FILTER (WHERE kind = 'role')
+        FROM unnest(%s::date[]) AS day
+        LEFT JOIN {event_table}
+            ON group_id = %s
+           AND time >= day::timestamp AT TIME ZONE 'UTC'
+           AND time < (day + 1)::timestamp AT TIME ZONE 'UTC'
+        GROUP BY day
+        ON CONFLICT (group_id, date) DO UPDATE SET
+            joins = EXCLUDED.joins,
+            leaves = EXCLUDED.leaves,
+            role_changes = EXCLUDED.role_changes
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [group_id, dates, group_id])
+
+    def update_reported_members(self, group_ids: List[int]):
+        """
+        Store today's number of members of groups, reported by the API
+        """
+        today = timezone.now().date()
+        table = self.model._meta.db_table
+        group_table = MeetupGroup._meta.db_table
+        sql = f'''
+        INSERT INTO {table} (group_id, date, reported_members,
+                             joins, leaves, role_changes)
+        SELECT id, %s, members, 0, 0, 0
+        FROM {group_table}
+        WHERE id = ANY(%s)
+        ON CONFLICT (group_id, date) DO UPDATE SET
+            reported_members = EXCLUDED.reported_members
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [today, list(group_ids)])
+
+    @transaction.atomic
+    def rebuild(self, group_id: int, since: datetime.date):
+        """
+        Rebuild rows of the group from the membership event log and stored
+        members: event counts on all days, and numbers of members on every
+        day from `since` to today. Members are counted by the date they
+        joined the group and the date they were found to have left.
+
+        Numbers of active members and reported members can't be restored
+        for past days, and are kept intact
+        """
+        today = timezone.now().date()
+        table = self.model._meta.db_table
+        member_table = MeetupGroupMember._meta.db_table
+        event_table = MeetupMembershipEvent._meta.db_table
+        sql = f'''
+        WITH days AS (
+            SELECT day::date AS date
+            FROM generate_series(%(since)s::date, %(today)s::date,
+                                 '1 day') AS day
+        ), changes AS (
+            SELECT (created AT TIME ZONE 'UTC')::date AS date, 1 AS delta
+            FROM {member_table}
+            WHERE group_id = %(group_id)s
+            UNION ALL
+            SELECT (departed AT TIME ZONE 'UTC')::date, -1
+            FROM {member_table}
+            WHERE group_id = %(group_id)s AND departed IS NOT NULL
+            UNION ALL
+            SELECT date, 0 FROM days
+        ), members AS (
+            SELECT DISTINCT date, sum(delta) OVER (ORDER BY date) AS members
+            FROM changes
+        ), events AS (
+            SELECT (time AT TIME ZONE 'UTC')::date AS date,
+                   count(*) FILTER (WHERE kind = 'join') AS joins,
+                   count(*) FILTER (WHERE kind = 'leave') AS leaves,
+                   count(*) FILTER (WHERE kind = 'role') AS role_changes
+            FROM {event_table}
+            WHERE group_id = %(group_id)s
+            GROUP BY 1
+        )
+        INSERT INTO {table} (group_id, date, members,
+                             joins, leaves, role_changes)
+        SELECT %(group_id)s, date, days_members.members,
+               coalesce(joins, 0), coalesce(leaves, 0),
+               coalesce(role_changes, 0)
+        FROM (
+            SELECT date, members
+            FROM days JOIN members USING (date)
+        ) AS days_members
+        FULL JOIN events USING (date)
+        ON CONFLICT (group_id, date) DO UPDATE SET
+            members = coalesce(EXCLUDED.members, {table}.members),
+            joins = EXCLUDED.joins,
+            leaves = EXCLUDED.leaves,
+            role_changes = EXCLUDED.role_changes
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'group_id': group_id,
+                'since': since,
+                'today': today,
+            })
+
+
+class MeetupGroupDailyStats(models.Model):
+    """
+    Daily rollup of group metrics, one row per group and day, maintained by
+    syncs of groups and their members, and rebuilt with
+    "./manage.py rebuild_rollups".
+
+    Numbers of members and active members are counted on days of syncs,
+    joins, leaves and role changes are counted from the membership event
+    log, and reported members are taken from the API on days of
+    sync_groups.
+    """
+    # members who visited the group within this number of days are active
+    ACTIVE_MEMBER_DAYS = 30
+    # columns which groups can be ordered by in leaderboard()
+    LEADERBOARD_ORDERS = ('growth', 'members', 'active_members')
+
+    objects = MeetupGroupDailyStatsManager()
+
+    group = models.ForeignKey(
+        MeetupGroup, on_delete=models.CASCADE, db_index=False)
+    date = models.DateField(db_index=True)
+    members = models.PositiveIntegerField(null=True)
+    active_members = models.PositiveIntegerField(null=True)
+    reported_members = models.PositiveIntegerField(null=True)
+    joins = models.PositiveIntegerField(default=0)
+    leaves = models.PositiveIntegerField(default=0)
+    role_changes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('group', 'date'),)
+        verbose_name_plural = 'Meetup group daily stats'
+
+    def __str__(self):
+        return f'{self.group} on {self.date}'
+
+
+class MeetupGroupOverlap(models.Model):
+    """
+    Number of members shared by two groups (group_a_id < group_b_id), and
+    their Jaccard similarity. Computed by insights.meetup.overlap for pairs
+    with at least one shared member
+    """
+    group_a = models.ForeignKey(
+        MeetupGroup,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False)
+    group_b = models.ForeignKey(
+        MeetupGroup, on_delete=models.CASCADE, related_name='+')
+    members = models.PositiveIntegerField()
+    jaccard = models.FloatField()
+
+    class Meta:
+        unique_together = (('group_a', 'group_b'),)
+
+    def __str__(self):
+        return f'{self.group_a} and {self.group_b}'
+
+
+def get_prefix_query(text: str) -> Optional[SearchQuery]:
+    """
+    Return the full-text query, matching words which start with every word
+    of the text, or None if there are no words in the text
+    """
+    words = re.findall(r'[^\W_]+', text)
+    if not words:
+        return None
+    return SearchQuery(
+        ' & '.join(f'{word}:*' for word in words),
+        config=SEARCH_CONFIG,
+        search_type='raw')
+
+
+def get_member_values(obj: APIGroupMember) -> dict:
+    """
+    Return the dict of group-specific values of the API object to store in
+    MeetupGroupMember
+    """
+    role = obj.group_role
+    if role is NOTHING:
+        role = None
+    return {
+        'status': obj.group_status,
+        'visited': obj.group_visited,
+        'created': obj.group_created,
+        'updated': obj.group_updated,
+        'role': role,
+    }
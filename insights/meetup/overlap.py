@@ -0,0 +1,211 @@
+"""
+Overlap of members between groups.
+
+Memberships (pairs of user and group ids) of active members are loaded from
+the database to NumPy arrays, and shared members of all pairs of groups are
+counted in one pass: users are bucketed by the number of their groups, and
+pairs of groups of all users of the bucket are enumerated at once. The cost
+is proportional to the number of pairs of groups of every user, rather than
+to the number of pairs of groups, as it is with SQL self-joins.
+
+Overlaps are stored in MeetupGroupOverlap, and refreshed for groups, which
+members have changed, after every sync of members. Refreshes are serialized
+with overlaps_lock().
+"""
+import io
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Tuple
+
+import attr
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from insights.meetup.models import MeetupGroupMember, MeetupGroupOverlap
+
+# Shared members are counted with np.bincount() over all pairs of groups if
+# there are fewer pairs than this, and with np.unique() otherwise
+MAX_BINCOUNT_PAIRS = 1 << 22
+
+# key of the advisory lock, held while overlaps are refreshed
+OVERLAPS_LOCK_ID = 0x0e71a95
+
+
+@attr.s
+class Overlaps(object):
+    """
+    Pairs of groups with shared members (group_a < group_b), the number of
+    shared members and Jaccard similarity of every pair, as NumPy arrays
+    """
+    group_a = attr.ib()
+    group_b = attr.ib()
+    members = attr.ib()
+    jaccard = attr.ib(default=None)
+
+    def __len__(self):
+        return len(self.members)
+
+
+def count_overlaps(users: np.ndarray,
+                   groups: np.ndarray,
+                   only_groups: Optional[Iterable[int]] = None) -> Overlaps:
+    """
+    Take arrays of user and group ids of memberships, and return pairs of
+    groups with shared members, and the number of shared members.
+
+    If only_groups is set, only pairs with at least one of these groups are
+    counted (memberships of other groups are still needed to find them).
+    """
+    # sort memberships by user and group, dropping duplicates
+    order = np.lexsort((groups, users))
+    users, groups = users[order], groups[order]
+    unique = np.ones(len(users), dtype=bool)
+    unique[1:] = (users[1:] != users[:-1]) | (groups[1:] != groups[:-1])
+    users, groups = users[unique], groups[unique]
+
+    # groups are numbered from 0, in the order of their ids, so that groups
+    # of every user are sorted by their numbers as well
+    group_ids, group_index = np.unique(groups, return_inverse=True)
+    count = len(group_ids)
+    selected = None
+    if only_groups is not None:
+        selected = np.isin(group_ids, list(only_groups))
+
+    # users with the same number of groups ("degree") make a matrix of
+    # group numbers, and pairs of its columns are pairs of groups
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    degrees = np.diff(np.r_[starts, len(users)])
+    keys = [np.zeros(0, dtype=np.int64)]
+    for degree in np.unique(degrees[degrees > 1]):
+        rows = starts[degrees == degree]
+        matrix = group_index[rows[:, None] + np.arange(degree)]
+        i, j = np.triu_indices(degree, 1)
+        group_a, group_b = matrix[:, i].ravel(), matrix[:, j].ravel()
+        if selected is not None:
+            mask = selected[group_a] | selected[group_b]
+            group_a, group_b = group_a[mask], group_b[mask]
+        keys.append(group_a.astype(np.int64) * count + group_b)
+    keys = np.concatenate(keys)
+
+    if count * count <= MAX_BINCOUNT_PAIRS:
+        members = np.bincount(keys, minlength=count * count)
+        keys = np.flatnonzero(members)
+        members = members[keys]
+    else:
+        keys, members = np.unique(keys, return_counts=True)
+    return Overlaps(
+        group_a=group_ids[keys // count],
+        group_b=group_ids[keys % count],
+        members=members)
+
+
+def add_jaccard(overlaps: Overlaps, group_ids: np.ndarray,
+                sizes: np.ndarray) -> Overlaps:
+    """
+    Add Jaccard similarity (shared members divided by the number of members
+    of either group) to overlaps. group_ids must be sorted, and sizes are
+    numbers of members of these groups
+    """
+    size_a = sizes[np.searchsorted(group_ids, overlaps.group_a)]
+    size_b = sizes[np.searchsorted(group_ids, overlaps.group_b)]
+    overlaps.jaccard = overlaps.members / (
+        size_a + size_b - overlaps.members)
+    return overlaps
+
+
+def load_memberships(group_ids: Optional[Iterable[int]] = None
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return arrays of user and group ids of active members of all groups. If
+    group_ids is set, return memberships of members of these groups only
+    (including their memberships in other groups)
+    """
+    table = MeetupGroupMember._meta.db_table
+    sql = f'SELECT user_id, group_id FROM {table} WHERE departed IS NULL'
+    params = []
+    if group_ids is not None:
+        sql += (f' AND user_id IN (SELECT user_id FROM {table} '
+                f'WHERE departed IS NULL AND group_id = ANY(%s))')
+        params.append(list(group_ids))
+
+    # COPY is much faster than fetching millions of rows as tuples
+    buf = io.StringIO()
+    with connection.cursor() as cursor:
+        query = cursor.mogrify(sql, params).decode('utf-8')
+        cursor.copy_expert(f'COPY ({query}) TO STDOUT', buf)
+    values = np.fromstring(buf.getvalue(), dtype=np.int64, sep=' ')
+    return values[0::2], values[1::2]
+
+
+def load_group_sizes(group_ids: Iterable[int]
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return sorted group ids and numbers of active members of these groups
+    """
+    sizes = dict(
+        MeetupGroupMember.objects.filter(
+            group_id__in=list(group_ids), departed=None).values_list(
+                'group_id').annotate(Count('id')).order_by())
+    ids = np.array(sorted(sizes), dtype=np.int64)
+    return ids, np.array([sizes[i] for i in ids], dtype=np.int64)
+
+
+@contextmanager
+def overlaps_lock() -> Iterator[bool]:
+    """
+    Try to take the session-level advisory lock of overlaps without waiting,
+    and yield True if it's taken, so that only one refresh runs at a time
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [OVERLAPS_LOCK_ID])
+        locked = cursor.fetchone()[0]
+    try:
+        yield locked
+    finally:
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)',
+                               [OVERLAPS_LOCK_ID])
+
+
+@transaction.atomic
+def refresh_overlaps(group_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute overlaps of given groups with all other groups (or overlaps
+    of all groups, if group_ids is None), and replace them in
+    MeetupGroupOverlap. Return the number of stored pairs
+    """
+    if group_ids is None:
+        users, groups = load_memberships()
+        overlaps = count_overlaps(users, groups)
+        ids, index = np.unique(groups, return_inverse=True)
+        add_jaccard(overlaps, ids, np.bincount(index))
+        MeetupGroupOverlap.objects.all().delete()
+    else:
+        group_ids = list(group_ids)
+        users, groups = load_memberships(group_ids)
+        overlaps = count_overlaps(users, groups, only_groups=group_ids)
+        involved = np.union1d(overlaps.group_a, overlaps.group_b)
+        add_jaccard(overlaps, *load_group_sizes(involved.tolist()))
+        MeetupGroupOverlap.objects.filter(
+            Q(group_a_id__in=group_ids) |
+            Q(group_b_id__in=group_ids)).delete()
+    write_overlaps(overlaps)
+    return len(overlaps)
+
+
+def write_overlaps(overlaps: Overlaps):
+    """
+    Insert overlaps to MeetupGroupOverlap with COPY, which is faster than
+    INSERT for hundreds of thousands of pairs
+    """
+    buf = io.StringIO()
+    for row in zip(overlaps.group_a.tolist(), overlaps.group_b.tolist(),
+                   overlaps.members.tolist(), overlaps.jaccard.tolist()):
+        buf.write('%d\t%d\t%d\t%.6g\n' % row)
+    buf.seek(0)
+    table = MeetupGroupOverlap._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {table} (group_a_id, group_b_id, members, jaccard) '
+            f'FROM STDIN', buf)
@@ -0,0 +1,88 @@
+"""
+Planner of API requests to find groups for active group filters.
+
+Filters which share the same location are merged to one request with the
+list of their categories, requests for different locations are made in
+parallel, and results are mapped back to filters by the group category.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import attr
+from django.db import connection
+
+from insights.meetup import api_client
+from insights.meetup.api_models import APIGroup
+from insights.meetup.models import MeetupGroupFilter
+
+
+@attr.s(frozen=True)
+class GroupQuery(object):
+    """
+    One find_groups request, which serves several filters of the same
+    location
+    """
+    country = attr.ib()
+    location = attr.ib()
+    filters = attr.ib()  # type: Tuple[MeetupGroupFilter, ...]
+
+    @property
+    def categories(self) -> List[int]:
+        return sorted({filt.category_id for filt in self.filters})
+
+    def run(self) -> List[APIGroup]:
+        """
+        Run the query in a thread. API credentials can be read from the
+        database, and we close the connection of the thread when we're done.
+        """
+        try:
+            return list(
+                api_client.find_groups(
+                    category=self.categories,
+                    country=self.country,
+                    location=self.location))
+        finally:
+            connection.close()
+
+
+def plan_group_queries(
+        filters: Iterable[MeetupGroupFilter]) -> List[GroupQuery]:
+    """
+    Group filters by (country, location) to one query per location
+    """
+    by_location = OrderedDict()
+    for filt in filters:
+        key = (filt.location.country, filt.location.location)
+        by_location.setdefault(key, []).append(filt)
+    return [
+        GroupQuery(country=country, location=location, filters=tuple(filts))
+        for (country, location), filts in by_location.items()
+    ]
+
+
+def run_group_queries(queries: List[GroupQuery], max_workers: int
+                      ) -> Dict[GroupQuery, List[APIGroup]]:
+    """
+    Run queries in parallel and return groups found by every query
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(GroupQuery.run, queries)
+        return OrderedDict(zip(queries, results))
+
+
+def map_groups_to_filters(results: Dict[GroupQuery, List[APIGroup]]
+                          ) -> Dict[MeetupGroupFilter, List[APIGroup]]:
+    """
+    Return groups found for every filter, matching them by category
+    """
+    groups_by_filter = OrderedDict()
+    for query, groups in results.items():
+        by_category = {filt.category_id: filt for filt in query.filters}
+        for filt in query.filters:
+            groups_by_filter[filt] = []
+        for group in groups:
+            filt = by_category.get(group.category_id)
+            if filt is not None:
+                groups_by_filter[filt].append(group)
+    return groups_by_filter
@@ -0,0 +1,205 @@
+"""
+Rate limiters to keep the number of requests to meetup.com API within the
+allowed limits.
+"""
+import threading
+import time
+from typing import Mapping
+
+import redis
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket. The bucket is refilled with `rate` tokens per
+    second up to `capacity` tokens, every request takes one token, and
+    blocks until there's a token to take.
+
+    Tokens are reserved in the order of requests, so that concurrent
+    callers are served one after another, rather than all at once when the
+    bucket is refilled.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1):
+        """
+        Take tokens from the bucket, waiting for them if necessary.
+        Rate limiting is disabled if rate is not a positive number.
+        """
+        if not self.rate or self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= tokens
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket, shared by all worker processes through Redis, so that the
+    overall request rate doesn't grow with the number of workers. Tokens
+    are reserved atomically with a Lua script, in the order of requests.
+
+    If Redis is not available, requests are limited by the bucket of the
+    process only.
+    """
+    key = 'insights:meetup:tokenbucket'
+
+    # Refill the bucket by ARGV[1] tokens per second up to ARGV[2] tokens,
+    # take ARGV[4] tokens at the time ARGV[3], and return the number of
+    # seconds to wait for them (as a string, to keep the fraction)
+    reserve_lua = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+    local tokens = tonumber(state[1]) or capacity
+    local timestamp = tonumber(state[2]) or now
+    if now > timestamp then
+        tokens = math.min(capacity, tokens + (now - timestamp) * rate)
+        timestamp = now
+    end
+    tokens = tokens - tonumber(ARGV[4])
+    redis.call('HMSET', KEYS[1], 'tokens', string.format('%.6f', tokens),
+               'timestamp', string.format('%.6f', timestamp))
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return string.format('%.6f', -tokens / rate)
+    """
+
+    def __init__(self, redis_url: str, rate: float, capacity: int = 1):
+        super().__init__(rate, capacity)
+        self.redis = redis.Redis.from_url(redis_url)
+        self.reserve_script = self.redis.register_script(self.reserve_lua)
+
+    def acquire(self, tokens: int = 1):
+        """
+        Take tokens from the shared bucket, waiting for them if necessary.
+        Rate limiting is disabled if rate is not a positive number.
+        """
+        if not self.rate or self.rate <= 0:
+            return
+        try:
+            delay = self.reserve(tokens)
+        except redis.RedisError:
+            super().acquire(tokens)
+            return
+        if delay > 0:
+            time.sleep(delay)
+
+    def reserve(self, tokens: int = 1) -> float:
+        """
+        Take tokens from the shared bucket, and return the number of seconds
+        to wait for them
+        """
+        # the state expires, when the bucket is full anyway
+        ttl = int(self.capacity / self.rate) + 1
+        delay = self.reserve_script(
+            keys=[self.key],
+            args=[self.rate, self.capacity, time.time(), tokens, ttl])
+        return float(delay)
+
+
+class RateLimitThrottle(object):
+    """
+    Adaptive throttle, driven by X-RateLimit-Remaining and X-RateLimit-Reset
+    headers of API responses.
+
+    The state (the number of remaining requests and the time of the reset)
+    is kept in Redis, so that all worker processes share the same view of
+    the quota. Throttling is advisory: if Redis is not available, requests
+    are not delayed.
+    """
+    key = 'insights:meetup:ratelimit'
+
+    # Atomically take one request from the quota, if the state is known,
+    # and return the number of remaining requests before that and the reset
+    # time
+    take_lua = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return nil
+    end
+    local remaining = redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+    return {remaining + 1, redis.call('HGET', KEYS[1], 'reset_at')}
+    """
+
+    def __init__(self, redis_url: str, low_water: int = 5):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.take_script = self.redis.register_script(self.take_lua)
+        self.low_water = low_water
+
+    def acquire(self):
+        """
+        Wait before making a request, if we're about to hit the limit, and
+        count the request against the shared quota.
+        """
+        delay = self.get_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_delay(self) -> float:
+        """
+        Return the number of seconds to wait before the next request. When
+        the number of remaining requests goes below the low water mark,
+        requests are spread evenly until the reset time.
+        """
+        try:
+            state = self.take_script(keys=[self.key])
+        except redis.RedisError:
+            return 0
+        if not state:
+            return 0
+        remaining, reset_at = int(state[0]), float(state[1])
+        reset_in = reset_at - time.time()
+        if reset_in <= 0:
+            return 0
+        if remaining <= 0:
+            return reset_in
+        if remaining < self.low_water:
+            return reset_in / remaining
+        return 0
+
+    def update(self, headers: Mapping[str, str]):
+        """
+        Update the shared state from the response headers
+        """
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset_in = float(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            return
+        self.set_state(remaining, reset_in)
+
+    def backoff(self, headers: Mapping[str, str], default: float = 10):
+        """
+        Handle the "429 Too Many Requests" response: block other processes
+        and wait until the quota is reset
+        """
+        reset_in = headers.get('X-RateLimit-Reset') or headers.get(
+            'Retry-After')
+        try:
+            reset_in = float(reset_in)
+        except (TypeError, ValueError):
+            reset_in = default
+        self.set_state(0, reset_in)
+        time.sleep(reset_in)
+
+    def set_state(self, remaining: int, reset_in: float):
+        reset_at = time.time() + reset_in
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hmset(self.key, {'remaining': remaining, 'reset_at': reset_at})
+            pipe.expireat(self.key, int(reset_at) + 1)
+            pipe.execute()
+        except redis.RedisError:
+            pass
@@ -0,0 +1,140 @@
+"""
+Cache of responses of the insights API in Redis (its own instance,
+INSIGHTS_API_CACHE_URL, limited with maxmemory, apart from the Celery
+broker).
+
+Responses are cached under the current version of data, which is bumped
+with invalidate() when a sync finishes, so that stale responses are never
+served after the sync and don't have to be deleted one by one. Windows of
+responses (e.g., the last 30 days) depend on the current date, so the date
+is a part of the version as well.
+
+Responses are identified by the view, its arguments and whitelisted query
+parameters only, so that arbitrary query strings can't make new entries.
+The version and the digest of the identity make the ETag of responses, so
+conditional requests are answered with "304 Not Modified" after a single
+Redis lookup.
+"""
+import hashlib
+import json
+from functools import wraps
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+
+class ResponseCache(object):
+    version_key = 'insights:api:version'
+    key_prefix = 'insights:api:response'
+
+    def __init__(self, redis_url: str, ttl: int):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.ttl = ttl
+
+    def get_version(self) -> int:
+        return int(self.redis.get(self.version_key) or 0)
+
+    def get_tag(self) -> str:
+        """
+        Return the version of data and the current date (UTC), which
+        responses are cached under
+        """
+        return f'v{self.get_version()}-{timezone.now():%Y%m%d}'
+
+    def invalidate(self) -> int:
+        """
+        Start the new version of data, and return it. Responses, cached
+        under previous versions, expire with their TTL
+        """
+        return self.redis.incr(self.version_key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.redis.get(key)
+
+    def set(self, key: str, content: bytes):
+        self.redis.set(key, content, ex=self.ttl)
+
+    def get_key(self, tag: str, name: str, arguments: dict) -> str:
+        """
+        Return the key of the response of the view with the name, called
+        with arguments (view arguments and normalized query parameters)
+        under the tag
+        """
+        return f'{self.key_prefix}:{tag}:{name}:{get_digest(arguments)}'
+
+
+def get_digest(arguments: dict) -> str:
+    encoded = json.dumps(arguments, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def get_params(request, params: Mapping[str, Callable[[str], Any]]
+               ) -> Dict[str, Any]:
+    """
+    Return query parameters of the request, which are listed in params,
+    normalized with their functions (e.g., int). Invalid values are None
+    """
+    values = {}
+    for name, normalize in params.items():
+        value = request.GET.get(name)
+        if value is None:
+            continue
+        try:
+            values[name] = normalize(value)
+        except ValueError:
+            values[name] = None
+    return values
+
+
+def cached_json(cache: ResponseCache,
+                params: Optional[Mapping[str, Callable[[str], Any]]] = None):
+    """
+    Decorator of views, which return JSON-serializable data (or raise
+    Http404). Responses are cached by the view, its arguments and query
+    parameters, listed in params with functions to normalize their values:
+    other parameters are ignored, so the view must not use them. The ETag
+    of responses is the tag of the cache (the version of data and the date)
+    and the digest of these values
+    """
+    params = params or {}
+
+    def decorator(view):
+        name = f'{view.__module__}.{view.__qualname__}'
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # the tag is read once, so that the ETag always matches the
+            # content, even if the cache is invalidated meanwhile
+            tag = cache.get_tag()
+            arguments = {
+                'args': args,
+                'kwargs': kwargs,
+                'params': get_params(request, params),
+            }
+            key = cache.get_key(tag, name, arguments)
+            etag = f'{tag}-{get_digest([name, arguments])}'
+
+            @condition(etag_func=lambda *args, **kwargs: etag)
+            def respond(request, *args, **kwargs):
+                content = cache.get(key)
+                if content is None:
+                    content = json.dumps(
+                        view(request, *args, **kwargs),
+                        cls=DjangoJSONEncoder).encode('utf-8')
+                    cache.set(key, content)
+                return HttpResponse(content, content_type='application/json')
+
+            return respond(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+response_cache = ResponseCache(settings.INSIGHTS_API_CACHE_URL,
+                               settings.INSIGHTS_API_CACHE_TTL)
@@ -0,0 +1,148 @@
+"""
+Scheduler of members updates.
+
+Members of due groups are synced by sync_group_members every two hours, so
+the day is split into two-hour windows, each ending with the run of the
+task. The next update of the group is placed into the window with the
+lowest expected number of API requests, so that the load is spread evenly,
+even though groups differ a lot in size. Windows which are out of the API
+budget (MEETUP_API_REQUESTS_PER_WINDOW) are skipped.
+
+The day of the next update depends on the churn of the group: groups which
+members change are updated daily, and quiet groups less and less often.
+"""
+import datetime
+import random
+from typing import List
+
+import attr
+import pytz
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from insights.meetup.api_client import DEFAULT_PAGE_SIZE
+from insights.meetup.models import MeetupGroup
+
+# Windows match the schedule of sync_group_members in CELERY_BEAT_SCHEDULE:
+# the task runs at 12 minutes every other hour
+WINDOW = datetime.timedelta(hours=2)
+WINDOW_OFFSET = datetime.timedelta(minutes=12)
+WINDOWS_PER_DAY = 12
+
+# groups which don't fit into the API budget of any window of the day are
+# moved to the next days, up to this number of days
+MAX_SPILL_DAYS = 7
+
+# key of the advisory lock, which serializes choices of windows
+SCHEDULE_LOCK_ID = 0x5c4ed01e
+
+
+@attr.s
+class Window(object):
+    """
+    Planned load of one time window
+    """
+    start = attr.ib()
+    end = attr.ib()
+    groups = attr.ib(default=0)
+    requests = attr.ib(default=0)
+    budget = attr.ib(default=None)
+
+
+def get_expected_requests(members: int) -> int:
+    """
+    Return the number of API requests to fetch all members of the group
+    """
+    return max(1, -(-members // DEFAULT_PAGE_SIZE))
+
+
+def get_planned_load(day: datetime.date) -> List[Window]:
+    """
+    Return the list of windows of the day with the number of groups and the
+    expected number of API requests, scheduled for every window
+    """
+    start = pytz.utc.localize(
+        datetime.datetime(day.year, day.month, day.day)) + WINDOW_OFFSET
+    load = MeetupGroup.objects.planned_load(
+        start, WINDOW, WINDOWS_PER_DAY, page_size=DEFAULT_PAGE_SIZE)
+    return [
+        Window(
+            start=start + WINDOW * i,
+            end=start + WINDOW * (i + 1),
+            groups=groups,
+            requests=requests,
+            budget=settings.MEETUP_API_REQUESTS_PER_WINDOW)
+        for i, (groups, requests) in enumerate(load)
+    ]
+
+
+def get_update_interval(group: MeetupGroup, churn: int) -> int:
+    """
+    Return the number of days until the next members update of the group,
+    given the number of joins, leaves and role changes found by the last
+    sync.
+
+    Any change resets the interval to the minimum, otherwise the interval
+    is doubled, up to the maximum.
+    """
+    min_interval = settings.MEETUP_MIN_UPDATE_INTERVAL_DAYS
+    max_interval = max(min_interval, settings.MEETUP_MAX_UPDATE_INTERVAL_DAYS)
+    if churn > 0:
+        return min_interval
+    interval = group.members_update_interval * 2
+    return min(max(interval, min_interval), max_interval)
+
+
+def get_next_update(group: MeetupGroup) -> datetime.datetime:
+    """
+    Return the time of the next members update of the group: a random time
+    within the window with the lowest planned load, members_update_interval
+    days after today. If the group doesn't fit into the API budget of any
+    window of that day, it spills over to the following days, up to
+    MAX_SPILL_DAYS.
+
+    Has to be called in the transaction which saves the group: choices are
+    serialized with the lock until the end of the transaction, so that
+    concurrent syncs see windows chosen by each other
+    """
+    lock_schedule()
+    requests = get_expected_requests(group.members)
+    day = timezone.now().date() + datetime.timedelta(
+        days=group.members_update_interval)
+    candidates = None
+    for i in range(MAX_SPILL_DAYS + 1):
+        windows = get_planned_load(day + datetime.timedelta(days=i))
+
+        # don't count the group itself, if it's already scheduled for the
+        # same window
+        for window in windows:
+            if window.start <= group.members_next_update < window.end:
+                window.groups -= 1
+                window.requests -= requests
+
+        if candidates is None:
+            candidates = windows
+        within_budget = [
+            window for window in windows
+            if window.requests + requests <= window.budget
+        ]
+        if within_budget:
+            candidates = within_budget
+            break
+
+    # if all windows are over the budget, the group goes to the least
+    # loaded window of the first day anyway
+    min_requests = min(window.requests for window in candidates)
+    window = random.choice(
+        [window for window in candidates if window.requests == min_requests])
+    seconds = random.randint(0, int(WINDOW.total_seconds()) - 1)
+    return window.start + datetime.timedelta(seconds=seconds)
+
+
+def lock_schedule():
+    """
+    Take the transaction-level advisory lock of the schedule
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SCHEDULE_LOCK_ID])
@@ -1,17 +1,34 @@
 import datetime
-import random
 import time
 import warnings
+from collections import Counter
+from typing import BinaryIO, Iterable, List, Optional
 
-import pytz
-from celery import shared_task
-from django.db.transaction import atomic
-from google.cloud.exceptions import Conflict
+import attr
+from celery import chord, shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.transaction import atomic, on_commit
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from insights.analytics import DuplicateLoad, LoadBuffer, get_sink
 from insights.meetup import api_client
+from insights.meetup.api_models import APIGroupMember
+from insights.meetup.db_utils import UpsertStats
 from insights.meetup.models import (MeetupCategory, MeetupGroup,
-                                    MeetupGroupFilter, MeetupGroupMember)
-from insights.utils import bigquery_upload, get_job_id
-from requests import HTTPError
+                                    MeetupGroupDailyStats, MeetupGroupFilter,
+                                    MeetupGroupMember, MeetupGroupOverlap)
+from insights.meetup.overlap import overlaps_lock, refresh_overlaps
+from insights.meetup.planner import (map_groups_to_filters,
+                                     plan_group_queries, run_group_queries)
+from insights.meetup.response_cache import response_cache
+from insights.meetup.scheduler import get_next_update, get_update_interval
+from insights.metrics import get_metrics
+from insights.utils import JSONRecordsWriter, get_job_id
+from requests import ConnectionError, HTTPError, RequestException, Timeout
+
+logger = get_task_logger(__name__)
 
 
 @shared_task
@@ -22,63 +39,380 @@ def sync_categories():
 
 @shared_task
 def sync_groups():
+    # active filters are merged to one request per location, and requests
+    # are made in parallel
+    filters = list(MeetupGroupFilter.objects.get_active())
+    queries = plan_group_queries(filters)
+    results = run_group_queries(
+        queries, max_workers=settings.MEETUP_FIND_GROUPS_CONCURRENCY)
+
     # collect groups to this dictionary, automatically eliminating
     # duplicates
     groups_dict = {}
-    filters = list(MeetupGroupFilter.objects.get_active())
-    for i, filt in enumerate(filters):
-        groups = api_client.find_groups(
-            category=filt.category.id,
-            country=filt.location.country,
-            location=filt.location.location)
+    for groups in results.values():
         for g in groups:
             groups_dict[g.urlname] = g
 
-    # create group models
-    for group in groups_dict.values():
-        MeetupGroup.from_api(group)
+    # create group models, and record their numbers of members
+    MeetupGroup.bulk_from_api(groups_dict.values())
+    MeetupGroupDailyStats.objects.update_reported_members(
+        [g.id for g in groups_dict.values()])
 
-    # store data to bigquery
+    # cached responses of the insights API are stale now
+    response_cache.invalidate()
+    get_metrics().incr('sync.groups.found', len(groups_dict))
+
+    # store data to the analytics sink
     now = datetime.datetime.utcnow()
     job_id = get_job_id(f'sync_groups_{now:%Y%m%d}')
-    bigquery_upload(groups_dict.values(), 'groups', job_id=job_id, async=False)
+    with get_metrics().timer('analytics.load', table='groups'):
+        get_sink().load(
+            groups_dict.values(), 'groups', job_id=job_id, async=False)
+
+    # report the number of groups per filter
+    groups_by_filter = map_groups_to_filters(results)
+    return {
+        str(filt): len(groups)
+        for filt, groups in groups_by_filter.items()
+    }
 
 
 @shared_task
 def sync_group_members():
-    groups = list(MeetupGroup.objects.members_update_required())
-    for i, group in enumerate(groups):
-        sync_group(group)
-        time.sleep(1)
+    """
+    Dispatch one sync_group_members_of subtask per group which members have
+    to be updated. Subtasks run in parallel on all available workers, and
+    sync_group_members_done is called when all of them are complete.
+
+    Dispatched groups are leased for MEETUP_SYNC_GROUP_LEASE seconds, so
+    that they are not dispatched again while their subtasks are in the
+    queue. If the subtask fails, the group is picked up again after the
+    lease expires.
+    """
+    group_ids = list(MeetupGroup.objects.members_update_required().values_list(
+        'id', flat=True))
+    if not group_ids:
+        return 0
 
+    lease = timezone.now() + datetime.timedelta(
+        seconds=settings.MEETUP_SYNC_GROUP_LEASE)
+    MeetupGroup.objects.filter(id__in=group_ids).update(
+        members_next_update=lease)
 
-@atomic
-def sync_group(group: MeetupGroup):
-    # get the list of all group members
+    # members of all groups are loaded to the analytics sink in batches,
+    # collected in the buffer of the run
+    run_id = f'{timezone.now():%Y%m%d%H%M%S}'
+    subtasks = [
+        sync_group_members_of.s(group_id, run_id=run_id)
+        for group_id in group_ids
+    ]
+    callback = sync_group_members_done.s(run_id=run_id).on_error(
+        sync_group_members_failed.s(run_id=run_id, lease=lease.isoformat()))
+    chord(subtasks)(callback)
+    return len(group_ids)
+
+
+@shared_task(
+    bind=True,
+    max_retries=settings.MEETUP_SYNC_GROUP_MAX_RETRIES,
+    soft_time_limit=settings.MEETUP_SYNC_GROUP_SOFT_TIME_LIMIT,
+    time_limit=settings.MEETUP_SYNC_GROUP_TIME_LIMIT)
+def sync_group_members_of(self, group_id: int, run_id: Optional[str] = None):
+    """
+    Sync members of one group. Transient errors (connection errors, timeouts
+    and 5xx or 429 responses) are retried with exponential backoff.
+
+    Members are added to the load buffer of the run, if run_id is set.
+
+    The subtask never fails, so that the chord callback is always called:
+    other errors are logged, and the group is synced again after its lease
+    expires. If the subtask is killed by the hard time limit,
+    sync_group_members_failed is called instead of the callback.
+    Return the number of inserted, updated and unchanged users and members
+    of the group, or None if the group can't be synced.
+    """
+    group = MeetupGroup.objects.filter(id=group_id).first()
+    if group is None:
+        return None
+
+    metrics = get_metrics()
+    load_buffer = get_members_buffer(run_id) if run_id else None
     try:
-        members = list(api_client.group_members(group.urlname))
-    except HTTPError as e:
+        stats = sync_group(group, load_buffer)
+    except RequestException as e:
+        if is_transient_error(e) and self.request.retries < self.max_retries:
+            countdown = settings.MEETUP_SYNC_GROUP_RETRY_DELAY * 2**(
+                self.request.retries)
+            metrics.incr('sync.groups', status='retried')
+            raise self.retry(exc=e, countdown=countdown)
         warnings.warn(f"Unable to sync the group {group.name}: {e}")
+        metrics.incr('sync.groups', status='failed')
+        return None
+    except SoftTimeLimitExceeded:
+        warnings.warn(f"Time limit exceeded syncing the group {group.name}")
+        metrics.incr('sync.groups', status='failed')
+        return None
+    except Exception:
+        logger.exception(f'Unable to sync the group {group.name}')
+        metrics.incr('sync.groups', status='failed')
+        return None
+
+    metrics.incr('sync.groups', status='synced')
+    return {
+        'urlname': group.urlname,
+        'stats': {name: attr.asdict(value)
+                  for name, value in stats.items()},
+    }
+
+
+@shared_task
+def sync_group_members_done(results, run_id: Optional[str] = None):
+    """
+    Chord callback: start loading the rest of the load buffer of the run,
+    and report the number of inserted, updated and unchanged records per
+    group, and the number of groups which failed
+    """
+    finish_sync_run(run_id)
+    report = {
+        result['urlname']: result['stats']
+        for result in results if result is not None
+    }
+    failed = sum(1 for result in results if result is None)
+    logger.info(f'Members of {len(report)} groups synced, {failed} failed')
+    return report
+
+
+@shared_task
+def sync_group_members_failed(request,
+                              exc=None,
+                              traceback=None,
+                              run_id: Optional[str] = None,
+                              lease: Optional[str] = None):
+    """
+    Chord errback, called instead of sync_group_members_done if a subtask
+    has failed anyway (e.g., killed by the hard time limit), or the callback
+    itself has failed, so that synced members are still loaded and the
+    insights are updated.
+
+    Celery calls it with the request of the failed callback, its exception
+    and traceback, or, if a subtask has failed, with the id of the callback
+    only. Groups of the run which are still leased (i.e., weren't synced)
+    are released, so that they are picked up by the next run
+    """
+    logger.error(f'Members sync {run_id} failed, finishing it anyway: {exc}')
+    if lease:
+        MeetupGroup.objects.filter(
+            members_next_update=parse_datetime(lease)).update(
+                members_next_update=timezone.now())
+    finish_sync_run(run_id)
+
+
+def finish_sync_run(run_id: Optional[str]):
+    """
+    Start loading the rest of the load buffer of the run, invalidate cached
+    responses of the insights API, and start the update of overlaps
+    """
+    if run_id:
+        batch = get_members_buffer(run_id).take()
+        if batch is not None:
+            load_members_batch.delay(run_id, batch)
+
+    # cached responses of the insights API are stale now
+    response_cache.invalidate()
+    update_group_overlaps.delay()
+
+
+@shared_task(bind=True, max_retries=settings.MEETUP_SYNC_GROUP_MAX_RETRIES)
+def update_group_overlaps(self):
+    """
+    Recompute overlaps of groups, which members have changed since the last
+    update, with all other groups. All overlaps are computed, if there are
+    none yet. Return the number of stored pairs of stale groups.
+
+    Only one update runs at a time, the task is retried later, if another
+    one is running
+    """
+    with overlaps_lock() as locked:
+        if not locked:
+            raise self.retry(countdown=settings.MEETUP_SYNC_GROUP_RETRY_DELAY)
+
+        group_ids = list(
+            MeetupGroup.objects.filter(overlaps_stale=True).values_list(
+                'id', flat=True))
+        if not group_ids:
+            return 0
+
+        # flags are reset before memberships are read, so that groups synced
+        # meanwhile are marked as stale again
+        MeetupGroup.objects.filter(id__in=group_ids).update(
+            overlaps_stale=False)
+        try:
+            if MeetupGroupOverlap.objects.exists():
+                return refresh_overlaps(group_ids)
+            return refresh_overlaps()
+        except Exception:
+            MeetupGroup.objects.filter(id__in=group_ids).update(
+                overlaps_stale=True)
+            raise
+
+
+def is_transient_error(exc: RequestException) -> bool:
+    """
+    Return True if the request can succeed if we try it later
+    """
+    if isinstance(exc, HTTPError) and exc.response is not None:
+        status_code = exc.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(exc, (ConnectionError, Timeout))
+
+
+def sync_group(group: MeetupGroup,
+               load_buffer: Optional[LoadBuffer] = None,
+               pages: Optional[Iterable[List[APIGroupMember]]] = None):
+    """
+    Sync members of the group page by page. Every page of the API response
+    is written to the database and to the upload buffer right away, so that
+    only one page is kept in memory at a time.
+
+    When the sync is committed, members are added to load_buffer of the
+    run, or loaded to the analytics sink right away, if there's no buffer.
+
+    The group is synced as a whole: if any page fails, all changes are
+    rolled back, and the next update is not scheduled. Otherwise the next
+    update is scheduled in a day if members have changed, or later, if the
+    group stays quiet.
+
+    Pages of members are requested from the API, unless they're passed
+    explicitly (e.g., replayed from a recorded fixture).
+
+    Return the number of inserted, updated and unchanged users and members.
+    """
+    start = time.perf_counter()
+    if pages is None:
+        pages = api_client.group_member_pages(group.urlname)
+    stats = {'users': UpsertStats(), 'members': UpsertStats()}
+    user_ids = set()
+    event_dates = Counter()
+    with atomic():
+        records = JSONRecordsWriter()
+        for members in pages:
+            page_stats = MeetupGroupMember.bulk_from_api(
+                group, members, event_dates)
+            for name, value in page_stats.items():
+                stats[name] += value
+            user_ids.update(member.id for member in members)
+            records.write(members)
+        records_fd = records.close()
+
+        # active members, which were not returned by the API this time,
+        # have left the group
+        removed = MeetupGroupMember.mark_departed(group, user_ids)
+        MeetupGroupDailyStats.objects.update_for_sync(group, event_dates)
+        member_stats = stats['members']
+        # only joins, leaves and role changes count, not visits or profile
+        # updates of members
+        churn = sum(event_dates.values()) + removed
+
+        # schedule next update, spreading the load evenly
+        group.members_synced = member_stats.total
+        if event_dates or removed:
+            group.overlaps_stale = True
+        group.members_update_interval = get_update_interval(group, churn)
+        group.members_next_update = get_next_update(group)
+        group.save()
+
+        # store data to the analytics sink, only if the sync is committed
+        on_commit(lambda: load_members(group, records_fd, load_buffer))
+
+    report_sync(group, stats['members'], time.perf_counter() - start)
+    for name, value in stats.items():
+        logger.info(
+            f'{group.urlname}: {value.inserted} {name} inserted, '
+            f'{value.updated} updated, {value.unchanged} unchanged')
+    logger.info(f'{group.urlname}: {removed} members removed, next update '
+                f'in {group.members_update_interval} days')
+    return stats
+
+
+def report_sync(group: MeetupGroup, member_stats: UpsertStats,
+                seconds: float):
+    """
+    Report the duration of the group sync, and the number of members synced
+    """
+    metrics = get_metrics()
+    if not metrics.enabled:
         return
+    metrics.timing('sync.group', seconds)
+    metrics.incr('sync.members', member_stats.total)
+    if seconds > 0:
+        metrics.gauge('sync.members_per_second', member_stats.total / seconds)
 
-    for person in members:
-        MeetupGroupMember.from_api(group, person)
 
-    # store data to bigquery
-    try:
-        now = datetime.datetime.utcnow()
-        job_id = get_job_id(f'sync_members_{group.urlname}_{now:%Y%m%d}')
-        bigquery_upload(members, 'members', job_id=job_id, async=False)
-    except Conflict as e:
-        warnings.warn(str(e))
+def load_members(group: MeetupGroup,
+                 records_fd: BinaryIO,
+                 load_buffer: Optional[LoadBuffer] = None):
+    """
+    Add members of the group to the buffer, and start loading the batch, if
+    the buffer is full. Without the buffer, start the load of the group.
+    """
+    if load_buffer is None:
+        try:
+            now = datetime.datetime.utcnow()
+            job_id = get_job_id(f'sync_members_{group.urlname}_{now:%Y%m%d}')
+            with get_metrics().timer('analytics.load', table='members'):
+                get_sink().load_file(records_fd, 'members', job_id=job_id)
+        except DuplicateLoad as e:
+            warnings.warn(str(e))
+        return
+
+    batch = load_buffer.add(records_fd)
+    if batch is not None:
+        load_members_batch.delay(load_buffer.run_id, batch)
+
 
-    # schedule next update tomorrow at random time
-    group.members_next_update = get_random_tomorrow()
-    group.save()
+def get_members_buffer(run_id: str) -> LoadBuffer:
+    """
+    Return the buffer of members, synced by the run of sync_group_members
+    """
+    return LoadBuffer(
+        settings.CELERY_BROKER_URL,
+        'members',
+        run_id,
+        max_size=settings.ANALYTICS_LOAD_BATCH_SIZE)
 
 
-def get_random_tomorrow():
-    tom = datetime.date.today() + datetime.timedelta(days=1)
-    dt = datetime.datetime(tom.year, tom.month, tom.day)
-    dt += datetime.timedelta(minutes=random.randint(60, 23 * 60))
-    return pytz.utc.localize(dt)
+@shared_task(bind=True, max_retries=settings.MEETUP_SYNC_GROUP_MAX_RETRIES)
+def load_members_batch(self, run_id: str, batch: int):
+    """
+    Load the batch of members of the run to the analytics sink. The job id
+    is derived from the run id and the batch number, so the batch is never
+    loaded twice, even if the task is retried.
+
+    Failed loads are retried with exponential backoff. If all retries fail,
+    the batch is kept in the buffer (see LoadBuffer.keep_batch), to be
+    loaded again with load_members_batch.delay(run_id, batch)
+    """
+    load_buffer = get_members_buffer(run_id)
+    records_fd = load_buffer.get_batch(batch)
+    if records_fd is None:
+        return
+
+    metrics = get_metrics()
+    try:
+        job_id = get_job_id(f'sync_members_{run_id}_{batch}')
+        with metrics.timer('analytics.load', table='members'):
+            get_sink().load_file(
+                records_fd, 'members', job_id=job_id, async=False)
+    except DuplicateLoad as e:
+        warnings.warn(str(e))
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            countdown = settings.MEETUP_SYNC_GROUP_RETRY_DELAY * 2**(
+                self.request.retries)
+            raise self.retry(exc=e, countdown=countdown)
+        logger.exception(f'Unable to load the batch {batch} of members of '
+                         f'the run {run_id}, the batch is kept')
+        metrics.incr('analytics.load.failed', table='members')
+        load_buffer.keep_batch(batch)
+        return
+    load_buffer.delete_batch(batch)
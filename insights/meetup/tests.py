@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from itertools import combinations
+from unittest import mock
 
-# Create your tests here.
+import attr
+import numpy as np
+import pyarrow.parquet
+import pytz
+import redis
+import requests
+from celery.utils.objects import Bunch
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+from django.utils import timezone
+from google.cloud import bigquery
+
+from benchmarks.api_models import from_dict_dpath
+from benchmarks.data import group_dict, member_dict, pages
+from insights.analytics import (BigQuerySink, DuplicateLoad, LoadBuffer,
+                                LocalParquetSink)
+from insights.celery import app
+from insights.meetup import api_client, overlap, planner, tasks
+from insights.meetup.api_client import DEFAULT_PAGE_SIZE
+from insights.meetup.api_models import APIGroup, APIGroupMember
+from insights.meetup.db_utils import (UpsertStats, bulk_upsert,
+                                      get_content_hash)
+from insights.meetup.models import (APICredentials, MeetupCategory,
+                                    MeetupGroup, MeetupGroupDailyStats,
+                                    MeetupGroupFilter, MeetupGroupMember,
+                                    MeetupGroupOverlap, MeetupLocation,
+                                    MeetupMembershipEvent, MeetupUser,
+                                    token_cache)
+from insights.meetup.rate_limit import (RateLimitThrottle,
+                                        SharedTokenBucket)
+from insights.meetup.response_cache import ResponseCache, cached_json
+from insights.meetup.scheduler import (SCHEDULE_LOCK_ID, get_next_update,
+                                       get_planned_load, get_update_interval)
+from insights.utils import JSONRecordsWriter, json_dumps, json_records
+
+NOW = pytz.utc.localize(datetime.datetime(2020, 6, 1, 12))
+
+
+def create_group(group_id: int, **values) -> MeetupGroup:
+    defaults = {
+        'id': group_id,
+        'name': f'Group {group_id}',
+        'status': 'active',
+        'urlname': f'group-{group_id}',
+        'description': '',
+        'created': NOW,
+        'city': 'Porto',
+        'untranslated_city': 'Porto',
+        'country': 'pt',
+        'state': '',
+        'join_mode': 'open',
+        'visibility': 'public',
+        'lat': 41.15,
+        'lon': -8.61,
+        'members': 100,
+        'who': 'Members',
+        'organizer_id': 1,
+        'organizer_name': 'Organizer',
+        'timezone': 'Europe/Lisbon',
+        'category_id': 34,
+        'category_shortname': 'tech',
+        'meta_category_id': 292,
+        'meta_category_shortname': 'tech',
+    }
+    defaults.update(values)
+    return MeetupGroup.objects.create(**defaults)
+
+
+def get_user_row(user_id: int, **values) -> dict:
+    row = {
+        'id': user_id,
+        'name': f'User {user_id}',
+        'status': 'active',
+        'joined': NOW,
+        'city': 'Porto',
+        'country': 'pt',
+        'lat': 41.15,
+        'lon': -8.61,
+        'messaging_pref': 'all_members',
+        'privacy_bio': 'visible',
+        'privacy_groups': 'visible',
+        'privacy_topics': 'visible',
+    }
+    row.update(values)
+    return row
+
+
+def create_member(group: MeetupGroup, user_id: int,
+                  **values) -> MeetupGroupMember:
+    user = MeetupUser.objects.get_or_create(
+        id=user_id, defaults=get_user_row(user_id))[0]
+    defaults = {
+        'status': 'active',
+        'visited': NOW,
+        'created': NOW,
+        'updated': NOW,
+        'role': None,
+    }
+    defaults.update(values)
+    return MeetupGroupMember.objects.create(
+        user=user, group=group, **defaults)
+
+
+class BulkUpsertTestCase(TestCase):
+    def test_insert_and_update(self):
+        stats = bulk_upsert(
+            MeetupUser, [get_user_row(1), get_user_row(2)],
+            conflict_fields=['id'])
+        self.assertEqual(stats, UpsertStats(inserted=2))
+
+        stats = bulk_upsert(
+            MeetupUser,
+            [get_user_row(2, name='Renamed'),
+             get_user_row(3)],
+            conflict_fields=['id'])
+        self.assertEqual(stats, UpsertStats(inserted=1, updated=1))
+        self.assertEqual(MeetupUser.objects.get(id=2).name, 'Renamed')
+        self.assertEqual(MeetupUser.objects.count(), 3)
+
+    def test_missing_fields_are_not_updated(self):
+        bulk_upsert(
+            MeetupUser, [get_user_row(1, is_pro_admin=True)],
+            conflict_fields=['id'])
+        bulk_upsert(
+            MeetupUser, [get_user_row(1, name='Renamed')],
+            conflict_fields=['id'])
+        user = MeetupUser.objects.get(id=1)
+        self.assertEqual(user.name, 'Renamed')
+        self.assertTrue(user.is_pro_admin)
+
+    def test_duplicate_rows(self):
+        stats = bulk_upsert(
+            MeetupUser,
+            [get_user_row(1), get_user_row(1, name='Last')],
+            conflict_fields=['id'])
+        self.assertEqual(stats, UpsertStats(inserted=1))
+        self.assertEqual(MeetupUser.objects.get(id=1).name, 'Last')
+
+    def test_pages(self):
+        rows = [get_user_row(i) for i in range(1, 26)]
+        stats = bulk_upsert(
+            MeetupUser, rows, conflict_fields=['id'], page_size=10)
+        self.assertEqual(stats, UpsertStats(inserted=25))
+        self.assertEqual(MeetupUser.objects.count(), 25)
+
+    def test_unchanged_rows_are_skipped(self):
+        rows = [get_user_row(1), get_user_row(2)]
+        bulk_upsert(
+            MeetupUser,
+            rows,
+            conflict_fields=['id'],
+            hash_field='content_hash')
+        content_hash = MeetupUser.objects.get(id=1).content_hash
+        self.assertTrue(content_hash)
+
+        stats = bulk_upsert(
+            MeetupUser, [get_user_row(1),
+                         get_user_row(2, city='Braga')],
+            conflict_fields=['id'],
+            hash_field='content_hash')
+        self.assertEqual(stats, UpsertStats(updated=1, unchanged=1))
+        self.assertEqual(MeetupUser.objects.get(id=1).content_hash,
+                         content_hash)
+        self.assertEqual(MeetupUser.objects.get(id=2).city, 'Braga')
+
+    def test_hash_ignores_conflict_fields(self):
+        bulk_upsert(
+            MeetupUser,
+            [get_user_row(1, name='User'),
+             get_user_row(2, name='User')],
+            conflict_fields=['id'],
+            hash_field='content_hash')
+        values = get_user_row(1, name='User')
+        del values['id']
+        self.assertEqual(
+            set(MeetupUser.objects.values_list('content_hash', flat=True)),
+            {get_content_hash(values)})
+
+
+class NextUpdateTestCase(TestCase):
+    def test_least_loaded_window(self):
+        group = create_group(1, members=200 * DEFAULT_PAGE_SIZE)
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        windows = get_planned_load(tomorrow)
+        # all windows but the last one are busy
+        for i, window in enumerate(windows[:-1]):
+            create_group(
+                100 + i,
+                members=DEFAULT_PAGE_SIZE,
+                members_next_update=window.start)
+
+        with override_settings(MEETUP_API_REQUESTS_PER_WINDOW=1000):
+            next_update = get_next_update(group)
+        self.assertTrue(windows[-1].start <= next_update < windows[-1].end)
+
+    def test_spill_over_to_next_day(self):
+        group = create_group(1, members=2 * DEFAULT_PAGE_SIZE)
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        for i, window in enumerate(get_planned_load(tomorrow)):
+            create_group(
+                100 + i,
+                members=DEFAULT_PAGE_SIZE,
+                members_next_update=window.start)
+
+        # every window of tomorrow has one request of the budget of two
+        with override_settings(MEETUP_API_REQUESTS_PER_WINDOW=2):
+            next_update = get_next_update(group)
+        self.assertInDay(next_update, tomorrow + datetime.timedelta(days=1))
+
+    def test_over_budget_everywhere(self):
+        group = create_group(1, members=10 * DEFAULT_PAGE_SIZE)
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        with override_settings(MEETUP_API_REQUESTS_PER_WINDOW=2):
+            next_update = get_next_update(group)
+        self.assertInDay(next_update, tomorrow)
+
+    def assertInDay(self, time: datetime.datetime, day: datetime.date):
+        # windows of the day end after the midnight
+        windows = get_planned_load(day)
+        self.assertTrue(windows[0].start <= time < windows[-1].end)
+
+
+def try_schedule_lock() -> bool:
+    """
+    Try to take the lock of the schedule from another connection
+    """
+
+    def target():
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s)',
+                               [SCHEDULE_LOCK_ID])
+                result.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    result = []
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+class ScheduleLockTestCase(TransactionTestCase):
+    def test_lock_is_held_until_commit(self):
+        group = create_group(1)
+        with transaction.atomic():
+            group.members_next_update = get_next_update(group)
+            self.assertFalse(try_schedule_lock())
+            group.save()
+        self.assertTrue(try_schedule_lock())
+
+
+@override_settings(
+    MEETUP_MIN_UPDATE_INTERVAL_DAYS=1, MEETUP_MAX_UPDATE_INTERVAL_DAYS=14)
+class UpdateIntervalTestCase(SimpleTestCase):
+    def test_churn_resets_interval(self):
+        group = MeetupGroup(members_update_interval=8)
+        self.assertEqual(get_update_interval(group, churn=1), 1)
+
+    def test_interval_doubles_without_churn(self):
+        group = MeetupGroup(members_update_interval=1)
+        intervals = []
+        for _ in range(5):
+            group.members_update_interval = get_update_interval(
+                group, churn=0)
+            intervals.append(group.members_update_interval)
+        self.assertEqual(intervals, [2, 4, 8, 14, 14])
+
+    @override_settings(MEETUP_MIN_UPDATE_INTERVAL_DAYS=3)
+    def test_interval_is_at_least_minimum(self):
+        group = MeetupGroup(members_update_interval=1)
+        self.assertEqual(get_update_interval(group, churn=0), 3)
+
+
+class LoadBufferTestCase(SimpleTestCase):
+    def setUp(self):
+        self.buffer = LoadBuffer(
+            settings.CELERY_BROKER_URL,
+            'test',
+            uuid.uuid4().hex,
+            max_size=1 << 20)
+        self.buffer.chunk_size = 100
+
+    def tearDown(self):
+        redis = self.buffer.redis
+        keys = redis.keys(f'{self.buffer.key}*')
+        if keys:
+            redis.delete(*keys)
+        redis.srem(self.buffer.failed_key, f'{self.buffer.run_id}:1')
+
+    def add(self, records: list):
+        writer = JSONRecordsWriter()
+        writer.write(records)
+        return self.buffer.add(writer.close())
+
+    def read_batch(self, batch: int) -> list:
+        fileobj = self.buffer.get_batch(batch)
+        with gzip.GzipFile(fileobj=fileobj, mode='rb') as gzip_fd:
+            return [json.loads(line) for line in gzip_fd]
+
+    def test_add_and_take(self):
+        self.assertIsNone(self.buffer.take())
+        records = [{'id': i, 'name': f'User {i}'} for i in range(1000)]
+        self.assertIsNone(self.add(records[:600]))
+        self.assertIsNone(self.add(records[600:]))
+        # files are split into several chunks
+        file_keys = self.buffer.redis.lrange(self.buffer.key, 0, -1)
+        self.assertGreater(self.buffer.redis.llen(file_keys[0]), 1)
+
+        batch = self.buffer.take()
+        self.assertEqual(batch, 1)
+        self.assertIsNone(self.buffer.take())
+        self.assertEqual(self.read_batch(batch), records)
+
+    def test_take_when_full(self):
+        self.buffer.max_size = 1
+        self.assertEqual(self.add([{'id': 1}]), 1)
+        self.assertEqual(self.add([{'id': 2}]), 2)
+        self.assertEqual(self.read_batch(2), [{'id': 2}])
+
+    def test_delete_batch(self):
+        self.add([{'id': 1}])
+        batch = self.buffer.take()
+        redis = self.buffer.redis
+        keys = [f'{self.buffer.key}:{batch}'] + redis.lrange(
+            f'{self.buffer.key}:{batch}', 0, -1)
+        self.buffer.delete_batch(batch)
+        self.assertIsNone(self.buffer.get_batch(batch))
+        self.assertEqual(redis.exists(*keys), 0)
+
+    def test_keep_batch(self):
+        self.add([{'id': 1}])
+        batch = self.buffer.take()
+        self.buffer.keep_batch(batch)
+        redis = self.buffer.redis
+        batch_key = f'{self.buffer.key}:{batch}'
+        for key in [batch_key] + redis.lrange(batch_key, 0, -1):
+            self.assertEqual(redis.ttl(key), -1)
+        failed = f'{self.buffer.run_id}:{batch}'.encode()
+        self.assertIn(failed, redis.smembers(self.buffer.failed_key))
+        self.assertEqual(self.read_batch(batch), [{'id': 1}])
+
+        self.buffer.delete_batch(batch)
+        self.assertNotIn(failed, redis.smembers(self.buffer.failed_key))
+
+
+class MembershipEventTestCase(TestCase):
+    def setUp(self):
+        self.group = create_group(1)
+
+    def get_member_row(self, user_id: int, **values) -> dict:
+        MeetupUser.objects.get_or_create(
+            id=user_id, defaults=get_user_row(user_id))
+        row = {
+            'user_id': user_id,
+            'group_id': self.group.id,
+            'role': None,
+            'created': NOW,
+        }
+        row.update(values)
+        return row
+
+    def get_events(self) -> list:
+        return list(
+            MeetupMembershipEvent.objects.filter(group=self.group).order_by(
+                'user_id', 'id').values_list('user_id', 'kind', 'role'))
+
+    def test_log_changes(self):
+        create_member(self.group, 1)
+        create_member(self.group, 2, role='organizer')
+        create_member(self.group, 3, departed=NOW)
+        joined = NOW - datetime.timedelta(days=3)
+
+        dates = MeetupMembershipEvent.log_changes(self.group, [
+            self.get_member_row(1),
+            self.get_member_row(2, role='coorganizer'),
+            self.get_member_row(3, created=joined),
+            self.get_member_row(4, created=joined),
+        ])
+        self.assertEqual(self.get_events(), [
+            (2, MeetupMembershipEvent.ROLE, 'coorganizer'),
+            (3, MeetupMembershipEvent.JOIN, None),
+            (4, MeetupMembershipEvent.JOIN, None),
+        ])
+        # joins are timed with the date of joining, role changes with now
+        self.assertEqual(
+            dates,
+            Counter({
+                joined.date(): 2,
+                timezone.now().astimezone(pytz.utc).date(): 1
+            }))
+        # the member who came back is active again
+        self.assertIsNone(
+            MeetupGroupMember.objects.get(group=self.group,
+                                          user_id=3).departed)
+
+    def test_unchanged_members(self):
+        create_member(self.group, 1, role='organizer')
+        dates = MeetupMembershipEvent.log_changes(
+            self.group, [self.get_member_row(1, role='organizer')])
+        self.assertEqual(dates, Counter())
+        self.assertEqual(self.get_events(), [])
+
+    def test_mark_departed(self):
+        for user_id in range(1, 5):
+            create_member(self.group, user_id)
+        MeetupGroupMember.objects.filter(user_id=4).update(departed=NOW)
+        create_member(create_group(2), 3)
+
+        self.assertEqual(
+            MeetupGroupMember.mark_departed(self.group, {1}), 2)
+        self.assertEqual(self.get_events(), [
+            (2, MeetupMembershipEvent.LEAVE, None),
+            (3, MeetupMembershipEvent.LEAVE, None),
+        ])
+        self.assertEqual(
+            set(
+                MeetupGroupMember.objects.filter(
+                    departed=None).values_list('group_id', 'user_id')),
+            {(1, 1), (2, 3)})
+        # departed members are not marked again
+        self.assertEqual(
+            MeetupGroupMember.mark_departed(self.group, {1}), 0)
+
+
+def at_noon(day: datetime.date) -> datetime.datetime:
+    return pytz.utc.localize(datetime.datetime.combine(day, datetime.time(12)))
+
+
+class DailyStatsTestCase(TestCase):
+    def setUp(self):
+        self.group = create_group(1)
+        self.today = timezone.now().date()
+
+    def days_ago(self, days: int) -> datetime.date:
+        return self.today - datetime.timedelta(days=days)
+
+    def log_event(self, user_id: int, kind: str, day: datetime.date):
+        MeetupMembershipEvent.objects.create(
+            group=self.group, user_id=user_id, kind=kind, time=at_noon(day))
+
+    def get_rows(self) -> dict:
+        return {
+            row.pop('date'): row
+            for row in MeetupGroupDailyStats.objects.filter(
+                group=self.group).values('date', 'members', 'active_members',
+                                         'joins', 'leaves', 'role_changes')
+        }
+
+    def test_update_for_sync(self):
+        now = timezone.now()
+        create_member(self.group, 1, visited=now)
+        create_member(self.group, 2, visited=now - datetime.timedelta(40))
+        create_member(self.group, 3, visited=now, departed=now)
+        create_member(create_group(2), 4, visited=now)
+        self.log_event(1, MeetupMembershipEvent.JOIN, self.today)
+        self.log_event(3, MeetupMembershipEvent.LEAVE, self.today)
+        self.log_event(2, MeetupMembershipEvent.ROLE, self.days_ago(1))
+        self.log_event(2, MeetupMembershipEvent.JOIN, self.days_ago(2))
+
+        MeetupGroupDailyStats.objects.update_for_sync(
+            self.group, [self.days_ago(1)])
+        self.assertEqual(
+            self.get_rows(), {
+                self.today: {
+                    'members': 2,
+                    'active_members': 1,
+                    'joins': 1,
+                    'leaves': 1,
+                    'role_changes': 0,
+                },
+                self.days_ago(1): {
+                    'members': None,
+                    'active_members': None,
+                    'joins': 0,
+                    'leaves': 0,
+                    'role_changes': 1,
+                },
+            })
+
+        # the second sync of the day replaces numbers of the first one
+        MeetupGroupMember.objects.filter(user_id=2).update(visited=now)
+        MeetupGroupDailyStats.objects.update_for_sync(self.group, [])
+        self.assertEqual(self.get_rows()[self.today]['active_members'], 2)
+
+    def test_rebuild(self):
+        create_member(self.group, 1, created=at_noon(self.days_ago(5)))
+        create_member(self.group, 2, created=at_noon(self.days_ago(3)))
+        create_member(
+            self.group,
+            3,
+            created=at_noon(self.days_ago(5)),
+            departed=at_noon(self.days_ago(1)))
+        self.log_event(1, MeetupMembershipEvent.JOIN, self.days_ago(5))
+        self.log_event(2, MeetupMembershipEvent.JOIN, self.days_ago(3))
+        self.log_event(3, MeetupMembershipEvent.LEAVE, self.days_ago(1))
+        MeetupGroupDailyStats.objects.create(
+            group=self.group,
+            date=self.today,
+            members=10,
+            active_members=7,
+            joins=5)
+
+        MeetupGroupDailyStats.objects.rebuild(
+            self.group.id, self.days_ago(4))
+        rows = self.get_rows()
+        self.assertEqual(
+            {day: row['members']
+             for day, row in rows.items()}, {
+                 self.days_ago(5): None,
+                 self.days_ago(4): 2,
+                 self.days_ago(3): 3,
+                 self.days_ago(2): 3,
+                 self.days_ago(1): 2,
+                 self.today: 2,
+             })
+        self.assertEqual(
+            {day: (row['joins'], row['leaves'])
+             for day, row in rows.items()}, {
+                 self.days_ago(5): (1, 0),
+                 self.days_ago(4): (0, 0),
+                 self.days_ago(3): (1, 0),
+                 self.days_ago(2): (0, 0),
+                 self.days_ago(1): (0, 1),
+                 self.today: (0, 0),
+             })
+        # active members can't be restored, and are kept
+        self.assertEqual(rows[self.today]['active_members'], 7)
+
+    def test_members_by_city(self):
+        other = create_group(2, city='Braga')
+        for group, day, members in [(self.group, 2, 10),
+                                    (self.group, 1, 12),
+                                    (self.group, 0, None),
+                                    (other, 3, 5)]:
+            MeetupGroupDailyStats.objects.create(
+                group=group,
+                date=self.days_ago(day),
+                members=members,
+                active_members=members and members // 2)
+
+        self.assertEqual(
+            list(MeetupGroupDailyStats.objects.members_by_city()), [{
+                'group__country': 'pt',
+                'group__city': 'Porto',
+                'groups': 1,
+                'members': 12,
+                'active_members': 6,
+            }, {
+                'group__country': 'pt',
+                'group__city': 'Braga',
+                'groups': 1,
+                'members': 5,
+                'active_members': 2,
+            }])
+        # Django's latest() is not overridden
+        self.assertEqual(
+            MeetupGroupDailyStats.objects.latest('date').date, self.today)
+
+
+def count_pairs(users: np.ndarray, groups: np.ndarray) -> Counter:
+    """
+    Count shared members of every pair of groups, one pair at a time
+    """
+    members = {}
+    for user, group in zip(users.tolist(), groups.tolist()):
+        members.setdefault(group, set()).add(user)
+    return Counter({(a, b): len(members[a] & members[b])
+                    for a, b in combinations(sorted(members), 2)
+                    if members[a] & members[b]})
+
+
+class CountOverlapsTestCase(SimpleTestCase):
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.users = random.randint(1, 300, size=2000)
+        self.groups = random.randint(1, 40, size=2000) * 10
+
+    def get_pairs(self, overlaps: overlap.Overlaps) -> Counter:
+        return Counter(
+            dict(
+                zip(
+                    zip(overlaps.group_a.tolist(),
+                        overlaps.group_b.tolist()),
+                    overlaps.members.tolist())))
+
+    def test_all_groups(self):
+        overlaps = overlap.count_overlaps(self.users, self.groups)
+        self.assertEqual(
+            self.get_pairs(overlaps), count_pairs(self.users, self.groups))
+
+    def test_many_pairs(self):
+        with mock.patch.object(overlap, 'MAX_BINCOUNT_PAIRS', 0):
+            overlaps = overlap.count_overlaps(self.users, self.groups)
+        self.assertEqual(
+            self.get_pairs(overlaps), count_pairs(self.users, self.groups))
+
+    def test_only_groups(self):
+        overlaps = overlap.count_overlaps(
+            self.users, self.groups, only_groups=[10, 200])
+        expected = Counter({
+            pair: members
+            for pair, members in count_pairs(self.users,
+                                             self.groups).items()
+            if {10, 200} & set(pair)
+        })
+        self.assertEqual(self.get_pairs(overlaps), expected)
+
+    def test_no_pairs(self):
+        overlaps = overlap.count_overlaps(
+            np.array([1, 2, 2]), np.array([10, 10, 10]))
+        self.assertEqual(len(overlaps), 0)
+
+    def test_jaccard(self):
+        overlaps = overlap.count_overlaps(
+            np.array([1, 1, 2, 2, 3]), np.array([10, 20, 10, 20, 20]))
+        overlap.add_jaccard(overlaps, np.array([10, 20]), np.array([2, 3]))
+        self.assertEqual(overlaps.members.tolist(), [2])
+        self.assertEqual(overlaps.jaccard.tolist(), [2 / 3])
+
+
+class RefreshOverlapsTestCase(TestCase):
+    def test_refresh_groups(self):
+        groups = [create_group(group_id) for group_id in (1, 2, 3)]
+        for user_id, group_ids in [(1, [1, 2, 3]), (2, [1, 2]), (3, [2, 3])]:
+            for group_id in group_ids:
+                create_member(groups[group_id - 1], user_id)
+        MeetupGroupMember.objects.filter(
+            user_id=3, group_id=3).update(departed=NOW)
+
+        self.assertEqual(overlap.refresh_overlaps(), 3)
+        self.assertEqual(self.get_overlaps(), {
+            (1, 2, 2, round(2 / 3, 6)),
+            (1, 3, 1, 0.5),
+            (2, 3, 1, round(1 / 3, 6)),
+        })
+
+        MeetupGroupMember.objects.filter(user_id=2).update(departed=NOW)
+        self.assertEqual(overlap.refresh_overlaps([1]), 2)
+        # only pairs with the given groups are refreshed
+        self.assertEqual(self.get_overlaps(), {
+            (1, 2, 1, 0.5),
+            (1, 3, 1, 1.0),
+            (2, 3, 1, round(1 / 3, 6)),
+        })
+
+    def get_overlaps(self) -> set:
+        return {(a, b, members, round(jaccard, 6))
+                for a, b, members, jaccard in
+                MeetupGroupOverlap.objects.values_list(
+                    'group_a_id', 'group_b_id', 'members', 'jaccard')}
+
+    def test_lock(self):
+        with overlap.overlaps_lock() as locked:
+            self.assertTrue(locked)
+            self.assertEqual(self.count_advisory_locks(), 1)
+        self.assertEqual(self.count_advisory_locks(), 0)
+
+    def count_advisory_locks(self) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' "
+                "AND objid = %s", [overlap.OVERLAPS_LOCK_ID])
+            return cursor.fetchone()[0]
+
+
+@mock.patch.object(tasks, 'finish_sync_run')
+class SyncFailedTestCase(TestCase):
+    def setUp(self):
+        self.lease = timezone.now() + datetime.timedelta(hours=3)
+        self.next_update = timezone.now() + datetime.timedelta(days=2)
+        create_group(1, members_next_update=self.lease)
+        create_group(2, members_next_update=self.next_update)
+        self.errback = tasks.sync_group_members_failed.s(
+            run_id='run', lease=self.lease.isoformat())
+
+    def test_callback_failed(self, finish_sync_run):
+        request = Bunch(
+            id='callback', root_id=None, errbacks=[dict(self.errback)])
+        app.backend._call_task_errbacks(request, RuntimeError(), None)
+        finish_sync_run.assert_called_once_with('run')
+        self.assertLeaseReleased()
+
+    def test_subtask_failed(self, finish_sync_run):
+        # errbacks of the chord get the id of the callback only
+        self.errback('callback')
+        finish_sync_run.assert_called_once_with('run')
+        self.assertLeaseReleased()
+
+    def assertLeaseReleased(self):
+        self.assertLessEqual(
+            MeetupGroup.objects.get(id=1).members_next_update,
+            timezone.now())
+        self.assertEqual(
+            MeetupGroup.objects.get(id=2).members_next_update,
+            self.next_update)
+
+
+def create_credentials(expires_in: int = 3600) -> APICredentials:
+    return APICredentials.objects.create(
+        id=1,
+        access_token='token',
+        refresh_token='refresh',
+        expires_at=timezone.now() + datetime.timedelta(seconds=expires_in))
+
+
+def get_oauth_response() -> dict:
+    return {
+        'access_token': 'new-token',
+        'refresh_token': 'new-refresh',
+        'expires_in': 3600,
+    }
+
+
+class AccessTokenTestCase(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def test_cached(self):
+        create_credentials()
+        self.assertEqual(APICredentials.get_access_token(), 'token')
+        APICredentials.objects.update(access_token='other')
+        with self.assertNumQueries(0):
+            self.assertEqual(APICredentials.get_access_token(), 'token')
+
+        # other processes get the token from Redis
+        token_cache.access_token = None
+        with self.assertNumQueries(0):
+            self.assertEqual(APICredentials.get_access_token(), 'token')
+
+    @mock.patch('insights.meetup.models.requests.post')
+    def test_expired(self, post):
+        post.return_value.json.return_value = get_oauth_response()
+        create_credentials(expires_in=-1)
+        self.assertEqual(APICredentials.get_access_token(), 'new-token')
+        self.assertEqual(post.call_args[1]['timeout'],
+                         settings.MEETUP_OAUTH_TIMEOUT)
+        self.assertEqual(APICredentials.objects.get().access_token,
+                         'new-token')
+
+        # the cached token expires in memory and in Redis
+        token_cache.expires_at = timezone.now()
+        token_cache.redis.delete(token_cache.key)
+        APICredentials.objects.update(
+            access_token='token', expires_at=timezone.now())
+        self.assertEqual(APICredentials.get_access_token(), 'new-token')
+        self.assertEqual(post.call_count, 2)
+
+    def test_redis_errors(self):
+        create_credentials()
+        broken = mock.Mock()
+        broken.hgetall.side_effect = redis.ConnectionError
+        broken.delete.side_effect = redis.ConnectionError
+        broken.pipeline.return_value.execute.side_effect = redis.TimeoutError
+        broken.lock.return_value.acquire.side_effect = redis.ConnectionError
+        with mock.patch.object(token_cache, 'redis', broken):
+            self.assertEqual(APICredentials.get_access_token(), 'token')
+            with self.assertNumQueries(0):
+                self.assertEqual(APICredentials.get_access_token(), 'token')
+            token_cache.clear()
+
+
+class AccessTokenInvalidationTestCase(TransactionTestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def test_cleared_on_commit(self):
+        create_credentials()
+        self.assertEqual(APICredentials.get_access_token(), 'token')
+        with transaction.atomic():
+            APICredentials.update_from_oauth(get_oauth_response())
+            self.assertEqual(token_cache.get(), 'token')
+        self.assertIsNone(token_cache.get())
+        self.assertEqual(APICredentials.get_access_token(), 'new-token')
+
+
+class SharedTokenBucketTestCase(SimpleTestCase):
+    def setUp(self):
+        self.key = f'{SharedTokenBucket.key}:{uuid.uuid4().hex}'
+
+    def get_bucket(self) -> SharedTokenBucket:
+        bucket = SharedTokenBucket(
+            settings.CELERY_BROKER_URL, rate=10, capacity=2)
+        bucket.key = self.key
+        self.addCleanup(bucket.redis.delete, self.key)
+        return bucket
+
+    def test_shared_by_processes(self):
+        first, second = self.get_bucket(), self.get_bucket()
+        self.assertLessEqual(first.reserve(), 0)
+        self.assertLessEqual(second.reserve(), 0)
+        # the bucket is empty, requests of both processes wait in turn
+        self.assertAlmostEqual(first.reserve(), 0.1, delta=0.05)
+        self.assertAlmostEqual(second.reserve(), 0.2, delta=0.05)
+
+    @mock.patch('insights.meetup.rate_limit.time.sleep')
+    def test_acquire(self, sleep):
+        bucket = self.get_bucket()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.1, delta=0.05)
+
+    @mock.patch('insights.meetup.rate_limit.time.sleep')
+    def test_redis_errors(self, sleep):
+        bucket = self.get_bucket()
+        with mock.patch.object(
+                bucket, 'reserve', side_effect=redis.ConnectionError):
+            for _ in range(3):
+                bucket.acquire()
+        # requests are limited by the bucket of the process
+        self.assertEqual(sleep.call_count, 1)
+
+
+def get_api_member(member_id: int, **values) -> APIGroupMember:
+    member = APIGroupMember.from_dict({
+        'id': member_id,
+        'name': f'Member {member_id}',
+        'joined': 1500000000000,
+        'lat': 41.15,
+        'lon': -8.61,
+        'is_pro_admin': False,
+        'group_profile': {
+            'created': 1500000000000,
+            'group': {
+                'id': 1,
+                'urlname': 'pyporto'
+            },
+        },
+    })
+    return attr.evolve(member, date=datetime.date(2020, 6, 1), **values)
+
+
+class LocalParquetSinkTestCase(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.sink = LocalParquetSink(self.path)
+
+    def read_table(self, job_id: str):
+        return pyarrow.parquet.read_table(
+            os.path.join(self.path, 'members', 'date=2020-06-01',
+                         f'{job_id}.parquet'))
+
+    def test_schema_of_null_fields(self):
+        self.sink.load([get_api_member(1)], 'members', job_id='values')
+        self.sink.load(
+            [get_api_member(2, lat=None, lon=None, is_pro_admin=None)],
+            'members',
+            job_id='nulls')
+        values, nulls = self.read_table('values'), self.read_table('nulls')
+        self.assertEqual(values.schema, nulls.schema)
+        self.assertEqual(
+            values.schema.field_by_name('lat').type, pyarrow.float64())
+        self.assertEqual(
+            values.schema.field_by_name('group_role').type, pyarrow.string())
+        self.assertTrue(
+            pyarrow.types.is_timestamp(
+                values.schema.field_by_name('joined').type))
+        self.assertEqual(nulls.to_pydict()['lat'], [None])
+        self.assertEqual(values.to_pydict()['joined'],
+                         [datetime.datetime(2017, 7, 14, 2, 40)])
+
+    def test_duplicate_load(self):
+        self.sink.load_file(
+            json_records([get_api_member(1)]), 'members', job_id='job')
+        with self.assertRaises(DuplicateLoad):
+            self.sink.load_file(
+                json_records([get_api_member(1)]), 'members', job_id='job')
+
+
+class BigQuerySinkTestCase(SimpleTestCase):
+    def test_setup(self):
+        sink = BigQuerySink('dataset')
+        sink._client = mock.Mock()
+        sink._client.dataset.side_effect = partial(
+            bigquery.DatasetReference, 'project')
+        sink.setup()
+        tables = {
+            table.table_id: table
+            for (table, ), _ in sink._client.create_table.call_args_list
+        }
+        self.assertEqual(set(tables), {'groups', 'members'})
+        members = tables['members']
+        self.assertEqual(members.time_partitioning.field, 'date')
+        self.assertEqual(members.clustering_fields, ['group_urlname'])
+        types = {field.name: field.field_type for field in members.schema}
+        self.assertEqual(types['date'], 'DATE')
+        self.assertEqual(types['group_urlname'], 'STRING')
+        self.assertEqual(types['group_id'], 'INT64')
+        self.assertEqual(types['joined'], 'TIMESTAMP')
+        self.assertNotIn('name', types)
+
+
+class SearchViewTestCase(TestCase):
+    def setUp(self):
+        create_group(1, name='Python Porto')
+        MeetupGroup.objects.update_search_vectors([1])
+        MeetupUser.objects.create(**get_user_row(1))
+
+    def test_groups(self):
+        resp = self.client.get(reverse('meetup-search'), {'q': 'pyth'})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([group['urlname'] for group in data['groups']],
+                         ['group-1'])
+        # users are not public
+        self.assertNotIn('users', data)
+
+    def test_users_for_staff(self):
+        self.client.force_login(
+            User.objects.create(username='staff', is_staff=True))
+        # too short to search users, which needs pg_trgm
+        resp = self.client.get(reverse('meetup-search'), {'q': 'us'})
+        self.assertEqual(resp.json()['users'], [])
+
+    def test_not_cached(self):
+        url = reverse('meetup-search')
+        self.client.get(url, {'q': 'pyth'})
+        MeetupGroup.objects.all().delete()
+        resp = self.client.get(url, {'q': 'pyth'})
+        self.assertEqual(resp.json()['groups'], [])
+
+
+class ResponseCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = ResponseCache(settings.INSIGHTS_API_CACHE_URL, ttl=60)
+        prefix = f'insights:test:{uuid.uuid4().hex}'
+        self.cache.version_key = f'{prefix}:version'
+        self.cache.key_prefix = f'{prefix}:response'
+        self.addCleanup(self.delete_keys, prefix)
+        self.calls = []
+
+        @cached_json(self.cache, params={'days': int, 'country': str.lower})
+        def view(request, urlname):
+            self.calls.append((urlname, request.GET.get('days')))
+            return {'urlname': urlname, 'calls': len(self.calls)}
+
+        self.view = view
+
+    def delete_keys(self, prefix: str):
+        keys = self.cache.redis.keys(f'{prefix}:*')
+        if keys:
+            self.cache.redis.delete(*keys)
+
+    def get(self, urlname: str = 'pyporto', params: dict = None, **headers):
+        request = RequestFactory().get('/', params or {}, **headers)
+        return self.view(request, urlname=urlname)
+
+    def test_hits_and_misses(self):
+        self.assertEqual(self.get().content, self.get().content)
+        self.assertEqual(len(self.calls), 1)
+        self.get('other')
+        self.get(params={'days': 30})
+        self.assertEqual(len(self.calls), 3)
+
+    def test_normalized_params(self):
+        self.get(params={'country': 'pt', 'days': 30})
+        # unknown parameters are ignored, values are normalized
+        self.get(params={'country': 'PT', 'days': '030', 'x': 1})
+        self.assertEqual(len(self.calls), 1)
+        self.get(params={'country': 'pt', 'days': 'all'})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_invalidate(self):
+        self.get()
+        self.cache.invalidate()
+        self.assertEqual(json.loads(self.get().content)['calls'], 2)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # ETags of other resources and old versions don't match
+        self.assertEqual(
+            self.get('other', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        resp = self.get(params={'days': 30}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.cache.invalidate()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CompiledParserTestCase(SimpleTestCase):
+    def test_members_match_dpath(self):
+        for page in pages(member_dict, 100, page_size=50):
+            for record in page:
+                self.assertParsedLikeDpath(APIGroupMember, record)
+
+    def test_groups_match_dpath(self):
+        for page in pages(group_dict, 100, page_size=50):
+            for record in page:
+                self.assertParsedLikeDpath(APIGroup, record)
+
+    def test_missing_values_match_dpath(self):
+        record = group_dict(1)
+        del record['organizer']
+        del record['members']
+        record['next_event']['yes_rsvp_count'] = 'many'
+        self.assertParsedLikeDpath(APIGroup, record)
+
+        record = member_dict(1)
+        del record['group_profile']
+        del record['joined']
+        self.assertParsedLikeDpath(APIGroupMember, record)
+
+    def assertParsedLikeDpath(self, cls, record: dict):
+        self.assertEqual(
+            attr.asdict(cls.from_dict(record)),
+            attr.asdict(from_dict_dpath(cls, record)))
+
+
+class GroupQueryPlanTestCase(TestCase):
+    def setUp(self):
+        categories = [
+            MeetupCategory.objects.create(
+                id=category_id, shortname=f'c{category_id}', name='Category')
+            for category_id in (34, 292, 1)
+        ]
+        locations = [
+            MeetupLocation.objects.create(country=country, location=location)
+            for country, location in [('pt', 'Porto'), ('pt', 'Lisbon'),
+                                      ('es', 'Porto')]
+        ]
+        self.filters = [
+            MeetupGroupFilter.objects.create(
+                category=category, location=location)
+            for location in locations for category in categories
+        ]
+
+    def test_filters_are_covered_once(self):
+        queries = planner.plan_group_queries(self.filters)
+        self.assertEqual(
+            sorted((query.country, query.location) for query in queries),
+            [('es', 'Porto'), ('pt', 'Lisbon'), ('pt', 'Porto')])
+        planned = Counter(
+            filt for query in queries for filt in query.filters)
+        self.assertEqual(planned, Counter(self.filters))
+        for query in queries:
+            self.assertEqual(query.categories, [1, 34, 292])
+            for filt in query.filters:
+                self.assertEqual(
+                    (filt.location.country, filt.location.location),
+                    (query.country, query.location))
+
+    def test_groups_are_mapped_by_category(self):
+        queries = planner.plan_group_queries(self.filters)
+        results = {}
+        for i, query in enumerate(queries):
+            results[query] = [
+                attr.evolve(
+                    APIGroup.from_dict(group_dict(i * 10 + j)),
+                    category_id=category_id)
+                for j, category_id in enumerate([34, 34, 292, 999])
+            ]
+
+        groups_by_filter = planner.map_groups_to_filters(results)
+        self.assertEqual(set(groups_by_filter), set(self.filters))
+        for query, groups in results.items():
+            for filt in query.filters:
+                self.assertEqual(groups_by_filter[filt], [
+                    group for group in groups
+                    if group.category_id == filt.category_id
+                ])
+
+    def test_queries_run_in_parallel(self):
+        queries = planner.plan_group_queries(self.filters)
+        groups = [APIGroup.from_dict(group_dict(1))]
+        with mock.patch.object(
+                planner.api_client, 'find_groups',
+                return_value=groups) as find_groups:
+            results = planner.run_group_queries(queries, max_workers=2)
+        self.assertEqual(list(results), queries)
+        self.assertEqual(list(results.values()), [groups] * len(queries))
+        self.assertEqual(
+            sorted(call[1]['location']
+                   for call in find_groups.call_args_list),
+            ['Lisbon', 'Porto', 'Porto'])
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    Handler which responds with the next status of server.statuses, and
+    200 when they run out
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SessionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StatusHandler)
+        self.server.statuses = []
+        self.server.requests = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://{}:{}/'.format(*self.server.server_address)
+
+    @override_settings(MEETUP_API_MAX_RETRIES=3, MEETUP_API_RETRY_BACKOFF=0)
+    def test_retries_server_errors(self):
+        self.server.statuses = [503, 502]
+        resp = api_client.create_session().get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+
+    @override_settings(MEETUP_API_MAX_RETRIES=1, MEETUP_API_RETRY_BACKOFF=0)
+    def test_returns_last_error(self):
+        self.server.statuses = [503] * 5
+        resp = api_client.create_session().get(self.url)
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.statuses = [404]
+        resp = api_client.create_session().get(self.url)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_jittered_backoff(self):
+        retry = api_client.JitteredRetry(total=5, backoff_factor=1)
+        for _ in range(3):
+            retry = retry.increment(method='GET', url=self.url)
+        with mock.patch.object(
+                api_client.random, 'uniform', return_value=1.5) as uniform:
+            self.assertEqual(retry.get_backoff_time(), 1.5)
+        uniform.assert_called_once_with(0, 4)
+
+    def test_session_per_process(self):
+        session = api_client.get_session()
+        self.assertIs(api_client.get_session(), session)
+        with mock.patch.object(
+                api_client.os, 'getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(api_client.get_session(), session)
+
+
+def get_api_response(status: int, content=(), **headers) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers)
+    resp._content = json.dumps(content).encode('utf-8')
+    return resp
+
+
+class RateLimitRetryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.throttle = RateLimitThrottle(settings.CELERY_BROKER_URL)
+        self.throttle.redis.delete(self.throttle.key)
+        self.addCleanup(self.throttle.redis.delete, self.throttle.key)
+        self.session = mock.Mock()
+        patches = [
+            mock.patch.object(api_client, 'throttle', self.throttle),
+            mock.patch.object(api_client, 'rate_limiter'),
+            mock.patch.object(
+                api_client, 'get_session', return_value=self.session),
+            mock.patch.object(
+                APICredentials, 'get_access_token', return_value='token'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_page_is_requested_again(self):
+        url = 'https://api.meetup.com/pyporto/members'
+        self.session.get.side_effect = [
+            get_api_response(429, **{'X-RateLimit-Reset': '30'}),
+            get_api_response(
+                200, [{'id': 1}],
+                Link=f'<{url}?page=1&offset=1>; rel="next"'),
+            get_api_response(429, **{'Retry-After': '5'}),
+            get_api_response(
+                200, [{'id': 2}], **{
+                    'X-RateLimit-Remaining': '10',
+                    'X-RateLimit-Reset': '60'
+                }),
+        ]
+        with mock.patch('insights.meetup.rate_limit.time') as clock:
+            # sleeping moves the clock forward
+            now = time.time()
+            clock.time.side_effect = lambda: now + sum(
+                call[0][0] for call in clock.sleep.call_args_list)
+            pages = list(api_client.iter_pages_v3(url, page_size=1))
+
+        self.assertEqual(pages, [[{'id': 1}], [{'id': 2}]])
+        self.assertEqual(
+            [call[0][0] for call in self.session.get.call_args_list], [
+                f'{url}?page=1',
+                f'{url}?page=1',
+                f'{url}?page=1&offset=1',
+                f'{url}?page=1&offset=1',
+            ])
+        self.assertEqual(clock.sleep.call_args_list,
+                         [mock.call(30), mock.call(5)])
+        self.assertEqual(
+            int(self.throttle.redis.hget(self.throttle.key, 'remaining')), 10)
+
+    @override_settings(MEETUP_API_MAX_THROTTLE_RETRIES=2)
+    def test_too_many_retries(self):
+        self.session.get.return_value = get_api_response(
+            429, **{'X-RateLimit-Reset': '1'})
+        with mock.patch('insights.meetup.rate_limit.time.sleep'):
+            with self.assertRaises(requests.HTTPError):
+                api_client.get_page('https://api.meetup.com/find/groups')
+        self.assertEqual(self.session.get.call_count, 3)
+
+
+def read_records(fileobj) -> list:
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gzip_fd:
+        return gzip_fd.read().decode('utf-8').splitlines()
+
+
+class JSONRecordsWriterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.members = [get_api_member(i) for i in range(1, 251)]
+
+    def test_pages_match_one_list(self):
+        writer = JSONRecordsWriter(batch_size=30)
+        for i in range(0, len(self.members), 100):
+            writer.write(self.members[i:i + 100])
+        self.assertEqual(writer.count, len(self.members))
+        self.assertEqual(
+            read_records(writer.close()),
+            [json_dumps(member) for member in self.members])
+
+    def test_roll_over_to_disk(self):
+        small = JSONRecordsWriter(max_size=1 << 20)
+        small.write(self.members)
+        self.assertFalse(small.close()._rolled)
+
+        large = JSONRecordsWriter(max_size=1024)
+        large.write(self.members)
+        fileobj = large.close()
+        self.assertTrue(fileobj._rolled)
+        self.assertEqual(
+            read_records(fileobj),
+            [json_dumps(member) for member in self.members])
+
+    def test_write_records(self):
+        writer = JSONRecordsWriter()
+        writer.write(self.members[:10])
+        writer.write_records(json_records(self.members[10:]), block_size=100)
+        self.assertEqual(writer.count, len(self.members))
+        self.assertEqual(
+            read_records(writer.close()),
+            [json_dumps(member) for member in self.members])
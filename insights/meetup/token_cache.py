@@ -0,0 +1,103 @@
+"""
+Cache of the API access token. The token is kept in memory of the process
+and in Redis (the Celery broker), so that it's shared by all processes and
+doesn't have to be read from the database before every API request.
+
+Redis errors are ignored: the token is read from the database then, and
+refreshes are serialized by the lock of the database row only.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+
+import pytz
+import redis
+from django.utils import timezone
+
+
+class AccessTokenCache(object):
+    key = 'insights:meetup:access_token'
+    lock_key = 'insights:meetup:access_token:lock'
+
+    def __init__(self, redis_url: str, lock_timeout: int = 60):
+        self.redis = redis.Redis.from_url(redis_url)
+        self.lock_timeout = lock_timeout
+        # serializes cache misses between threads of the process
+        self.local_lock = threading.Lock()
+        self.access_token = None
+        self.expires_at = None
+
+    def get(self):
+        """
+        Return the access token from the memory of the process, or None, if
+        there's no token or it's expired
+        """
+        if self.access_token and self.expires_at > timezone.now():
+            return self.access_token
+        return None
+
+    def get_shared(self):
+        """
+        Return the access token from Redis, or None, if there's no token or
+        it's expired. The token is copied to the memory of the process.
+        """
+        try:
+            state = self.redis.hgetall(self.key)
+        except redis.RedisError:
+            return None
+        if not state:
+            return None
+        self.access_token = state[b'access_token'].decode('utf-8')
+        self.expires_at = pytz.utc.localize(
+            datetime.datetime.utcfromtimestamp(float(state[b'expires_at'])))
+        return self.get()
+
+    def set(self, access_token: str, expires_at: datetime.datetime):
+        """
+        Store the token in memory of the process and in Redis until expires
+        """
+        self.access_token = access_token
+        self.expires_at = expires_at
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hmset(self.key, {
+                'access_token': access_token,
+                'expires_at': expires_at.timestamp(),
+            })
+            pipe.expireat(self.key, int(expires_at.timestamp()))
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def clear(self):
+        self.access_token = None
+        self.expires_at = None
+        try:
+            self.redis.delete(self.key)
+        except redis.RedisError:
+            pass
+
+    @contextmanager
+    def refresh_lock(self):
+        """
+        Hold the lock which makes sure that only one process at a time
+        refreshes the token, while others wait for it. If the lock can't
+        be taken (Redis is unavailable, or the wait times out), the block
+        runs without it
+        """
+        lock = self.redis.lock(
+            self.lock_key,
+            timeout=self.lock_timeout,
+            blocking_timeout=self.lock_timeout)
+        try:
+            locked = lock.acquire()
+        except redis.RedisError:
+            locked = False
+        try:
+            yield
+        finally:
+            if locked:
+                try:
+                    lock.release()
+                except redis.RedisError:
+                    pass
@@ -4,4 +4,14 @@ from insights.meetup import views
 urlpatterns = [
     path('start/', views.start, name='meetup-start'),
     path('callback/', views.callback, name='meetup-callback'),
+    path(
+        'api/groups/<str:urlname>/growth/',
+        views.group_growth,
+        name='meetup-group-growth'),
+    path(
+        'api/groups/leaderboard/',
+        views.group_leaderboard,
+        name='meetup-group-leaderboard'),
+    path('api/cities/', views.members_by_city, name='meetup-cities'),
+    path('api/search/', views.search, name='meetup-search'),
 ]
@@ -1,15 +1,22 @@
+import datetime
+
 import requests
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         JsonResponse)
 from django.urls import reverse
+from django.utils import timezone
 
-from insights.meetup.models import APICredentials
+from insights.meetup.models import (APICredentials, MeetupGroup,
+                                    MeetupGroupDailyStats, MeetupUser)
+from insights.meetup.response_cache import cached_json, response_cache
 
 
 def start(request):
-    redirect_url = ('https://secure.meetup.com/oauth2/authorize?client_id={}&'
+    redirect_url = ('{}/oauth2/authorize?client_id={}&'
                     'response_type=code&'
-                    'redirect_uri={}').format(settings.MEETUP_OAUTH_CLIENT_ID,
+                    'redirect_uri={}').format(settings.MEETUP_OAUTH_URL,
+                                              settings.MEETUP_OAUTH_CLIENT_ID,
                                               get_oauth_redirect(request))
     return HttpResponseRedirect(redirect_url)
 
@@ -17,7 +24,7 @@ def start(request):
 def callback(request):
     code = request.GET['code']
     resp = requests.post(
-        'https://secure.meetup.com/oauth2/access',
+        f'{settings.MEETUP_OAUTH_URL}/oauth2/access',
         data={
             'client_id': settings.MEETUP_OAUTH_CLIENT_ID,
             'client_secret': settings.MEETUP_OAUTH_CLIENT_SECRET,
@@ -35,3 +42,122 @@ def callback(request):
 
 def get_oauth_redirect(request):
     return request.build_absolute_uri(reverse('meetup-callback'))
+
+
+@cached_json(response_cache, params={'days': int})
+def group_growth(request, urlname):
+    """
+    Daily numbers of members, active members, joins and leaves of the group
+    for the last ?days=90 days
+    """
+    group = MeetupGroup.objects.filter(urlname=urlname).first()
+    if group is None:
+        raise Http404(f'Group {urlname} not found')
+    since = get_since(request)
+    days = MeetupGroupDailyStats.objects.filter(
+        group=group, date__gte=since).order_by('date').values(
+            'date', 'members', 'active_members', 'reported_members', 'joins',
+            'leaves', 'role_changes')
+    return {
+        'urlname': group.urlname,
+        'name': group.name,
+        'days': list(days),
+    }
+
+
+@cached_json(response_cache, params={'country': str.lower})
+def members_by_city(request):
+    """
+    Number of groups, members and active members per city, optionally
+    limited to the ?country=
+    """
+    cities = MeetupGroupDailyStats.objects.members_by_city(
+        request.GET.get('country'))
+    return {
+        'cities': [{
+            'country': city['group__country'],
+            'city': city['group__city'],
+            'groups': city['groups'],
+            'members': city['members'],
+            'active_members': city['active_members'],
+        } for city in cities],
+    }
+
+
+@cached_json(
+    response_cache,
+    params={
+        'order': str,
+        'limit': int,
+        'days': int,
+        'country': str.lower,
+    })
+def group_leaderboard(request):
+    """
+    Top ?limit=20 groups by ?order=growth (joins minus leaves for the last
+    ?days=30 days), members or active_members, optionally limited to the
+    ?country=
+    """
+    order = request.GET.get('order', 'growth')
+    if order not in MeetupGroupDailyStats.LEADERBOARD_ORDERS:
+        raise Http404(f'Unknown order {order}')
+    limit = get_int_param(request, 'limit', 20, 100)
+    since = get_since(request, default=30)
+    groups = MeetupGroupDailyStats.objects.leaderboard(
+        order, since, limit, country=request.GET.get('country'))
+    return {
+        'order': order,
+        'since': since,
+        'groups': groups,
+    }
+
+
+def search(request):
+    """
+    Top ?limit=20 groups (full-text search of names and descriptions)
+    matching ?q=, and for staff users, users (substrings of names) as well.
+
+    Names and locations of users are personal data, so they're not public.
+    Responses aren't cached, as every query would be a cache entry of its
+    own
+    """
+    text = request.GET.get('q', '')
+    limit = get_int_param(request, 'limit', 20, 100)
+    groups = MeetupGroup.objects.search(text)[:limit]
+    data = {
+        'q': text,
+        'groups': [{
+            'urlname': group.urlname,
+            'name': group.name,
+            'city': group.city,
+            'country': group.country,
+            'members': group.members,
+        } for group in groups],
+    }
+    if request.user.is_staff:
+        users = MeetupUser.objects.search(text)[:limit]
+        data['users'] = [{
+            'id': user.id,
+            'name': user.name,
+            'city': user.city,
+            'country': user.country,
+        } for user in users]
+    return JsonResponse(data)
+
+
+def get_since(request, default=90) -> datetime.date:
+    days = get_int_param(request, 'days', default, 3650)
+    # rollup dates are UTC
+    return timezone.now().date() - datetime.timedelta(days)
+
+
+def get_int_param(request, name, default, max_value) -> int:
+    """
+    Return the positive integer parameter of the request, up to max_value,
+    or the default value, if it's not set or invalid
+    """
+    try:
+        value = int(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+    return min(max(value, 1), max_value)
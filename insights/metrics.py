@@ -0,0 +1,226 @@
+"""
+Metrics of sync tasks: API requests, database writes, analytics loads and
+per-task totals.
+
+Code reports metrics to the backend, returned by get_metrics(), which is
+set with the METRICS_BACKEND setting:
+
+- NullMetrics (the default) ignores everything, and costs one method call
+- StatsdMetrics sends metrics over UDP to statsd (with DogStatsD tags)
+- RedisMetrics aggregates metrics of all processes in Redis, to be scraped
+  by Prometheus from the /metrics endpoint of the web app
+
+Metric names are dotted (e.g., "api.request"), tags are keyword arguments.
+"""
+import re
+import socket
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+Tags = Dict[str, str]
+
+
+class NullTimer(object):
+    """
+    Timer which measures nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Timer(object):
+    """
+    Context manager which reports the time spent in the with-block
+    """
+
+    def __init__(self, metrics: 'Metrics', name: str, tags: Tags):
+        self.metrics = metrics
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.timing(self.name,
+                            time.perf_counter() - self.start, **self.tags)
+
+
+class Metrics(object):
+    """
+    Base class of metrics backends
+    """
+    enabled = False
+
+    def incr(self, name: str, value: float = 1, **tags):
+        """
+        Increment the counter
+        """
+
+    def gauge(self, name: str, value: float, **tags):
+        """
+        Set the current value of the gauge
+        """
+
+    def timing(self, name: str, seconds: float, **tags):
+        """
+        Report the duration of one operation
+        """
+
+    def timer(self, name: str, **tags):
+        """
+        Return the context manager, which reports the duration of the
+        with-block
+        """
+        return Timer(self, name, tags)
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics backend of disabled metrics
+    """
+    null_timer = NullTimer()
+
+    def timer(self, name: str, **tags):
+        return self.null_timer
+
+
+class StatsdMetrics(Metrics):
+    """
+    Metrics backend which sends metrics to statsd over UDP
+    (settings.STATSD_HOST and STATSD_PORT), with tags in DogStatsD format.
+    Metrics are lost if statsd is not available.
+    """
+    enabled = True
+
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 prefix: Optional[str] = None):
+        self.address = (host or settings.STATSD_HOST, port or
+                        settings.STATSD_PORT)
+        self.prefix = settings.STATSD_PREFIX if prefix is None else prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def incr(self, name: str, value: float = 1, **tags):
+        self.send(name, value, 'c', tags)
+
+    def gauge(self, name: str, value: float, **tags):
+        self.send(name, value, 'g', tags)
+
+    def timing(self, name: str, seconds: float, **tags):
+        self.send(name, round(seconds * 1000, 3), 'ms', tags)
+
+    def send(self, name: str, value: float, metric_type: str, tags: Tags):
+        packet = f'{self.prefix}{name}:{value}|{metric_type}'
+        if tags:
+            packet += '|#' + ','.join(f'{k}:{v}' for k, v in tags.items())
+        try:
+            self.socket.sendto(packet.encode('utf-8'), self.address)
+        except OSError:
+            pass
+
+
+class RedisMetrics(Metrics):
+    """
+    Metrics backend which aggregates metrics of all processes in Redis (the
+    Celery broker), and renders them in Prometheus text format.
+
+    Counters become "<name>_total", timings become summaries with
+    "<name>_seconds_count" and "<name>_seconds_sum" series. Metrics are
+    lost if Redis is not available.
+    """
+    enabled = True
+    key = 'insights:metrics'
+    types_key = 'insights:metrics:types'
+
+    def __init__(self, redis_url: Optional[str] = None, prefix='insights_'):
+        self.redis = redis.Redis.from_url(redis_url or
+                                          settings.CELERY_BROKER_URL)
+        self.prefix = prefix
+
+    def incr(self, name: str, value: float = 1, **tags):
+        name = self.get_name(name) + '_total'
+        self.execute(name, 'counter', [(name, tags, value)], incr=True)
+
+    def gauge(self, name: str, value: float, **tags):
+        name = self.get_name(name)
+        self.execute(name, 'gauge', [(name, tags, value)])
+
+    def timing(self, name: str, seconds: float, **tags):
+        name = self.get_name(name) + '_seconds'
+        samples = [(name + '_count', tags, 1), (name + '_sum', tags, seconds)]
+        self.execute(name, 'summary', samples, incr=True)
+
+    def execute(self, family: str, metric_type: str, samples, incr=False):
+        """
+        Store samples of the metric family of the given type
+        """
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(self.types_key, family, metric_type)
+            for name, tags, value in samples:
+                series = name + format_labels(tags)
+                if incr:
+                    pipe.hincrbyfloat(self.key, series, value)
+                else:
+                    pipe.hset(self.key, series, value)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def get_name(self, name: str) -> str:
+        return self.prefix + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+    def render(self) -> str:
+        """
+        Return all metrics in Prometheus text format
+        """
+        values = self.redis.hgetall(self.key)
+        types = {
+            family.decode('utf-8'): metric_type.decode('utf-8')
+            for family, metric_type in self.redis.hgetall(
+                self.types_key).items()
+        }
+        families = {}
+        for series, value in values.items():
+            series = series.decode('utf-8')
+            family = series.split('{', 1)[0]
+            base = re.sub(r'_(count|sum)$', '', family)
+            if types.get(base) == 'summary':
+                family = base
+            families.setdefault(family, []).append(
+                f'{series} {float(value)!r}')
+        lines = []
+        for family in sorted(families):
+            lines.append(f'# TYPE {family} {types.get(family, "untyped")}')
+            lines.extend(sorted(families[family]))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(tags: Tags) -> str:
+    if not tags:
+        return ''
+    labels = ','.join(
+        '{}="{}"'.format(key,
+                         str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(tags.items()))
+    return '{' + labels + '}'
+
+
+@lru_cache()
+def get_metrics() -> Metrics:
+    """
+    Return the metrics backend, configured with settings.METRICS_BACKEND
+    """
+    return import_string(settings.METRICS_BACKEND)()
@@ -120,6 +120,75 @@ CELERY_BEAT_SCHEDULE = {
 MEETUP_OAUTH_CLIENT_ID = env('MEETUP_OAUTH_CLIENT_ID')
 MEETUP_OAUTH_CLIENT_SECRET = env('MEETUP_OAUTH_CLIENT_SECRET')
 
+# Base URLs of the API and OAuth server (can be pointed to a local stand-in,
+# see benchmarks.fake_api)
+MEETUP_API_URL = env('MEETUP_API_URL', default='https://api.meetup.com')
+MEETUP_OAUTH_URL = env('MEETUP_OAUTH_URL', default='https://secure.meetup.com')
+
+# Timeout of the request to refresh the access token, in seconds. The lock
+# of the refresh is held for three times as long
+MEETUP_OAUTH_TIMEOUT = env.float('MEETUP_OAUTH_TIMEOUT', default=20)
+
+# Number of locations which groups are searched for in parallel
+MEETUP_FIND_GROUPS_CONCURRENCY = env.int(
+    'MEETUP_FIND_GROUPS_CONCURRENCY', default=4)
+
+# Members of every group are synced by a separate Celery task. Tasks are
+# retried on transient API errors up to MEETUP_SYNC_GROUP_MAX_RETRIES times
+# with exponential backoff, starting from MEETUP_SYNC_GROUP_RETRY_DELAY
+# seconds, and have their own soft and hard time limits (in seconds)
+MEETUP_SYNC_GROUP_MAX_RETRIES = env.int(
+    'MEETUP_SYNC_GROUP_MAX_RETRIES', default=3)
+MEETUP_SYNC_GROUP_RETRY_DELAY = env.int(
+    'MEETUP_SYNC_GROUP_RETRY_DELAY', default=60)
+MEETUP_SYNC_GROUP_SOFT_TIME_LIMIT = env.int(
+    'MEETUP_SYNC_GROUP_SOFT_TIME_LIMIT', default=30 * 60)
+MEETUP_SYNC_GROUP_TIME_LIMIT = env.int(
+    'MEETUP_SYNC_GROUP_TIME_LIMIT', default=35 * 60)
+
+# API budget of one two-hour window of sync_group_members. Next updates of
+# groups are scheduled to spread the expected load evenly between windows
+MEETUP_API_REQUESTS_PER_WINDOW = env.int(
+    'MEETUP_API_REQUESTS_PER_WINDOW', default=3600)
+
+# Dispatched groups are not dispatched again during this time (in seconds)
+MEETUP_SYNC_GROUP_LEASE = env.int('MEETUP_SYNC_GROUP_LEASE', default=3 * 3600)
+
+# Members of the group are re-synced every MEETUP_MIN_UPDATE_INTERVAL_DAYS
+# days while they change. Every sync without changes doubles the interval,
+# up to MEETUP_MAX_UPDATE_INTERVAL_DAYS days
+MEETUP_MIN_UPDATE_INTERVAL_DAYS = env.int(
+    'MEETUP_MIN_UPDATE_INTERVAL_DAYS', default=1)
+MEETUP_MAX_UPDATE_INTERVAL_DAYS = env.int(
+    'MEETUP_MAX_UPDATE_INTERVAL_DAYS', default=14)
+
+# Token bucket parameters of the API rate limiter, shared by all workers:
+# the sustained number of requests per second and the number of requests
+# which can be made at once
+MEETUP_API_REQUESTS_PER_SECOND = env.float(
+    'MEETUP_API_REQUESTS_PER_SECOND', default=1.0)
+MEETUP_API_BURST = env.int('MEETUP_API_BURST', default=5)
+
+# When the number of remaining requests reported by X-RateLimit-Remaining
+# goes below this mark, requests are spread evenly until the quota reset
+MEETUP_API_THROTTLE_LOW_WATER = env.int(
+    'MEETUP_API_THROTTLE_LOW_WATER', default=5)
+
+# How many times to wait and retry the same page on "429 Too Many Requests"
+MEETUP_API_MAX_THROTTLE_RETRIES = env.int(
+    'MEETUP_API_MAX_THROTTLE_RETRIES', default=5)
+
+# Retries of connection errors and 5xx responses, with randomized
+# exponential backoff (up to backoff * 2 ** retry seconds between attempts)
+MEETUP_API_MAX_RETRIES = env.int('MEETUP_API_MAX_RETRIES', default=3)
+MEETUP_API_RETRY_BACKOFF = env.float('MEETUP_API_RETRY_BACKOFF', default=0.5)
+
+# Max number of keep-alive connections to the API per worker process
+MEETUP_API_POOL_SIZE = env.int('MEETUP_API_POOL_SIZE', default=10)
+
+# Timeout of one API request, in seconds
+MEETUP_API_TIMEOUT = env.float('MEETUP_API_TIMEOUT', default=60)
+
 # -----------------------------------------------------------------------------
 
 # -----------------------------------------------------------------------------
@@ -129,7 +198,52 @@ ADMIN_USERNAME = env('ADMIN_USERNAME')
 ADMIN_EMAIL = env('ADMIN_EMAIL')
 ADMIN_PASSWORD = env('ADMIN_PASSWORD')
 
+# -----------------------------------------------------------------------------
+# Analytics settings
+# -----------------------------------------------------------------------------
+# Daily snapshots of groups and members are loaded to this sink. Use
+# insights.analytics.LocalParquetSink to write them to local Parquet files
+# in ANALYTICS_LOCAL_PATH instead of BigQuery
+ANALYTICS_SINK = env('ANALYTICS_SINK', default='insights.analytics.BigQuerySink')
+ANALYTICS_LOCAL_PATH = env(
+    'ANALYTICS_LOCAL_PATH', default=str(BASE_DIR / 'analytics'))
+
+# Members of groups, synced by one run of sync_group_members, are loaded to
+# the sink in batches of about this size (in bytes, compressed)
+ANALYTICS_LOAD_BATCH_SIZE = env.int(
+    'ANALYTICS_LOAD_BATCH_SIZE', default=32 * 1024 * 1024)
+
+# -----------------------------------------------------------------------------
+# Insights API settings
+# -----------------------------------------------------------------------------
+# Responses are cached in Redis until the next sync finishes, this TTL only
+# limits the lifetime of responses which are not requested anymore. The
+# cache has its own Redis, limited with maxmemory and the volatile-lru
+# policy, so that the cache can't take the memory of the Celery broker
+INSIGHTS_API_CACHE_URL = env(
+    'INSIGHTS_API_CACHE_URL', default='redis://cache:6379')
+INSIGHTS_API_CACHE_TTL = env.int('INSIGHTS_API_CACHE_TTL', default=86400)
+
+# -----------------------------------------------------------------------------
+# Metrics settings
+# -----------------------------------------------------------------------------
+# Metrics of sync tasks are disabled by default. Use
+# insights.metrics.StatsdMetrics to send them to statsd (STATSD_HOST and
+# STATSD_PORT), or insights.metrics.RedisMetrics to collect them in Redis
+# and expose them to Prometheus at /metrics of the web app, to requests with
+# the METRICS_TOKEN bearer token
+METRICS_BACKEND = env('METRICS_BACKEND', default='insights.metrics.NullMetrics')
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+STATSD_HOST = env('STATSD_HOST', default='localhost')
+STATSD_PORT = env.int('STATSD_PORT', default=8125)
+STATSD_PREFIX = env('STATSD_PREFIX', default='insights.')
+
 # -----------------------------------------------------------------------------
 # Google Cloud settings
 # -----------------------------------------------------------------------------
 BIGQUERY_DATASET_ID = env('BIGQUERY_DATASET_ID')
+
+# Compressed records to upload to BigQuery are kept in memory up to this
+# size (in bytes), then they are spooled to a temporary file
+BIGQUERY_UPLOAD_MEMORY_LIMIT = env.int(
+    'BIGQUERY_UPLOAD_MEMORY_LIMIT', default=16 * 1024 * 1024)
@@ -1,68 +1,87 @@
 import datetime
+import gzip
 import hashlib
 import hmac
-import io
 import json
 import re
-from typing import Any, Iterator, MappingView, Optional, Union
+import tempfile
+from functools import lru_cache
+from typing import (Any, BinaryIO, Iterator, MappingView, Optional, Tuple,
+                    Union)
 
 import attr
 from django.conf import settings
 from django.utils.encoding import force_bytes
-from google.cloud import bigquery
 
 ObjectList = Union[Iterator[Any], MappingView[Any]]
 
-client = bigquery.Client()
 
-
-def bigquery_upload(object_list: ObjectList,
-                    table_id: str,
-                    job_id: Optional[str] = None,
-                    async: bool = True):
+def json_records(object_list: ObjectList,
+                 max_size: Optional[int] = None) -> BinaryIO:
+    """
+    Turn a list or iterator of objects into a file object with gzip-compressed
+    newline-separated JSON-encoded records.
     """
-    Load the list of objects to bigquery table.
+    writer = JSONRecordsWriter(max_size=max_size)
+    writer.write(object_list)
+    return writer.close()
 
-    job_id can be set explicitly to exclude processing duplicates
 
-    If async is set to True, the function doesn't wait for the operation to
-    complete successfully, and return as soon as data are sent to the server.
-    """
-    # Create job config
-    job_config = bigquery.LoadJobConfig()
-    job_config.source_format = bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
-    job_config.autodetect = True
-    job_config.create_disposition = bigquery.CreateDisposition.CREATE_IF_NEEDED
-    job_config.schema_update_options = [
-        bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION,
-        bigquery.SchemaUpdateOption.ALLOW_FIELD_RELAXATION
-    ]
-    job_config.write_disposition = bigquery.WriteDisposition.WRITE_APPEND
-
-    # Create the file object to load
-    records_fd = json_records(object_list)
-
-    # Run the query
-    dataset_ref = client.dataset(settings.BIGQUERY_DATASET_ID)
-    table_ref = dataset_ref.table(table_id)
-    job = client.load_table_from_file(
-        records_fd, table_ref, job_id=job_id, job_config=job_config)
-
-    if not async:
-        job.result()
-
-
-def json_records(object_list: ObjectList) -> io.BytesIO:
+class JSONRecordsWriter(object):
     """
-    Turn a list or iterator of objects into a file object with
-    newline-separated JSON-encoded records
+    Writer of gzip-compressed newline-separated JSON-encoded records, which
+    can be fed with objects in several steps (e.g., page by page).
+
+    Records are encoded and compressed as they come, and the file is kept in
+    memory until its size exceeds max_size bytes
+    (settings.BIGQUERY_UPLOAD_MEMORY_LIMIT by default), then it's rolled
+    over to a temporary file on disk.
     """
-    fileobj = io.BytesIO()
-    for obj in object_list:
-        line = json_dumps(obj) + '\n'
-        fileobj.write(line.encode('utf-8'))
-    fileobj.seek(0)
-    return fileobj
+
+    def __init__(self, max_size: Optional[int] = None,
+                 batch_size: int = 1000):
+        if max_size is None:
+            max_size = settings.BIGQUERY_UPLOAD_MEMORY_LIMIT
+        self.batch_size = batch_size
+        self.count = 0
+        self.fileobj = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self.gzip_fd = gzip.GzipFile(fileobj=self.fileobj, mode='wb', mtime=0)
+
+    def write(self, object_list: ObjectList):
+        lines = []
+        for obj in object_list:
+            lines.append(json_dumps(obj))
+            if len(lines) >= self.batch_size:
+                self.write_lines(lines)
+                lines = []
+        if lines:
+            self.write_lines(lines)
+
+    def write_lines(self, lines):
+        self.gzip_fd.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self.count += len(lines)
+
+    def write_records(self, records_fd: BinaryIO, block_size: int = 1 << 20):
+        """
+        Copy records from the file object, prepared with json_records() or
+        another JSONRecordsWriter, without decoding them
+        """
+        with gzip.GzipFile(fileobj=records_fd, mode='rb') as fd:
+            while True:
+                block = fd.read(block_size)
+                if not block:
+                    break
+                self.gzip_fd.write(block)
+                self.count += block.count(b'\n')
+
+    def close(self) -> BinaryIO:
+        """
+        Finish writing and return the file object, ready to be read
+        """
+        # closing GzipFile writes the trailer, but doesn't close fileobj
+        self.gzip_fd.close()
+        self.fileobj.seek(0)
+        return self.fileobj
 
 
 def json_dumps(obj):
@@ -75,7 +94,7 @@ def json_dumps(obj):
 
 def json_default(obj):
     if attr.has(obj.__class__):
-        return attr.asdict(obj)
+        return {name: getattr(obj, name) for name in attr_names(obj.__class__)}
     if isinstance(obj, datetime.datetime):
         return obj.strftime('%FT%TZ')
     if isinstance(obj, datetime.date):
@@ -83,6 +102,14 @@ def json_default(obj):
     return repr(obj)
 
 
+@lru_cache()
+def attr_names(cls) -> Tuple[str, ...]:
+    """
+    Return names of attributes of the attrs class, computed once per class
+    """
+    return tuple(field.name for field in attr.fields(cls))
+
+
 def get_job_id(raw_job_id):
     val = hmac.new(
         force_bytes(settings.SECRET_KEY),